@@ -4,6 +4,9 @@ from flask import Flask, request # request for get_locale_selector
 from flask_wtf.csrf import CSRFProtect
 from flask_babel import Babel, get_locale as flask_babel_get_locale
 from babel.numbers import format_currency
+from project.constants import DEFAULT_TOLERANCE, PV_MAX_GUESS_LIMIT, W_MIN_GUESS_FOR_MAX_EXPENSE, DEFAULT_RELATIVE_TOLERANCE
+from project.constants import SOLVER_MAX_EVALUATIONS, SOLVER_TIME_BUDGET_SECONDS
+from project.result_cache import configure_shared_cache
 
 # Create the Flask app instance
 app = Flask(__name__)
@@ -40,9 +43,19 @@ app.config['DEFAULT_CURRENCY'] = DEFAULT_CURRENCY
 app.logger.info(f"Default currency: {app.config.get('DEFAULT_CURRENCY')}")
 
 # Default configuration values for financial calculations
-app.config['DEFAULT_TOLERANCE'] = 0.01
-app.config['PV_MAX_GUESS_LIMIT'] = 1_000_000_000
-app.config['W_MIN_GUESS_FOR_MAX_EXPENSE'] = 1.0
+app.config['DEFAULT_TOLERANCE'] = DEFAULT_TOLERANCE
+app.config['PV_MAX_GUESS_LIMIT'] = PV_MAX_GUESS_LIMIT
+app.config['W_MIN_GUESS_FOR_MAX_EXPENSE'] = W_MIN_GUESS_FOR_MAX_EXPENSE
+app.config['RELATIVE_TOLERANCE'] = DEFAULT_RELATIVE_TOLERANCE
+# Per-solve budget; a solve that exceeds it returns its best result so far, marked 'partial'
+app.config['SOLVER_MAX_EVALUATIONS'] = SOLVER_MAX_EVALUATIONS
+app.config['SOLVER_TIME_BUDGET_SECONDS'] = SOLVER_TIME_BUDGET_SECONDS
+
+# Result cache shared by all workers, e.g. sqlite:////dev/shm/fire_results.sqlite3 or redis://cache-host:6379/0
+# (see project/shared_cache.py). Unset: each worker only uses its own in-process cache.
+app.config['RESULT_CACHE_URL'] = os.environ.get('RESULT_CACHE_URL', '')
+shared_result_cache = configure_shared_cache(app.config['RESULT_CACHE_URL'])
+app.logger.info(f"Shared result cache: {shared_result_cache or 'disabled'}") # Backend repr omits any password
 
 # --- Configuration ---
 default_secret_key = 'your_default_secret_key_for_development_only'
@@ -3,5 +3,38 @@ MODE_WITHDRAWAL = 'W'
 MODE_PORTFOLIO = 'P'
 TIME_START = "start"
 TIME_END = "end"
+# Parts of a scenario's results that /update can compute separately
+ARTIFACT_NUMBERS = 'numbers'
+ARTIFACT_CHARTS = 'charts'
+ARTIFACT_TABLE = 'table'
+UPDATE_ARTIFACTS = (ARTIFACT_NUMBERS, ARTIFACT_CHARTS, ARTIFACT_TABLE)
+TABLE_PAGE_SIZE = 20 # Rows per page of the yearly results table
+TABLE_MAX_PAGE_SIZE = 1000
 MAX_SCENARIOS_COMPARE = 4
-# Note: DEFAULT_TOLERANCE, PV_MAX_GUESS_LIMIT, W_MIN_GUESS_FOR_MAX_EXPENSE are in app.config
+MONTE_CARLO_DEFAULT_PATHS = 10_000
+MONTE_CARLO_MAX_PATHS = 100_000
+MONTE_CARLO_CHUNK_PATHS = 25_000 # Paths per independently seeded chunk; fixed so results do not depend on worker count
+MONTE_CARLO_PERCENTILES = (5, 25, 50, 75, 95)
+SENSITIVITY_MAX_AXIS_POINTS = 60
+RESULT_CACHE_MAX_ENTRIES = 2048 # Memoised solver/simulation results per process
+RESULT_CACHE_TTL_SECONDS = 600
+SHARED_CACHE_TIMEOUT_SECONDS = 0.5 # Shared result cache lookups give up (and count as misses) after this
+SHARED_CACHE_PURGE_INTERVAL = 256 # SQLite backend deletes expired rows every this many writes
+SHARED_CACHE_KEY_PREFIX = b'fire:result:'
+RATE_SCHEDULE_CACHE_SIZE = 256 # Compiled rate schedules reused for identical period lists
+SIMULATION_CHECKPOINT_ENTRIES = 32 # Recent per-year simulation states an edited scenario can resume from
+PLOT_TEMPLATE_CACHE_SIZE = 256 # Validated trace and layout templates (per style and locale) reused by plot_specs
+CURRENCY_FORMATTER_CACHE_SIZE = 64 # Compiled (currency, locale) formatters kept by currency_format
+SENSITIVITY_MAX_GRID_CELLS = 150_000 # r x i x T cells per /sensitivity request
+WARM_START_MAX_EVALUATIONS = 12 # Simulations a warm-started solve may use before falling back to a cold search
+WARM_START_MIN_STEP = 0.01 # First warm-start step, relative to the previous solution, when its slope is unknown
+# Solver defaults; app.config holds the values the web app uses (see engine_adapter.solver_config)
+DEFAULT_TOLERANCE = 0.01
+PV_MAX_GUESS_LIMIT = 1_000_000_000
+DEFAULT_RELATIVE_TOLERANCE = 1e-10 # Added to DEFAULT_TOLERANCE in proportion to the value being solved for
+ROOT_MAX_EVALUATIONS = 100 # Function evaluations per brent_root search
+SOLVER_MAX_EVALUATIONS = 200 # Simulations per solve before it returns a partial result
+SOLVER_TIME_BUDGET_SECONDS = 2.0 # Wall-clock seconds per solve before it returns a partial result
+SOLVER_CONVERGED = 'converged'
+SOLVER_PARTIAL = 'partial'
+W_MIN_GUESS_FOR_MAX_EXPENSE = 1.0
@@ -0,0 +1,81 @@
+"""
+Cached bulk currency formatting.
+
+babel.numbers.format_currency parses the locale and looks up the pattern, currency precision,
+symbols and separators on every call, which dominates when formatting every point of a chart or
+row of a table. currency_formatter() resolves all of that once per (currency, locale) and then
+formats each value exactly as format_currency(value, currency, locale=locale) would: the value
+is still rounded through decimal.Decimal(str(value)), so the output is identical.
+"""
+import decimal
+from functools import lru_cache
+
+from babel import Locale
+from babel.numbers import format_currency, get_currency_precision, get_currency_symbol, get_decimal_symbol, get_group_symbol
+
+from .constants import CURRENCY_FORMATTER_CACHE_SIZE
+
+
+class CurrencyFormatter:
+    """
+    format_currency(value, currency, locale=locale) with the locale data resolved up front.
+
+    Patterns the fast path does not reproduce (scientific, significant-digit, scaled or quoted
+    patterns and currency names) and non-finite values are handed to babel unchanged.
+    """
+
+    def __init__(self, currency, locale):
+        self.currency = currency
+        self.locale = locale
+        parsed_locale = Locale.parse(locale)
+        pattern = parsed_locale.currency_formats['standard']
+        self._group = get_group_symbol(parsed_locale)
+        self._decimal = get_decimal_symbol(parsed_locale)
+        affixes = pattern.prefix + pattern.suffix
+        self._fast = not (pattern.exp_prec or pattern.scale or '@' in pattern.pattern or pattern.number_pattern == ''
+                          or any('¤¤¤' in affix or "'" in affix for affix in affixes) or "'" in self._group + self._decimal)
+        symbols = lambda affix: affix.replace('¤¤', currency.upper()).replace('¤', get_currency_symbol(currency, parsed_locale))
+        self._prefix = tuple(symbols(affix) for affix in pattern.prefix)
+        self._suffix = tuple(symbols(affix) for affix in pattern.suffix)
+        self._min_int = pattern.int_prec[0]
+        self._grouping = pattern.grouping
+        self._frac_digits = get_currency_precision(currency)
+        self._quantum = decimal.Decimal(1).scaleb(-self._frac_digits)
+
+    def _format_int(self, digits):
+        if len(digits) < self._min_int:
+            digits = '0' * (self._min_int - len(digits)) + digits
+        size, groups = self._grouping[0], ''
+        while len(digits) > size:
+            groups = self._group + digits[-size:] + groups
+            digits = digits[:-size]
+            size = self._grouping[1]
+        return digits + groups
+
+    def __call__(self, value):
+        if not self._fast:
+            return format_currency(value, self.currency, locale=self.locale)
+        number = value if isinstance(value, decimal.Decimal) else decimal.Decimal(str(value))
+        if not number.is_finite():
+            return format_currency(value, self.currency, locale=self.locale)
+        negative = int(number.is_signed())
+        integer, _, fraction = f"{abs(number).normalize().quantize(self._quantum):f}".partition('.')
+        text = self._format_int(integer)
+        if self._frac_digits:
+            text += self._decimal + (fraction or '0').ljust(self._frac_digits, '0')
+        return self._prefix[negative] + text + self._suffix[negative]
+
+    def format_many(self, values):
+        """List of formatted strings for an iterable (e.g. a NumPy array) of values."""
+        return [self(value) for value in values]
+
+
+@lru_cache(maxsize=CURRENCY_FORMATTER_CACHE_SIZE)
+def currency_formatter(currency, locale):
+    """Shared CurrencyFormatter for currency (e.g. 'USD') in locale (e.g. 'es')."""
+    return CurrencyFormatter(currency, str(locale))
+
+
+def format_currencies(values, currency, locale):
+    """[format_currency(value, currency, locale=locale) for value in values], with the formatter cached per (currency, locale)."""
+    return currency_formatter(currency, str(locale)).format_many(values)
@@ -0,0 +1,54 @@
+"""
+Flask-side glue for the calculation engine: builds the solver configuration from app.config
+and translates the engine's structured errors and solver notices for the current locale.
+"""
+from flask import current_app
+from flask_babel import gettext
+
+from . import engine_errors
+from .constants import DEFAULT_RELATIVE_TOLERANCE, SOLVER_MAX_EVALUATIONS, SOLVER_TIME_BUDGET_SECONDS, SOLVER_PARTIAL
+from .financial_calcs import SolverConfig
+
+# Messages are gettext literals so that pybabel extracts them; the msgids match the engine's English messages
+ENGINE_ERROR_MESSAGES = {
+    engine_errors.EMPTY_RATES_PERIODS: lambda params: gettext("rates_periods list cannot be empty."),
+    engine_errors.NON_POSITIVE_DURATION: lambda params: gettext("Total duration from rates_periods must be greater than zero."),
+    engine_errors.RATE_PERIODS_MISMATCH: lambda params: gettext("Ran out of rate periods unexpectedly."),
+    engine_errors.INVALID_RATE_SCHEDULE: lambda params: gettext("Rate schedule arrays must be one-dimensional and of equal length."),
+    engine_errors.INVALID_RATE_MATRICES: lambda params: gettext("Rate matrices must be two-dimensional and of equal shape."),
+    engine_errors.INVALID_CASH_FLOWS: lambda params: gettext("One-off cash flows must have one entry per simulated year."),
+    engine_errors.INVALID_PATH_COUNT: lambda params: gettext("Number of simulation paths must be greater than zero."),
+    engine_errors.HORIZON_EXCEEDS_HISTORY: lambda params: gettext("Duration of %(T)d years exceeds the %(n)d years of historical data.", **params),
+    engine_errors.INVALID_MODE: lambda params: gettext("Invalid mode selected."),
+    engine_errors.ROOT_NOT_BRACKETED: lambda params: gettext("The search interval does not bracket a solution."),
+}
+
+
+def solver_config():
+    """
+    SolverConfig built from the current app's DEFAULT_TOLERANCE, PV_MAX_GUESS_LIMIT, W_MIN_GUESS_FOR_MAX_EXPENSE,
+    RELATIVE_TOLERANCE, SOLVER_MAX_EVALUATIONS and SOLVER_TIME_BUDGET_SECONDS.
+    """
+    return SolverConfig(
+        tolerance=current_app.config['DEFAULT_TOLERANCE'],
+        pv_max_guess_limit=current_app.config['PV_MAX_GUESS_LIMIT'],
+        w_min_guess_for_max_expense=current_app.config.get('W_MIN_GUESS_FOR_MAX_EXPENSE', 1.0),
+        relative_tolerance=current_app.config.get('RELATIVE_TOLERANCE', DEFAULT_RELATIVE_TOLERANCE),
+        max_evaluations=current_app.config.get('SOLVER_MAX_EVALUATIONS', SOLVER_MAX_EVALUATIONS),
+        time_budget=current_app.config.get('SOLVER_TIME_BUDGET_SECONDS', SOLVER_TIME_BUDGET_SECONDS),
+    )
+
+
+def error_message(error):
+    """Translated message for an EngineError; any other exception's own message is returned unchanged."""
+    if isinstance(error, engine_errors.EngineError) and error.code in ENGINE_ERROR_MESSAGES:
+        return ENGINE_ERROR_MESSAGES[error.code](error.params)
+    return str(error)
+
+
+def solver_notice(states):
+    """Translated notice if any of the {mode: SolverResult} solves stopped early, else None."""
+    if any(result is not None and result.status == SOLVER_PARTIAL for result in states.values()):
+        return gettext("The calculation took too long and was stopped early; the figures shown are the closest found so far.")
+    return None
+
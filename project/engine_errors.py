@@ -0,0 +1,35 @@
+"""
+Structured errors raised by the calculation engine.
+
+The engine does not depend on Flask, so it cannot translate messages itself. Each error
+carries a stable code plus the values used in its message; the web layer
+(project/engine_adapter.py) turns the code into a translated message.
+"""
+
+EMPTY_RATES_PERIODS = 'empty_rates_periods'
+NON_POSITIVE_DURATION = 'non_positive_duration'
+RATE_PERIODS_MISMATCH = 'rate_periods_mismatch'
+INVALID_RATE_SCHEDULE = 'invalid_rate_schedule'
+INVALID_RATE_MATRICES = 'invalid_rate_matrices'
+INVALID_CASH_FLOWS = 'invalid_cash_flows'
+INVALID_PATH_COUNT = 'invalid_path_count'
+HORIZON_EXCEEDS_HISTORY = 'horizon_exceeds_history'
+INVALID_MODE = 'invalid_mode'
+ROOT_NOT_BRACKETED = 'root_not_bracketed'
+
+
+class EngineError(ValueError):
+    """
+    Invalid input to the calculation engine.
+
+    Subclasses ValueError, so callers that already handle invalid input keep working.
+
+    Attributes:
+        code (str): One of the codes defined in this module.
+        params (dict): Values interpolated into the message, e.g. {'T': 120, 'n': 96}.
+    """
+
+    def __init__(self, code, message, **params):
+        super().__init__(message % params if params else message)
+        self.code = code
+        self.params = params
@@ -1,105 +1,762 @@
 import numpy as np
-from flask import current_app
-from flask_babel import gettext
-from .constants import TIME_START, TIME_END # TIME_END will be used by annual_simulation
+import time
+from concurrent.futures import ProcessPoolExecutor
+from collections import namedtuple
+from functools import lru_cache
+from .constants import MODE_WITHDRAWAL, MODE_PORTFOLIO, TIME_START, TIME_END, MONTE_CARLO_PERCENTILES, MONTE_CARLO_CHUNK_PATHS # TIME_END will be used by annual_simulation
+from .constants import DEFAULT_TOLERANCE, PV_MAX_GUESS_LIMIT, W_MIN_GUESS_FOR_MAX_EXPENSE, RATE_SCHEDULE_CACHE_SIZE
+from .constants import WARM_START_MAX_EVALUATIONS, WARM_START_MIN_STEP, DEFAULT_RELATIVE_TOLERANCE, ROOT_MAX_EVALUATIONS
+from .constants import SOLVER_MAX_EVALUATIONS, SOLVER_TIME_BUDGET_SECONDS, SOLVER_CONVERGED, SOLVER_PARTIAL
+from .engine_errors import (EngineError, EMPTY_RATES_PERIODS, NON_POSITIVE_DURATION, RATE_PERIODS_MISMATCH, INVALID_RATE_SCHEDULE,
+                            INVALID_RATE_MATRICES, INVALID_CASH_FLOWS, INVALID_PATH_COUNT, HORIZON_EXCEEDS_HISTORY, INVALID_MODE,
+                            ROOT_NOT_BRACKETED)
+from .path_statistics import PathStatistics, ruin_years
+from .historical_data import load_historical_dataset
+
+SolverConfig = namedtuple('SolverConfig', ['tolerance', 'pv_max_guess_limit', 'w_min_guess_for_max_expense', 'relative_tolerance',
+                                           'max_evaluations', 'time_budget'],
+                          defaults=(DEFAULT_RELATIVE_TOLERANCE, SOLVER_MAX_EVALUATIONS, SOLVER_TIME_BUDGET_SECONDS))
+SolverConfig.__doc__ = """
+Numeric settings for the solvers: absolute tolerance on balances, the largest initial portfolio
+searched before reporting infinity, the smallest starting upper bound for the max-expense search,
+the relative tolerance on iteratively solved values, and the per-solve budget of simulations and
+wall-clock seconds (float('inf') for no deadline) after which a solve returns a partial result.
+The web layer builds one from app.config (see engine_adapter.solver_config); other callers can use
+DEFAULT_SOLVER_CONFIG or their own.
+"""
+DEFAULT_SOLVER_CONFIG = SolverConfig(DEFAULT_TOLERANCE, PV_MAX_GUESS_LIMIT, W_MIN_GUESS_FOR_MAX_EXPENSE)
+
+RootResult = namedtuple('RootResult', ['root', 'f_root', 'lower', 'upper', 'f_lower', 'f_upper', 'evaluations', 'converged'])
+RootResult.__doc__ = """
+Outcome of brent_root: the best root estimate and f there, a bracket [lower, upper] whose ends
+have f values of opposite sign (or zero), the number of calls to f and whether the tolerance
+was met within the evaluation budget.
+"""
+
+SolverResult = namedtuple('SolverResult', ['value', 'lower', 'upper', 'slope', 'evaluations', 'status'],
+                          defaults=(SOLVER_CONVERGED,))
+SolverResult.__doc__ = """
+Outcome of solve_required_portfolio / solve_max_annual_expense.
+
+value is the solution; [lower, upper] brackets the exact root; slope is the change in final
+balance per unit of value near the root (nan if unknown); evaluations counts simulations run.
+status is SOLVER_CONVERGED, or SOLVER_PARTIAL if the solve ran out of its evaluation or time
+budget: value is then the best point found that meets the target (float('inf') / 0.0 if none)
+and [lower, upper] the best bracket found. Passing a previous SolverResult back as warm_start
+lets the iterative fallback start from it instead of searching from scratch; the closed-form
+solves used for this engine's affine model do not need it.
+"""
+
+def _expand_period_values(rates_periods, total_T, key, default=None):
+    """
+    Expand one per-period value (e.g. 'r', 'i' or 'vol') into a float64 array with one entry per year.
+    Periods missing the key use default; if default is None the key is required.
+    """
+    durations = np.array([max(p.get('duration', 0), 0) for p in rates_periods], dtype=int)
+    values = np.array([(p[key] if default is None else p.get(key, default)) if d > 0 else 0.0
+                       for p, d in zip(rates_periods, durations)], dtype=np.float64)
+    per_year = np.repeat(values, durations)
+    if len(per_year) != total_T:
+        raise EngineError(RATE_PERIODS_MISMATCH, "Ran out of rate periods unexpectedly.")
+    return per_year
+
+
+def _expand_rates_periods(rates_periods, total_T):
+    """
+    Expand rate periods into per-year arrays of returns and inflation rates.
+
+    Returns:
+        tuple: (r_per_year, i_per_year), each a float64 array of length total_T.
+    """
+    return _expand_period_values(rates_periods, total_T, 'r'), _expand_period_values(rates_periods, total_T, 'i')
+
+
+class RateSchedule:
+    """
+    Immutable per-year expansion of rate periods, compiled once and reusable across
+    simulations and solvers (and hashable, so it can key caches).
+
+    Attributes:
+        total_T (int): Number of simulated years.
+        r, i, vol (np.ndarray): Per-year return, inflation and volatility (decimals), read-only.
+        growth_factors (np.ndarray): 1 + r for each year.
+        growth_index (np.ndarray): Cumulative growth before each year and after the last,
+                                   length total_T + 1 (growth_index[-1] is the total growth).
+        inflation_index (np.ndarray): Cumulative inflation applied to each year's withdrawal,
+                                      length total_T (1.0 for the first year).
+    """
+    __slots__ = ('total_T', 'r', 'i', 'vol', 'growth_factors', 'growth_index', 'inflation_index', '_hash')
+
+    def __init__(self, r_per_year, i_per_year, vol_per_year=None):
+        r_per_year = np.array(r_per_year, dtype=np.float64)
+        i_per_year = np.array(i_per_year, dtype=np.float64)
+        vol_per_year = np.zeros_like(r_per_year) if vol_per_year is None else np.array(vol_per_year, dtype=np.float64)
+        if r_per_year.ndim != 1 or r_per_year.shape != i_per_year.shape or r_per_year.shape != vol_per_year.shape:
+            raise EngineError(INVALID_RATE_SCHEDULE, "Rate schedule arrays must be one-dimensional and of equal length.")
+        growth_factors = 1.0 + r_per_year
+        growth_index = np.concatenate(([1.0], np.cumprod(growth_factors)))
+        inflation_index = np.concatenate(([1.0], np.cumprod(1.0 + i_per_year[:-1])))[:len(i_per_year)]
+        values = dict(total_T=len(r_per_year), r=r_per_year, i=i_per_year, vol=vol_per_year, growth_factors=growth_factors,
+                      growth_index=growth_index, inflation_index=inflation_index,
+                      _hash=hash((r_per_year.tobytes(), i_per_year.tobytes(), vol_per_year.tobytes())))
+        for name, value in values.items():
+            if isinstance(value, np.ndarray):
+                value.setflags(write=False)
+            object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_periods(cls, rates_periods):
+        """Compile a rates_periods list (see annual_simulation); 'vol' defaults to 0.0."""
+        if not rates_periods:
+            raise EngineError(EMPTY_RATES_PERIODS, "rates_periods list cannot be empty.")
+        total_T = sum(p.get('duration', 0) for p in rates_periods)
+        r_per_year, i_per_year = _expand_rates_periods(rates_periods, total_T)
+        return cls(r_per_year, i_per_year, _expand_period_values(rates_periods, total_T, 'vol', default=0.0))
+
+    @property
+    def total_growth(self):
+        """Growth of one unit of initial portfolio over the full horizon."""
+        return float(self.growth_index[-1])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RateSchedule is immutable.")
+
+    def __len__(self):
+        return self.total_T
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if not isinstance(other, RateSchedule):
+            return NotImplemented
+        return (self._hash == other._hash and np.array_equal(self.r, other.r)
+                and np.array_equal(self.i, other.i) and np.array_equal(self.vol, other.vol))
+
+    def __reduce__(self):
+        return (RateSchedule, (self.r, self.i, self.vol))
+
+    def __repr__(self):
+        return f"RateSchedule(total_T={self.total_T}, total_growth={self.total_growth:.6g})"
+
+
+@lru_cache(maxsize=RATE_SCHEDULE_CACHE_SIZE)
+def _compile_period_items(period_items):
+    return RateSchedule.from_periods([dict(items) for items in period_items])
+
+
+def compile_rate_schedule(rates_periods):
+    """
+    Return rates_periods as a RateSchedule, compiling a list of period dicts if needed.
+    Engine functions call this on entry, so they accept either form. Schedules are immutable,
+    so recently compiled ones are reused for identical period lists.
+    """
+    if isinstance(rates_periods, RateSchedule):
+        return rates_periods
+    try:
+        period_items = tuple(tuple(sorted(period.items())) for period in rates_periods)
+        hash(period_items)
+    except (AttributeError, TypeError): # Unhashable values: compile without memoisation
+        return RateSchedule.from_periods(rates_periods)
+    return _compile_period_items(period_items)
+
+
+def compile_one_off_events(one_off_events, total_T):
+    """
+    Compile one-off events into a dense, read-only vector of the net cash flow applied in each
+    simulated year (index 0 is year 1), so simulations add them with one vector operation.
+    Events outside 1..total_T, or with a non-integer year, are ignored.
+
+    Args:
+        one_off_events (list of dicts, np.ndarray or None): e.g. [{'year': 5, 'amount': -20000}, ...],
+                                                           or an already compiled vector.
+        total_T (int): Number of simulated years.
+
+    Returns:
+        np.ndarray: Float64 array of length total_T.
+    """
+    if isinstance(one_off_events, np.ndarray):
+        if one_off_events.shape != (total_T,):
+            raise EngineError(INVALID_CASH_FLOWS, "One-off cash flows must have one entry per simulated year.")
+        return one_off_events
+    event_years, event_amounts = [], []
+    for event in one_off_events or []:
+        year = event.get('year')
+        if year is None or year != int(year) or not (1 <= year <= total_T):
+            continue
+        event_years.append(int(year) - 1)
+        event_amounts.append(event.get('amount', 0.0))
+    cash_flows = np.bincount(np.array(event_years, dtype=np.intp), weights=np.array(event_amounts, dtype=np.float64),
+                             minlength=total_T).astype(np.float64)
+    cash_flows.setflags(write=False)
+    return cash_flows
+
+
+def _solve_balance_recurrence(PV, growth_factors, net_cash_flows):
+    """
+    Solve B[t+1] = B[t] * growth_factors[t] + net_cash_flows[t] with B[0] = PV along the last axis.
+
+    Uses a discounted cumulative sum: B[t] = G[t] * (PV + sum_{s<t} c[s] / G[s+1]),
+    where G[t] is the cumulative growth up to year t. Falls back to the plain
+    recurrence if any growth factor is non-positive (a -100% year), since the
+    discounting would divide by zero. Works for a single scenario (1-D inputs,
+    scalar PV) or a batch (2-D inputs of shape (scenarios, T), PV of shape (scenarios,)).
+
+    Returns:
+        np.ndarray: Balances B[0..T], last axis of length T + 1.
+    """
+    total_T = growth_factors.shape[-1]
+    out_shape = growth_factors.shape[:-1] + (total_T + 1,)
+    if np.all(growth_factors > 0):
+        cumulative_growth = np.empty(out_shape, dtype=np.float64)
+        cumulative_growth[..., 0] = 1.0
+        np.cumprod(growth_factors, axis=-1, out=cumulative_growth[..., 1:])
+        discounted = np.empty(out_shape, dtype=np.float64)
+        discounted[..., 0] = PV
+        np.cumsum(net_cash_flows / cumulative_growth[..., 1:], axis=-1, out=discounted[..., 1:])
+        discounted[..., 1:] += np.asarray(PV, dtype=np.float64)[..., np.newaxis]
+        return cumulative_growth * discounted
+
+    balances = np.empty(out_shape, dtype=np.float64)
+    balances[..., 0] = PV
+    for t in range(total_T):
+        balances[..., t + 1] = balances[..., t] * growth_factors[..., t] + net_cash_flows[..., t]
+    return balances
+
+
+def _simulate_balances(PV, growth_factors, withdrawals, cash_flows, withdraw_at_start):
+    """
+    Shared kernel for annual_simulation and batch_annual_simulation.
+
+    Args:
+        PV (float or np.ndarray): Initial balance(s).
+        growth_factors (np.ndarray): 1 + r for each year, shape (..., T).
+        withdrawals (np.ndarray): Withdrawal for each year, shape (..., T).
+        cash_flows (np.ndarray): Net one-off cash flow for each year, shape (..., T).
+        withdraw_at_start (bool or np.ndarray): True where withdrawals happen at the start of the year.
+
+    Returns:
+        np.ndarray: Recorded balances, shape (..., T + 1); see annual_simulation.
+    """
+    withdraw_at_start = np.asarray(withdraw_at_start)[..., np.newaxis]
+    # TIME_START: withdrawal and one-offs, then growth. TIME_END: one-offs, growth, then withdrawal.
+    pre_growth_adjustment = np.where(withdraw_at_start, cash_flows - withdrawals, cash_flows)
+    post_growth_adjustment = np.where(withdraw_at_start, 0.0, withdrawals)
+    start_of_year = _solve_balance_recurrence(PV, growth_factors, pre_growth_adjustment * growth_factors - post_growth_adjustment)
+    # For TIME_START the recorded balance is after withdrawal and one-off events, before growth;
+    # for TIME_END it is the balance at the start of the year.
+    balances = start_of_year.copy()
+    balances[..., :-1] += np.where(withdraw_at_start, pre_growth_adjustment, 0.0)
+    return balances
+
 
 def annual_simulation(PV, W_initial, withdrawal_time, rates_periods, one_off_events=None):
     """
     Simulate the annual portfolio balance over T years with varying rates.
 
+    Each year, for TIME_START: withdrawal, then one-off events, then growth.
+    For TIME_END: one-off events, then growth, then withdrawal.
+    The yearly recurrence is solved with array operations rather than a per-year loop.
+
     Args:
         PV (float): Present Value (initial portfolio balance).
         W_initial (float): Initial annual withdrawal amount for the first year.
         withdrawal_time (str): Time of withdrawal, "start" or "end" of the year.
-        rates_periods (list of dicts): List of rate periods, e.g.,
+        rates_periods (list of dicts or RateSchedule): List of rate periods, e.g.,
                                        [{'duration': D_years, 'r': R_decimal, 'i': I_decimal}, ...]
+        one_off_events (list of dicts or np.ndarray, optional): One-off income/expense events,
+                                       or their compiled vector (see compile_one_off_events).
 
     Returns:
-        tuple: (years_array, balances_list, withdrawals_list)
+        tuple: (years_array, balances_array, withdrawals_array). balances_array has T + 1
+               entries: for TIME_END the balance at the start of each year, for TIME_START
+               the balance after withdrawal and one-off events (before growth); the last
+               entry is the final balance after T years.
     """
-    if one_off_events is None:
-        one_off_events = []
+    schedule = compile_rate_schedule(rates_periods)
+    total_T = schedule.total_T
+    if total_T <= 0:
+        raise EngineError(NON_POSITIVE_DURATION, "Total duration from rates_periods must be greater than zero.")
 
-    if not rates_periods:
-        raise ValueError(gettext("rates_periods list cannot be empty."))
+    years = np.arange(0, total_T + 1)
+    sim_withdrawals = W_initial * schedule.inflation_index
+    cash_flows = compile_one_off_events(one_off_events, total_T)
+    balances = _simulate_balances(PV, schedule.growth_factors, sim_withdrawals, cash_flows, withdrawal_time == TIME_START)
+    return years, balances, sim_withdrawals
 
-    total_T = sum(p.get('duration', 0) for p in rates_periods)
+
+SimulationCheckpoints = namedtuple('SimulationCheckpoints', ['withdraw_at_start', 'schedule', 'cash_flows', 'portfolio', 'withdrawal',
+                                                             'fixed', 'resumed_from'])
+SimulationCheckpoints.__doc__ = """
+Per-year state of annual_simulation for one scenario (withdrawal timing, RateSchedule and
+compiled one-off cash flows), kept affine in the two amounts: the balance at the start of year t
+is PV * portfolio[t] + W_initial * withdrawal[t] + fixed[t], for t = 0..total_T. Built by
+build_simulation_checkpoints; resumed_from is the first year it had to compute rather than copy
+from a previous build.
+"""
+
+
+def first_changed_year(checkpoints, withdrawal_time, schedule, cash_flows):
+    """
+    Number of leading years whose start-of-year state checkpoints can supply for a scenario:
+    the first year whose return, inflation or one-off cash flow differs from the one checkpoints
+    were built for (0 if the withdrawal timing differs, the shorter horizon if none differs).
+    The state at the start of year t only depends on the years before t.
+    """
+    if checkpoints.withdraw_at_start != (withdrawal_time == TIME_START):
+        return 0
+    shared_T = min(checkpoints.schedule.total_T, schedule.total_T)
+    changed = ((checkpoints.schedule.r[:shared_T] != schedule.r[:shared_T]) | (checkpoints.schedule.i[:shared_T] != schedule.i[:shared_T])
+               | (checkpoints.cash_flows[:shared_T] != cash_flows[:shared_T]))
+    return int(np.argmax(changed)) if changed.any() else shared_T
+
+
+def build_simulation_checkpoints(withdrawal_time, rates_periods, one_off_events=None, previous=None):
+    """
+    Compute the per-year SimulationCheckpoints of a scenario, resuming from previous when given.
+
+    States up to the first year that differs from previous's scenario are copied and only the
+    remaining years are recomputed, so an edit to a late rate period or one-off event costs time
+    in proportion to the changed suffix of the horizon.
+
+    Args:
+        withdrawal_time (str): "start" or "end".
+        rates_periods (list of dicts or RateSchedule): See annual_simulation.
+        one_off_events (list of dicts or np.ndarray, optional): One-off income/expense events or their compiled vector.
+        previous (SimulationCheckpoints, optional): Checkpoints of a related scenario.
+
+    Returns:
+        SimulationCheckpoints: previous itself if the scenario is unchanged.
+    """
+    schedule = compile_rate_schedule(rates_periods)
+    total_T = schedule.total_T
     if total_T <= 0:
-        raise ValueError(gettext("Total duration from rates_periods must be greater than zero."))
+        raise EngineError(NON_POSITIVE_DURATION, "Total duration from rates_periods must be greater than zero.")
+    cash_flows = compile_one_off_events(one_off_events, total_T)
+    start = first_changed_year(previous, withdrawal_time, schedule, cash_flows) if previous is not None else 0
+    if previous is not None and start == total_T == previous.schedule.total_T:
+        return previous
 
-    years = np.arange(0, total_T + 1)
-    balances = []
-    sim_withdrawals = [] # Renamed to avoid conflict with outer scope 'withdrawals' in some contexts
-
-    B = PV
-    current_annual_withdrawal = W_initial
-
-    current_period_idx = 0
-    time_in_current_period = 0
-
-    for t_year_idx in range(total_T):
-        # Determine current period's rates
-        while time_in_current_period >= rates_periods[current_period_idx]['duration']:
-            time_in_current_period -= rates_periods[current_period_idx]['duration']
-            current_period_idx += 1
-            if current_period_idx >= len(rates_periods):
-                 # This should not happen if total_T is calculated correctly and loop runs for total_T years
-                raise IndexError(gettext("Ran out of rate periods unexpectedly."))
-
-        r_current_period = rates_periods[current_period_idx]['r']
-        i_current_period = rates_periods[current_period_idx]['i']
-
-        # Store the withdrawal for the current year t_year_idx
-        sim_withdrawals.append(current_annual_withdrawal)
-
-        if withdrawal_time == TIME_START:
-            B -= current_annual_withdrawal
-            # Balance after withdrawal is recorded before one-off events and growth for this year
-            # However, the problem asks for one-off events *after* withdrawal and *before* growth.
-            # So, we'll append to balances *after* one-off events for TIME_START.
-            # B is now post-withdrawal.
-        else: # TIME_END
-            balances.append(B) # Balance before withdrawal and growth for this year
-            # For TIME_END, withdrawal happens after growth and one-off events.
-            # So, B is pre-withdrawal, pre-one-off, pre-growth here.
-
-        # Process one-off events for the current year (t_year_idx, which is year t_year_idx + 1)
-        # One-off events are processed *after* regular withdrawal (if TIME_START)
-        # and *before* growth.
-        # If TIME_END, they are processed *before* growth and *before* withdrawal.
-        # The chosen point: after withdrawal (if applicable), before growth.
-        for event in one_off_events:
-            # Assuming event['year'] is 1-based index. Simulation t_year_idx is 0-based.
-            if event.get('year') == (t_year_idx + 1):
-                B += event.get('amount', 0.0)
-
-        if withdrawal_time == TIME_START:
-            balances.append(B) # Balance after withdrawal and one-off events, before growth
-            B *= (1 + r_current_period)
+    states = np.empty((3, total_T + 1), dtype=np.float64)
+    if start:
+        states[:, :start + 1] = np.stack((previous.portfolio, previous.withdrawal, previous.fixed))[:, :start + 1]
+    else:
+        states[:, 0] = (1.0, 0.0, 0.0)
+    growth_factors = schedule.growth_factors[start:]
+    unit_withdrawals = schedule.inflation_index[start:]
+    withdraw_at_start = withdrawal_time == TIME_START
+    # Same yearly net flows as _simulate_balances, split by the amount they scale with
+    net_flows = np.stack((np.zeros_like(growth_factors),
+                          -unit_withdrawals * growth_factors if withdraw_at_start else -unit_withdrawals,
+                          cash_flows[start:] * growth_factors))
+    states[:, start:] = _solve_balance_recurrence(states[:, start], np.broadcast_to(growth_factors, net_flows.shape), net_flows)
+    states.setflags(write=False)
+    return SimulationCheckpoints(withdraw_at_start, schedule, cash_flows, states[0], states[1], states[2], start)
+
+
+def checkpoint_final_balance(checkpoints, PV, W_initial):
+    """Final balance of the checkpoints' scenario for initial portfolio PV and withdrawal W_initial."""
+    return PV * checkpoints.portfolio[-1] + W_initial * checkpoints.withdrawal[-1] + checkpoints.fixed[-1]
+
+
+def simulate_from_checkpoints(checkpoints, PV, W_initial):
+    """
+    annual_simulation of the checkpoints' scenario, evaluated from its per-year states with a
+    few vector operations instead of re-solving the recurrence.
+
+    Returns:
+        tuple: (years_array, balances_array, withdrawals_array), as from annual_simulation.
+    """
+    withdrawals = W_initial * checkpoints.schedule.inflation_index
+    balances = PV * checkpoints.portfolio + W_initial * checkpoints.withdrawal + checkpoints.fixed
+    if checkpoints.withdraw_at_start:
+        balances[:-1] += checkpoints.cash_flows - withdrawals
+    return np.arange(0, checkpoints.schedule.total_T + 1), balances, withdrawals
+
+
+FinalBalanceSensitivity = namedtuple('FinalBalanceSensitivity', ['final_balance', 'portfolio', 'withdrawal', 'returns', 'inflation',
+                                                                 'cash_flows'])
+FinalBalanceSensitivity.__doc__ = """
+Derivatives of a scenario's final balance, from final_balance_sensitivities: with respect to the
+initial portfolio and the first year's withdrawal (floats), and to each year's return, each
+year's inflation rate and a cash flow added in each year (float64 arrays of length total_T).
+"""
+
+
+def final_balance_sensitivities(PV, W_initial, withdrawal_time, rates_periods, one_off_events=None):
+    """
+    Sensitivity of the final balance of annual_simulation to every input, from one forward
+    simulation and one reverse (adjoint) pass.
+
+    The adjoint of the balance at the start of year t is the growth still ahead of it,
+    prod_{s>=t} (1 + r[s]); every derivative is built from these products:
+    d/dPV is the total growth, a cash flow in year t is worth the growth from year t on, a
+    return r[t] scales the balance year t grows from, and inflation in year s raises every
+    later withdrawal.
+
+    Args:
+        PV (float): Initial portfolio balance.
+        W_initial (float): Initial annual withdrawal.
+        withdrawal_time (str): "start" or "end".
+        rates_periods (list of dicts or RateSchedule): See annual_simulation.
+        one_off_events (list of dicts or np.ndarray, optional): One-off income/expense events or their compiled vector.
+
+    Returns:
+        FinalBalanceSensitivity: Index t of the per-year arrays is year t + 1, as in compile_one_off_events.
+    """
+    schedule = compile_rate_schedule(rates_periods)
+    total_T = schedule.total_T
+    _, balances, withdrawals = annual_simulation(PV, W_initial, withdrawal_time, schedule, one_off_events)
+    cash_flows = compile_one_off_events(one_off_events, total_T)
+    withdraw_at_start = withdrawal_time == TIME_START
+
+    # Adjoint of the start-of-year balance: growth from year t to the end (1.0 after the last year)
+    remaining_growth = np.ones(total_T + 1)
+    remaining_growth[:-1] = np.cumprod(schedule.growth_factors[::-1])[::-1]
+    # Withdrawal in year t costs the growth after it was taken: all of year t's for TIME_START, none for TIME_END
+    withdrawal_cost = remaining_growth[:-1] if withdraw_at_start else remaining_growth[1:]
+    # Balance each year's return applies to (recorded balances are already after withdrawal and events for TIME_START)
+    growing_balance = balances[:-1] if withdraw_at_start else balances[:-1] + cash_flows
+
+    # Inflation in year s raises the withdrawals of years t > s by inflation_index[t] / (1 + i[s]). The sum
+    # J[s] = sum_{t>s} cost[t] * prod_{s<u<t} (1 + i[u]) is a reverse recurrence: J[s] = cost[s+1] + (1 + i[s+1]) * J[s+1]
+    later_costs = _solve_balance_recurrence(0.0, 1.0 + schedule.i[:0:-1], withdrawal_cost[:0:-1])[::-1]
+
+    return FinalBalanceSensitivity(
+        final_balance=float(balances[-1]),
+        portfolio=float(remaining_growth[0]),
+        withdrawal=-float(np.dot(schedule.inflation_index, withdrawal_cost)),
+        returns=growing_balance * remaining_growth[1:],
+        inflation=-W_initial * schedule.inflation_index * later_costs,
+        cash_flows=remaining_growth[:-1],
+    )
+
+
+def pad_rates_periods(rates_periods_list):
+    """
+    Expand several scenarios' rate periods into padded per-year matrices for batch_annual_simulation.
+
+    Args:
+        rates_periods_list (list): One rates_periods list or RateSchedule (see annual_simulation) per scenario.
+
+    Returns:
+        tuple: (r_matrix, i_matrix, horizons). The matrices have shape (scenarios, max_T) and are
+               zero-padded past each scenario's horizon; horizons holds each scenario's T.
+    """
+    schedules = [compile_rate_schedule(rates_periods) for rates_periods in rates_periods_list]
+    horizons = np.array([schedule.total_T for schedule in schedules], dtype=int)
+    max_T = int(horizons.max()) if len(horizons) else 0
+    r_matrix = np.zeros((len(schedules), max_T), dtype=np.float64)
+    i_matrix = np.zeros((len(schedules), max_T), dtype=np.float64)
+    for idx, schedule in enumerate(schedules):
+        r_matrix[idx, :schedule.total_T] = schedule.r
+        i_matrix[idx, :schedule.total_T] = schedule.i
+    return r_matrix, i_matrix, horizons
+
+
+def pad_one_off_events(one_off_events_list, max_T):
+    """
+    Build a (scenarios, max_T) matrix of net one-off cash flows for batch_annual_simulation.
+
+    Args:
+        one_off_events_list (list): One list of one-off events (or None) per scenario.
+        max_T (int): Number of simulated years (columns).
+    """
+    cash_flow_matrix = np.zeros((len(one_off_events_list), max_T), dtype=np.float64)
+    for idx, one_off_events in enumerate(one_off_events_list):
+        if one_off_events:
+            cash_flow_matrix[idx] = compile_one_off_events(one_off_events, max_T)
+    return cash_flow_matrix
+
+
+def batch_annual_simulation(PV, W_initial, withdrawal_time, r_matrix, i_matrix, horizons=None, cash_flows=None):
+    """
+    Simulate many scenarios at once with the same semantics as annual_simulation.
+
+    Scenarios may have different horizons: rate matrices are padded to the longest one
+    (see pad_rates_periods) and, past a scenario's horizon, no withdrawals or cash flows are
+    applied and no growth happens, so its last column holds that scenario's final balance.
+
+    Args:
+        PV (array-like): Initial portfolio per scenario, shape (scenarios,).
+        W_initial (array-like): Initial annual withdrawal per scenario, shape (scenarios,).
+        withdrawal_time (str or array-like): "start"/"end" for all scenarios or one per scenario.
+        r_matrix (array-like): Annual return per scenario and year, shape (scenarios, max_T).
+        i_matrix (array-like): Annual inflation per scenario and year, shape (scenarios, max_T).
+        horizons (array-like, optional): Years simulated per scenario. Defaults to max_T for all.
+        cash_flows (array-like, optional): Net one-off cash flow per scenario and year,
+                                           shape (scenarios, max_T) (see pad_one_off_events).
+
+    Returns:
+        tuple: (years_array, balances_matrix, withdrawals_matrix) with shapes
+               (max_T + 1,), (scenarios, max_T + 1) and (scenarios, max_T).
+    """
+    r_matrix = np.asarray(r_matrix, dtype=np.float64)
+    i_matrix = np.asarray(i_matrix, dtype=np.float64)
+    if r_matrix.ndim != 2 or r_matrix.shape != i_matrix.shape:
+        raise EngineError(INVALID_RATE_MATRICES, "Rate matrices must be two-dimensional and of equal shape.")
+    num_scenarios, max_T = r_matrix.shape
+    if max_T <= 0:
+        raise EngineError(NON_POSITIVE_DURATION, "Total duration from rates_periods must be greater than zero.")
+
+    PV = np.broadcast_to(np.asarray(PV, dtype=np.float64), (num_scenarios,))
+    W_initial = np.broadcast_to(np.asarray(W_initial, dtype=np.float64), (num_scenarios,))
+    withdraw_at_start = np.broadcast_to(np.asarray(withdrawal_time) == TIME_START, (num_scenarios,))
+
+    if horizons is None:
+        active = np.ones((num_scenarios, max_T), dtype=bool)
+    else:
+        active = np.arange(max_T) < np.asarray(horizons)[:, np.newaxis]
+
+    growth_factors = np.where(active, 1.0 + r_matrix, 1.0)
+    inflation_index = np.ones((num_scenarios, max_T), dtype=np.float64)
+    np.cumprod(1.0 + i_matrix[:, :-1], axis=1, out=inflation_index[:, 1:])
+    withdrawals = np.where(active, W_initial[:, np.newaxis] * inflation_index, 0.0)
+    if cash_flows is None:
+        cash_flows = np.zeros((num_scenarios, max_T), dtype=np.float64)
+    else:
+        cash_flows = np.where(active, np.asarray(cash_flows, dtype=np.float64), 0.0)
+
+    balances = _simulate_balances(PV, growth_factors, withdrawals, cash_flows, withdraw_at_start)
+    return np.arange(0, max_T + 1), balances, withdrawals
+
+
+def _draw_growth_factors(rng, r_per_year, vol_per_year, num_paths):
+    """
+    Draw a (years, paths) matrix of annual growth factors 1 + r, with r normally distributed
+    around each year's mean return with that year's volatility. Returns below -100% are
+    clipped to a total loss.
+    """
+    growth_factors = rng.standard_normal((len(r_per_year), num_paths))
+    growth_factors *= vol_per_year[:, np.newaxis]
+    growth_factors += (1.0 + r_per_year)[:, np.newaxis]
+    np.maximum(growth_factors, 0.0, out=growth_factors)
+    return growth_factors
+
+
+def _simulate_paths(PV, growth_factors, withdrawals, cash_flows, withdraw_at_start):
+    """
+    Simulate many return paths that share withdrawals and one-off cash flows.
+
+    Same recorded-balance semantics as annual_simulation, but year-major: growth_factors has
+    shape (years, paths) and the result has shape (years + 1, paths), so each year's update
+    works on one contiguous row.
+    """
+    total_T, num_paths = growth_factors.shape
+    balances = np.empty((total_T + 1, num_paths), dtype=np.float64)
+    balance = np.full(num_paths, PV, dtype=np.float64)
+    for t in range(total_T):
+        if withdraw_at_start:
+            balance -= withdrawals[t]
+            balance += cash_flows[t]
+            balances[t] = balance
+            balance *= growth_factors[t]
         else: # TIME_END
-            # balances.append(B) was already done before one-offs for TIME_END if we want pre-withdrawal, pre-one-off, pre-growth
-            # However, to be consistent with the logic of "after withdrawal, before growth",
-            # for TIME_END, one-offs happen, then growth, then withdrawal.
-            # The current `balances.append(B)` for TIME_END captured B *before* one-offs and *before* growth.
-            # Let's adjust: For TIME_END, one-offs are applied, then growth, then withdrawal.
-            # The balance recorded for year t_year_idx should reflect state *before* withdrawal.
-            # So, for TIME_END, the sequence is:
-            # 1. B (start of year)
-            # 2. Apply one-off events to B
-            # 3. Apply growth to B -> B_after_growth
-            # 4. Subtract withdrawal from B_after_growth. This is the new B for end of year.
-            # The balance to save for year t_year_idx should be B *before* withdrawal.
-            # The `balances.append(B)` for TIME_END currently stores the balance *before* one-offs and growth. This is fine.
-            # The one-off events are now incorporated into B.
-            B *= (1 + r_current_period) # Growth applied to B (which includes one-off events)
-            B -= current_annual_withdrawal # Withdrawal at the end of the year
-
-        # Inflate withdrawal for the *next* year using the current year's inflation
-        current_annual_withdrawal *= (1 + i_current_period)
-        time_in_current_period += 1
-
-    balances.append(B) # Final balance after T years
-    return years, balances, sim_withdrawals
+            balances[t] = balance
+            balance += cash_flows[t]
+            balance *= growth_factors[t]
+            balance -= withdrawals[t]
+    balances[total_T] = balance
+    return balances
+
+
+def _percentile_bands(balances, percentiles):
+    """
+    Per-year percentiles of a (years + 1, paths) balance matrix, using the same linear
+    interpolation as np.percentile. Sorts balances in place along the paths axis.
+
+    Returns:
+        np.ndarray: Shape (len(percentiles), years + 1).
+    """
+    balances.sort(axis=1)
+    positions = np.asarray(percentiles, dtype=np.float64) / 100.0 * (balances.shape[1] - 1)
+    lower = np.floor(positions).astype(int)
+    upper = np.minimum(lower + 1, balances.shape[1] - 1)
+    fraction = (positions - lower)[:, np.newaxis]
+    lower_values = balances[:, lower].T
+    return lower_values + (balances[:, upper].T - lower_values) * fraction
+
+
+def _monte_carlo_inputs(W_initial, withdrawal_time, rates_periods, one_off_events, num_paths):
+    """
+    Validate Monte Carlo inputs and expand them into per-year arrays.
+
+    Returns:
+        tuple: (total_T, r_per_year, vol_per_year, withdrawals, cash_flows, withdraw_at_start)
+    """
+    schedule = compile_rate_schedule(rates_periods)
+    total_T = schedule.total_T
+    if total_T <= 0:
+        raise EngineError(NON_POSITIVE_DURATION, "Total duration from rates_periods must be greater than zero.")
+    if num_paths <= 0:
+        raise EngineError(INVALID_PATH_COUNT, "Number of simulation paths must be greater than zero.")
+
+    withdrawals = W_initial * schedule.inflation_index
+    cash_flows = compile_one_off_events(one_off_events, total_T)
+    return total_T, schedule.r, schedule.vol, withdrawals, cash_flows, withdrawal_time == TIME_START
+
+
+def _chunk_seeds(seed, num_paths, chunk_size):
+    """Split num_paths into chunks of chunk_size, each with its own child of SeedSequence(seed)."""
+    chunk_sizes = [min(chunk_size, num_paths - start) for start in range(0, num_paths, chunk_size)]
+    return list(zip(np.random.SeedSequence(seed).spawn(len(chunk_sizes)), chunk_sizes))
+
+
+def _simulate_chunk_balances(seed_sequence, num_paths, PV, r_per_year, vol_per_year, withdrawals, cash_flows, withdraw_at_start):
+    rng = np.random.default_rng(seed_sequence)
+    growth_factors = _draw_growth_factors(rng, r_per_year, vol_per_year, num_paths)
+    return _simulate_paths(PV, growth_factors, withdrawals, cash_flows, withdraw_at_start)
+
+
+def _monte_carlo_chunk(task):
+    """
+    Simulate one independently seeded chunk of Monte Carlo paths.
+
+    Module-level so it can run in a process pool. task is a tuple of
+    (seed_sequence, num_paths, PV, r_per_year, vol_per_year, withdrawals, cash_flows,
+    withdraw_at_start, desired_final_value, streaming).
+
+    Returns:
+        tuple: (PathStatistics for the chunk, its (years + 1, paths) balance matrix or None when streaming).
+    """
+    (seed_sequence, num_paths, PV, r_per_year, vol_per_year, withdrawals, cash_flows,
+     withdraw_at_start, desired_final_value, streaming) = task
+    balances = _simulate_chunk_balances(seed_sequence, num_paths, PV, r_per_year, vol_per_year, withdrawals, cash_flows, withdraw_at_start)
+    statistics = PathStatistics(len(r_per_year), withdraw_at_start, desired_final_value, track_quantiles=streaming)
+    statistics.update(balances)
+    return statistics, (None if streaming else balances)
+
+
+def monte_carlo_path_chunks(PV, W_initial, withdrawal_time, rates_periods, num_paths, seed=None,
+                            one_off_events=None, chunk_size=MONTE_CARLO_CHUNK_PATHS):
+    """
+    Generate Monte Carlo balance paths chunk by chunk (same paths and seeding as
+    monte_carlo_simulation), for consumers such as path_statistics.aggregate_path_chunks.
+
+    Yields:
+        np.ndarray: Year-major balances of shape (T + 1, paths_in_chunk).
+    """
+    total_T, r_per_year, vol_per_year, withdrawals, cash_flows, withdraw_at_start = _monte_carlo_inputs(
+        W_initial, withdrawal_time, rates_periods, one_off_events, num_paths)
+    for seed_sequence, size in _chunk_seeds(seed, num_paths, chunk_size):
+        yield _simulate_chunk_balances(seed_sequence, size, PV, r_per_year, vol_per_year, withdrawals, cash_flows, withdraw_at_start)
+
+
+def monte_carlo_simulation(PV, W_initial, withdrawal_time, rates_periods, num_paths, seed=None,
+                           one_off_events=None, desired_final_value=0.0, percentiles=MONTE_CARLO_PERCENTILES,
+                           workers=1, chunk_size=MONTE_CARLO_CHUNK_PATHS, streaming=False):
+    """
+    Monte Carlo version of annual_simulation with random annual returns.
+
+    Each rate period may carry a 'vol' entry (standard deviation of the annual return, as a
+    decimal; defaults to 0.0). Every year's return is drawn from a normal distribution around
+    the period's 'r'; withdrawals, inflation and one-off events follow annual_simulation.
+
+    Paths are split into chunks of chunk_size, each seeded from SeedSequence(seed).spawn(), and
+    each chunk is simulated with array operations. With workers > 1 the chunks run in a process
+    pool; partial statistics are reduced in chunk order, so results are bit-identical for any
+    number of workers.
+
+    By default percentile bands are exact, which keeps every path in memory. With
+    streaming=True each chunk is folded into a bounded-memory PathStatistics sketch instead,
+    so memory stays flat as num_paths grows. Streamed bands are within 0.5% of the exact ones
+    (plus $1), except near a zero crossing, where the error is bounded by 0.5% of the
+    neighbouring paths' magnitudes instead (see PathStatistics.percentile_bands).
+
+    Args:
+        PV (float): Initial portfolio balance.
+        W_initial (float): Initial annual withdrawal.
+        withdrawal_time (str): "start" or "end".
+        rates_periods (list of dicts or RateSchedule): e.g. [{'duration': D_years, 'r': R_decimal, 'i': I_decimal, 'vol': V_decimal}, ...]
+        num_paths (int): Number of simulated return paths.
+        seed (int, optional): Root seed, for reproducible results.
+        one_off_events (list of dicts, optional): One-off income/expense events.
+        desired_final_value (float, optional): Final balance a path must reach to count as a success.
+        percentiles (sequence of float, optional): Percentiles reported for each year's balance.
+        workers (int, optional): Number of worker processes. Defaults to 1 (run in-process).
+        chunk_size (int, optional): Paths per independently seeded chunk.
+        streaming (bool, optional): Use bounded-memory approximate percentiles.
+
+    Returns:
+        dict: {'years', 'num_paths', 'success_probability', 'ruin_year_counts' (paths first ruined
+              in each year 1..T), 'balance_mean', 'balance_std', 'percentiles',
+              'balance_bands' (len(percentiles) x (T + 1))}
+    """
+    total_T, r_per_year, vol_per_year, withdrawals, cash_flows, withdraw_at_start = _monte_carlo_inputs(
+        W_initial, withdrawal_time, rates_periods, one_off_events, num_paths)
+    tasks = [(seed_sequence, size, PV, r_per_year, vol_per_year, withdrawals, cash_flows, withdraw_at_start, desired_final_value, streaming)
+             for seed_sequence, size in _chunk_seeds(seed, num_paths, chunk_size)]
+
+    statistics = PathStatistics(total_T, withdraw_at_start, desired_final_value, track_quantiles=streaming)
+    all_balances = None if streaming else np.empty((total_T + 1, num_paths), dtype=np.float64)
+
+    def reduce_chunks(partials):
+        offset = 0
+        for chunk_statistics, chunk_balances in partials:
+            statistics.merge(chunk_statistics)
+            if chunk_balances is not None:
+                all_balances[:, offset:offset + chunk_balances.shape[1]] = chunk_balances
+                offset += chunk_balances.shape[1]
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            reduce_chunks(executor.map(_monte_carlo_chunk, tasks))
+    else:
+        reduce_chunks(map(_monte_carlo_chunk, tasks))
+
+    result = statistics.to_result(percentiles)
+    if not streaming:
+        result['balance_bands'] = _percentile_bands(all_balances, percentiles)
+    return result
+
+
+def historical_backtest(PV, W_initial, withdrawal_time, total_T, one_off_events=None, desired_final_value=0.0, dataset=None):
+    """
+    Run a plan against every historical window of total_T consecutive years (rolling start
+    years, as in the Trinity study), with the same withdrawal timing and one-off event
+    semantics as annual_simulation but each year's return and inflation taken from history.
+
+    The windows are sliding-window views into the dataset (no copies) and are all simulated
+    in one batched pass.
+
+    Args:
+        PV (float): Initial portfolio balance.
+        W_initial (float): Initial annual withdrawal, inflated with historical inflation.
+        withdrawal_time (str): "start" or "end".
+        total_T (int): Years per window.
+        one_off_events (list of dicts, optional): One-off income/expense events.
+        desired_final_value (float, optional): Final balance a window must reach to count as a success.
+        dataset (HistoricalDataset, optional): Defaults to the bundled US stock/CPI dataset.
+
+    Returns:
+        dict: {'start_years', 'final_balances', 'ruin_years' (first ruined year per window, 0 if
+              never), 'success_rate', 'worst_window' ({'start_year', 'final_balance', 'ruin_year'})}
+    """
+    if dataset is None:
+        dataset = load_historical_dataset()
+    if total_T <= 0:
+        raise EngineError(NON_POSITIVE_DURATION, "Total duration from rates_periods must be greater than zero.")
+    if total_T > len(dataset.years):
+        raise EngineError(HORIZON_EXCEEDS_HISTORY, "Duration of %(T)d years exceeds the %(n)d years of historical data.", T=total_T, n=len(dataset.years))
+
+    r_windows = np.lib.stride_tricks.sliding_window_view(dataset.returns, total_T)
+    i_windows = np.lib.stride_tricks.sliding_window_view(dataset.inflation, total_T)
+    cash_flows = np.broadcast_to(compile_one_off_events(one_off_events, total_T), r_windows.shape)
+    _, balances, _ = batch_annual_simulation(PV, W_initial, withdrawal_time, r_windows, i_windows, cash_flows=cash_flows)
+
+    final_balances = balances[:, -1]
+    window_ruin_years = ruin_years(balances.T, withdrawal_time == TIME_START)
+    successes = (window_ruin_years == 0) & (final_balances >= desired_final_value)
+    start_years = dataset.years[:len(final_balances)]
+    worst = int(np.argmin(final_balances))
+    return {
+        'start_years': start_years,
+        'final_balances': final_balances,
+        'ruin_years': window_ruin_years,
+        'success_rate': float(np.count_nonzero(successes)) / len(final_balances),
+        'worst_window': {'start_year': int(start_years[worst]), 'final_balance': float(final_balances[worst]),
+                         'ruin_year': int(window_ruin_years[worst])},
+    }
 
 
 def simulate_final_balance(PV, W_initial, withdrawal_time, rates_periods, desired_final_value=0.0, one_off_events=None):
@@ -111,208 +768,583 @@ def simulate_final_balance(PV, W_initial, withdrawal_time, rates_periods, desire
         PV (float): Present Value.
         W_initial (float): Initial annual withdrawal.
         withdrawal_time (str): "start" or "end".
-        rates_periods (list of dicts): See annual_simulation docstring for structure.
+        rates_periods (list of dicts or RateSchedule): See annual_simulation docstring for structure.
         desired_final_value (float, optional): Target value. Defaults to 0.0.
-        one_off_events (list of dicts, optional): List of one-off income/expense events.
+        one_off_events (list of dicts or np.ndarray, optional): One-off income/expense events or their compiled vector.
     """
-    if not rates_periods: # Basic check, annual_simulation will also raise
-        raise ValueError(gettext("rates_periods list cannot be empty for simulation."))
+    if not isinstance(rates_periods, RateSchedule) and not rates_periods: # Basic check, annual_simulation will also raise
+        raise EngineError(EMPTY_RATES_PERIODS, "rates_periods list cannot be empty for simulation.")
 
     _, balances, _ = annual_simulation(PV, W_initial, withdrawal_time, rates_periods, one_off_events=one_off_events)
     actual_final_balance = balances[-1]
     return actual_final_balance - desired_final_value
 
-def find_required_portfolio(W_initial, withdrawal_time, rates_periods, desired_final_value=0.0, one_off_events=None):
+def _initial_portfolio_upper_bound(W_initial, total_T, desired_final_value, lower=0.0):
+    """
+    Heuristic starting upper bound for the required portfolio search.
+    Shared by the closed-form solver (to reproduce the search limit) and the iterative fallback.
+    """
+    # Rough upper bound heuristic
+    if W_initial > 0:
+        upper = (W_initial * total_T * 2) + max(0, desired_final_value)
+    else: # W_initial is 0 or negative
+        upper = max(1000.0, desired_final_value * 2) # Ensure upper is somewhat positive if DFV is small/zero
+        if upper < lower: # Case where DFV is negative
+             upper = lower + 1000.0
+
+    # Heuristic: sum of all (inflated) withdrawals + desired final value, then add buffer.
+    # For simplicity, using a multiplier on W_initial * T as a proxy.
+    if W_initial > 0:
+        potential_upper = (W_initial * total_T * 1.5) + max(0, desired_final_value) * 1.5
+        upper = max(upper, potential_upper)
+
+    return max(upper, lower + 100.0) # Ensure there's a search range
+
+
+def _solved(value, lower=None, upper=None, slope=float('nan'), evaluations=0, status=SOLVER_CONVERGED):
+    return SolverResult(value, value if lower is None else lower, value if upper is None else upper, slope, evaluations, status)
+
+
+class _SolveBudgetExhausted(Exception):
+    """Raised by _BudgetedObjective once a solve has used up its evaluations or time."""
+
+
+class _BudgetedObjective:
+    """
+    A solver's objective (final balance minus target) for one solve.
+
+    Counts simulations, enforces config.max_evaluations and config.time_budget (raising
+    _SolveBudgetExhausted), skips repeated evaluations at the same point and remembers the
+    points closest to the target on either side, so an interrupted solve can still report
+    its best bracket.
+    """
+
+    def __init__(self, f, config, increasing, clock=time.monotonic):
+        self.f = f
+        self.increasing = increasing
+        self.max_evaluations = config.max_evaluations
+        self._clock = clock
+        self.deadline = clock() + config.time_budget
+        self.calls = 0
+        self.feasible = self.infeasible = None # (x, f(x)) closest to the target with f >= 0 / f < 0
+        self._last = None
+
+    def __call__(self, x):
+        if self._last is not None and self._last[0] == x:
+            return self._last[1]
+        if self.calls >= self.max_evaluations or self._clock() >= self.deadline:
+            raise _SolveBudgetExhausted()
+        fx = self.f(x)
+        self.calls += 1
+        self._last = (x, fx)
+        if fx >= 0:
+            if self.feasible is None or fx < self.feasible[1]:
+                self.feasible = (x, fx)
+        elif self.infeasible is None or fx > self.infeasible[1]:
+            self.infeasible = (x, fx)
+        return fx
+
+    def partial(self, fallback):
+        """
+        SolverResult with status SOLVER_PARTIAL: the best point seen that meets the target
+        (fallback if there is none) and the tightest bracket seen (open ends are infinite).
+        """
+        below, above = (self.infeasible, self.feasible) if self.increasing else (self.feasible, self.infeasible)
+        lower = below[0] if below else float('-inf')
+        upper = above[0] if above else float('inf')
+        slope = (above[1] - below[1]) / (upper - lower) if below and above and upper > lower else float('nan')
+        return _solved(self.feasible[0] if self.feasible else fallback, lower, upper, slope, self.calls, SOLVER_PARTIAL)
+
+
+def brent_root(f, lower, upper, f_lower=None, f_upper=None, xtol=DEFAULT_TOLERANCE, rtol=DEFAULT_RELATIVE_TOLERANCE, ftol=0.0,
+               max_evaluations=ROOT_MAX_EVALUATIONS):
+    """
+    Find a root of f in [lower, upper] with Brent's method.
+
+    Each step tries inverse quadratic interpolation or a secant step and falls back to
+    bisection whenever those would not shrink the bracket fast enough, so convergence is
+    superlinear for smooth f and guaranteed for any continuous f. The bracket always keeps
+    a sign change, so the root stays enclosed.
+
+    Args:
+        f (callable): Continuous function of one float.
+        lower (float): Lower end of the bracket.
+        upper (float): Upper end of the bracket; f(lower) and f(upper) must not have the same sign.
+        f_lower (float, optional): f(lower), if already known.
+        f_upper (float, optional): f(upper), if already known.
+        xtol (float, optional): Absolute tolerance on the root.
+        rtol (float, optional): Relative tolerance on the root; the search stops once the
+            bracket is narrower than xtol + rtol * |root|.
+        ftol (float, optional): Also stop at a point where |f| <= ftol. Defaults to 0.0 (exact zeros only).
+        max_evaluations (int, optional): Budget of calls to f, including f_lower/f_upper if not given.
+
+    Returns:
+        RootResult: converged is False if the budget ran out first; the bracket is still valid.
+
+    Raises:
+        EngineError: ROOT_NOT_BRACKETED if f(lower) and f(upper) have the same sign.
+    """
+    evaluations = 0
+    if f_lower is None:
+        f_lower = f(lower); evaluations += 1
+    if f_upper is None:
+        f_upper = f(upper); evaluations += 1
+    if np.sign(f_lower) * np.sign(f_upper) > 0:
+        raise EngineError(ROOT_NOT_BRACKETED, "The search interval does not bracket a solution.")
+
+    x_prev, f_prev, x_cur, f_cur = lower, f_lower, upper, f_upper
+    x_blk, f_blk = x_prev, f_prev # Contrapoint: f(x_blk) has the opposite sign to f(x_cur)
+    s_prev = s_cur = x_cur - x_prev
+    converged = False
+    while True:
+        if np.sign(f_prev) * np.sign(f_cur) < 0:
+            x_blk, f_blk = x_prev, f_prev
+            s_prev = s_cur = x_cur - x_prev
+        if abs(f_blk) < abs(f_cur): # Keep the better estimate in x_cur
+            x_prev, x_cur, x_blk = x_cur, x_blk, x_cur
+            f_prev, f_cur, f_blk = f_cur, f_blk, f_cur
+
+        delta = (xtol + rtol * abs(x_cur)) / 2.0
+        s_bisect = (x_blk - x_cur) / 2.0
+        if f_cur == 0 or abs(f_cur) <= ftol or abs(s_bisect) < delta:
+            converged = True
+            break
+        if evaluations >= max_evaluations:
+            break
+
+        if abs(s_prev) > delta and abs(f_cur) < abs(f_prev):
+            if x_prev == x_blk: # Secant step
+                s_try = -f_cur * (x_cur - x_prev) / (f_cur - f_prev)
+            else: # Inverse quadratic interpolation
+                d_prev = (f_prev - f_cur) / (x_prev - x_cur)
+                d_blk = (f_blk - f_cur) / (x_blk - x_cur)
+                s_try = -f_cur * (f_blk * d_blk - f_prev * d_prev) / (d_blk * d_prev * (f_blk - f_prev))
+            if 2 * abs(s_try) < min(abs(s_prev), 3 * abs(s_bisect) - delta):
+                s_prev, s_cur = s_cur, s_try
+            else:
+                s_prev = s_cur = s_bisect
+        else:
+            s_prev = s_cur = s_bisect
+
+        x_prev, f_prev = x_cur, f_cur
+        x_cur += s_cur if abs(s_cur) > delta else (delta if s_bisect > 0 else -delta)
+        f_cur = f(x_cur); evaluations += 1
+
+    if x_cur <= x_blk:
+        bracket = (x_cur, x_blk, f_cur, f_blk)
+    else:
+        bracket = (x_blk, x_cur, f_blk, f_cur)
+    return RootResult(x_cur, f_cur, *bracket, evaluations, converged)
+
+
+def _root_solution(root, evaluations, tolerance):
+    """
+    SolverResult for a solver's brent_root search, where f is the final balance minus the
+    target. The value is the root if it (nearly) meets the target, otherwise the bracket end
+    that does; the status is SOLVER_PARTIAL if the search ran out of evaluations.
+    """
+    if root.f_root >= -tolerance:
+        value = root.root
+    else:
+        value = root.upper if root.f_upper >= 0 else root.lower
+    slope = (root.f_upper - root.f_lower) / (root.upper - root.lower) if root.upper > root.lower else float('nan')
+    return _solved(value, root.lower, root.upper, slope, evaluations, SOLVER_CONVERGED if root.converged else SOLVER_PARTIAL)
+
+
+def _counted(f):
+    """Wrap f so that calls are counted in the wrapper's .calls attribute."""
+    def counted_f(x):
+        counted_f.calls += 1
+        return f(x)
+    counted_f.calls = 0
+    return counted_f
+
+
+def _warm_started_root(f, warm_start, increasing, lower_limit, upper_limit, tolerance, rtol=DEFAULT_RELATIVE_TOLERANCE,
+                       max_evaluations=WARM_START_MAX_EVALUATIONS):
+    """
+    Root of a monotonic f on [lower_limit, upper_limit], searched from a previous solution.
+
+    Steps from warm_start.value using its slope (secant steps once two points are known) until
+    the root is bracketed, then finishes with brent_root. A point is accepted once
+    |f| <= tolerance or the bracket meets the tolerances.
+
+    Returns:
+        SolverResult or None: None if the search does not converge inside the limits within
+        max_evaluations, in which case the caller falls back to a cold search.
+    """
+    f = _counted(f)
+    direction = 1.0 if increasing else -1.0
+    x0 = min(max(float(warm_start.value), lower_limit), upper_limit)
+    f0 = f(x0)
+    if abs(f0) <= tolerance:
+        return _solved(x0, slope=warm_start.slope, evaluations=f.calls)
+
+    # Bracketing phase: move towards the root until f changes sign
+    slope = warm_start.slope
+    if np.isfinite(slope) and slope * direction > 0:
+        step = -f0 / slope
+    else:
+        step = -np.sign(f0) * direction * max(abs(x0) * WARM_START_MIN_STEP, tolerance)
+    x1, f1 = x0, f0
+    while np.sign(f1) == np.sign(f0):
+        if f.calls >= max_evaluations:
+            return None
+        x_next = min(max(x1 + step, lower_limit), upper_limit)
+        if x_next == x1:
+            return None # The root lies outside the limits
+        x0, f0 = x1, f1
+        x1 = x_next
+        f1 = f(x1)
+        if abs(f1) <= tolerance:
+            return _solved(x1, slope=(f1 - f0) / (x1 - x0), evaluations=f.calls)
+        secant_step = -f1 * (x1 - x0) / (f1 - f0) if f1 != f0 else 0.0
+        # Follow the secant while it points onwards (capped), otherwise double the step
+        step = secant_step if secant_step * (x1 - x0) > 0 and abs(secant_step) <= 100 * abs(x1 - x0) else 2 * (x1 - x0)
+
+    lower, f_lower, upper, f_upper = (x0, f0, x1, f1) if x0 < x1 else (x1, f1, x0, f0)
+    root = brent_root(f, lower, upper, f_lower, f_upper, xtol=tolerance, rtol=rtol, ftol=tolerance,
+                      max_evaluations=max_evaluations - f.calls)
+    return _root_solution(root, f.calls, tolerance) if root.converged else None
+
+
+def find_required_portfolio(W_initial, withdrawal_time, rates_periods, desired_final_value=0.0, one_off_events=None, config=None,
+                            warm_start=None):
     """
     Find the required initial portfolio (PV) to sustain withdrawals W_initial (with inflation)
     for the duration specified in rates_periods, aiming for a specific desired_final_value.
-    Uses a bisection method.
+
+    Returns the value of solve_required_portfolio; see there for the method and arguments.
+    """
+    return solve_required_portfolio(W_initial, withdrawal_time, rates_periods, desired_final_value, one_off_events,
+                                    config, warm_start).value
+
+
+def solve_required_portfolio(W_initial, withdrawal_time, rates_periods, desired_final_value=0.0, one_off_events=None, config=None,
+                             warm_start=None, checkpoints=None):
+    """
+    Find the required initial portfolio (PV) to sustain withdrawals W_initial (with inflation)
+    for the duration specified in rates_periods, aiming for a specific desired_final_value.
+
+    For fixed withdrawals, rates and one-off events the final balance is affine in PV:
+    final(PV) = PV * prod(1 + r) + final(0). The solver evaluates final(0) once, solves for PV
+    directly and confirms the result with a second simulation. When that check fails (e.g. for
+    strategies that are not affine in PV) it falls back to an iterative search: secant steps
+    from warm_start if one is given, otherwise a bracket search, each finished by brent_root.
 
     Args:
         W_initial (float): Initial annual withdrawal.
         withdrawal_time (str): "start" or "end".
-        rates_periods (list of dicts): List of rate periods, e.g.,
+        rates_periods (list of dicts or RateSchedule): List of rate periods, e.g.,
                                        [{'duration': D_years, 'r': R_decimal, 'i': I_decimal}, ...].
         desired_final_value (float, optional): Target value. Defaults to 0.0.
-    """
-    if not rates_periods:
-        raise ValueError(gettext("rates_periods list cannot be empty."))
+        one_off_events (list of dicts or np.ndarray, optional): One-off income/expense events.
+        config (SolverConfig, optional): Solver settings. Defaults to DEFAULT_SOLVER_CONFIG.
+        warm_start (SolverResult, optional): A previous result for a nearby scenario.
+        checkpoints (SimulationCheckpoints, optional): Built for this scenario; final balances are
+                                       then read from them instead of simulated.
 
-    total_T_from_periods = sum(p.get('duration', 0) for p in rates_periods)
+    Returns:
+        SolverResult: value is the required PV, float('inf') if none within the search limit.
+    """
+    config = config or DEFAULT_SOLVER_CONFIG
+    schedule = compile_rate_schedule(rates_periods)
+    total_T_from_periods = schedule.total_T
 
     if total_T_from_periods == 0:
-        return desired_final_value # No time for withdrawals or growth/loss
+        return _solved(desired_final_value) # No time for withdrawals or growth/loss
 
     if W_initial == 0 and desired_final_value == 0:
-        return 0.0
+        return _solved(0.0)
 
-    lower = 0.0 # Changed this line as per instruction
+    tolerance = config.tolerance
+    growth = schedule.total_growth
+    one_off_events = compile_one_off_events(one_off_events, total_T_from_periods)
+    if checkpoints is None:
+        final_shortfall = lambda pv: simulate_final_balance(pv, W_initial, withdrawal_time, schedule, desired_final_value, one_off_events=one_off_events)
+    else:
+        final_shortfall = lambda pv: checkpoint_final_balance(checkpoints, pv, W_initial) - desired_final_value
+    shortfall = _BudgetedObjective(final_shortfall, config, increasing=True)
+    search_limit = max(config.pv_max_guess_limit,
+                       _initial_portfolio_upper_bound(W_initial, total_T_from_periods, desired_final_value))
 
-    # Rough upper bound heuristic
-    if W_initial > 0:
-        upper = (W_initial * total_T_from_periods * 2) + max(0, desired_final_value)
-    else: # W_initial is 0 or negative
-        upper = max(1000.0, desired_final_value * 2) # Ensure upper is somewhat positive if DFV is small/zero
-        if upper < lower: # Case where DFV is negative
-             upper = lower + 1000.0
+    try:
+        shortfall_at_zero = shortfall(0.0)
+        if growth > 0 and np.isfinite(growth) and np.isfinite(shortfall_at_zero):
+            if shortfall_at_zero >= 0:
+                return _solved(0.0, slope=growth, evaluations=shortfall.calls) # No initial portfolio needed
 
+            required_pv = -shortfall_at_zero / growth
+            if required_pv > search_limit:
+                # Same limit the iterative search would have hit
+                return _solved(float('inf'), search_limit, float('inf'), growth, shortfall.calls)
 
-    # Ensure upper is significantly larger than lower to start, especially if W_initial is large
-    # This is a more robust starting upper bound if W_initial is substantial.
-    # Heuristic: sum of all (inflated) withdrawals + desired final value, then add buffer.
-    # For simplicity, using a multiplier on W_initial * T as a proxy.
-    estimated_total_withdrawals = W_initial * total_T_from_periods
-    # A more generous upper bound if W_initial is positive
-    if W_initial > 0:
-        potential_upper = (estimated_total_withdrawals * 1.5) + max(0, desired_final_value) * 1.5
-        upper = max(upper, potential_upper)
+            residual = shortfall(required_pv)
+            if abs(residual) <= max(tolerance, 1e-9 * required_pv * growth):
+                return _solved(required_pv, slope=growth, evaluations=shortfall.calls)
 
+        if warm_start is not None and np.isfinite(warm_start.value):
+            result = _warm_started_root(shortfall, warm_start, True, 0.0, search_limit, tolerance, config.relative_tolerance)
+            if result is not None:
+                return result._replace(evaluations=shortfall.calls)
+    except _SolveBudgetExhausted:
+        return shortfall.partial(float('inf'))
+    return _find_required_portfolio_iterative(W_initial, withdrawal_time, schedule, desired_final_value, one_off_events, config, shortfall)
 
-    upper = max(upper, lower + 100.0) # Ensure there's a search range
 
-    # Maximize upper up to PV_MAX_GUESS_LIMIT if simulate_final_balance is still negative
-    iteration_count_upper_bound_search = 0
-    max_iterations_upper_bound = 100 # Safety break
+def _find_required_portfolio_iterative(W_initial, withdrawal_time, rates_periods, desired_final_value=0.0, one_off_events=None,
+                                       config=DEFAULT_SOLVER_CONFIG, shortfall=None):
+    """
+    Iterative fallback for solve_required_portfolio when the closed-form solve does not apply:
+    grows an upper bound until the target is met (up to the search limit), then runs
+    brent_root on [0, upper]. shortfall is the caller's _BudgetedObjective, so the whole solve
+    shares one budget.
 
-    # We need simulate_final_balance to take W_initial, not W (which was the old param name)
-    while simulate_final_balance(upper, W_initial, withdrawal_time, rates_periods, desired_final_value, one_off_events=one_off_events) < 0:
-        iteration_count_upper_bound_search += 1
-        if iteration_count_upper_bound_search > max_iterations_upper_bound:
-            return float('inf') # Cannot find a suitable upper bound
+    Returns:
+        SolverResult: value is float('inf') if even the search limit is not enough.
+    """
+    schedule = compile_rate_schedule(rates_periods)
+    total_T_from_periods = schedule.total_T
+    one_off_events = compile_one_off_events(one_off_events, total_T_from_periods)
+    if shortfall is None:
+        shortfall = _BudgetedObjective(
+            lambda pv: simulate_final_balance(pv, W_initial, withdrawal_time, schedule, desired_final_value, one_off_events=one_off_events),
+            config, increasing=True)
+    try:
+        return _required_portfolio_search(shortfall, W_initial, total_T_from_periods, desired_final_value, config)
+    except _SolveBudgetExhausted:
+        return shortfall.partial(float('inf'))
 
-        upper_multiplier = 2.0
-        # If upper is very small or zero, and W_initial is positive, give it a more substantial boost
-        if upper < W_initial * total_T_from_periods and W_initial > 0 :
-             upper = W_initial * total_T_from_periods * upper_multiplier
-        else:
-            upper *= upper_multiplier
 
-        if upper > current_app.config['PV_MAX_GUESS_LIMIT']:
-            upper = current_app.config['PV_MAX_GUESS_LIMIT']
-            if simulate_final_balance(upper, W_initial, withdrawal_time, rates_periods, desired_final_value, one_off_events=one_off_events) < 0:
-                return float('inf') # Even PV_MAX_GUESS_LIMIT is not enough
-            break
+def _required_portfolio_search(shortfall, W_initial, total_T_from_periods, desired_final_value, config):
+    lower = 0.0
+    f_lower = shortfall(lower)
+    if f_lower >= 0:
+        return _solved(lower, evaluations=shortfall.calls) # No initial portfolio needed
 
-    # If lower itself is sufficient
-    if simulate_final_balance(lower, W_initial, withdrawal_time, rates_periods, desired_final_value, one_off_events=one_off_events) >= 0:
-         # And if the range is already very small
-        if (upper == float('inf') and lower == float('inf')) or (upper - lower) <= current_app.config['DEFAULT_TOLERANCE']:
-             return lower if lower != float('-inf') else 0.0
+    upper = _initial_portfolio_upper_bound(W_initial, total_T_from_periods, desired_final_value, lower)
+    f_upper = shortfall(upper)
+    while f_upper < 0:
+        if upper >= config.pv_max_guess_limit:
+            return _solved(float('inf'), upper, float('inf'), evaluations=shortfall.calls) # Even PV_MAX_GUESS_LIMIT is not enough
+        # If upper is very small and W_initial is positive, give it a more substantial boost
+        if upper < W_initial * total_T_from_periods and W_initial > 0:
+            upper = W_initial * total_T_from_periods * 2.0
+        else:
+            upper *= 2.0
+        upper = min(upper, config.pv_max_guess_limit)
+        f_upper = shortfall(upper)
 
+    root = brent_root(shortfall, lower, upper, f_lower, f_upper, xtol=config.tolerance, rtol=config.relative_tolerance,
+                      ftol=config.tolerance, max_evaluations=config.max_evaluations)
+    return _root_solution(root, shortfall.calls, config.tolerance)
 
-    # Bisection search
-    iteration_count_bisection = 0
-    max_iterations_bisection = 100
-    while (upper - lower) > current_app.config['DEFAULT_TOLERANCE']:
-        iteration_count_bisection +=1
-        if iteration_count_bisection > max_iterations_bisection: break
 
-        mid = (lower + upper) / 2.0
-        if mid == lower or mid == upper or mid == float('inf'): break
+def _withdrawal_cost_factor(withdrawal_time, schedule):
+    """
+    Amount by which the final balance drops per unit of W_initial, i.e. every
+    inflation-adjusted withdrawal compounded forward to the end of the horizon.
+    """
+    # Growth from each year's withdrawal to the end: all of that year's growth for TIME_START,
+    # only the following years' growth for TIME_END
+    remaining_growth = np.cumprod(schedule.growth_factors[::-1])[::-1]
+    if withdrawal_time != TIME_START:
+        remaining_growth = np.append(remaining_growth[1:], 1.0)[:schedule.total_T]
+    return float(np.dot(schedule.inflation_index, remaining_growth))
 
-        if simulate_final_balance(mid, W_initial, withdrawal_time, rates_periods, desired_final_value, one_off_events=one_off_events) < 0:
-            lower = mid
-        else:
-            upper = mid
 
-    # Final check on 'upper' as it's the one that should satisfy the condition or be very close
-    if simulate_final_balance(upper, W_initial, withdrawal_time, rates_periods, desired_final_value, one_off_events=one_off_events) < -current_app.config['DEFAULT_TOLERANCE']:
-        # If 'upper' significantly misses, and 'lower' (which was too low) is float('inf'), something is wrong.
-        # This might indicate an unachievable scenario not caught by upper bound search.
-        if lower == float('inf'): return float('inf')
-        # If 'lower' is a valid number but didn't meet the criteria, and 'upper' also doesn't,
-        # it implies no solution was found in the given constraints.
-        # However, bisection should converge such that 'upper' is the smallest value satisfying the condition.
-        # If 'upper' is still failing significantly, it might be an issue if the function isn't monotonic
-        # or if the bounds were not set correctly.
-        # For now, returning 'upper' is standard, but this check indicates potential issues.
-        # If W_initial is very high, this might be the best we can do, returning a PV that gets close.
-        pass # Keep upper as the result from bisection
+def find_max_annual_expense(P, withdrawal_time, rates_periods, desired_final_value=0.0, one_off_events=None, config=None,
+                            warm_start=None):
+    """
+    Find the maximum initial annual withdrawal (W_initial) sustainable from portfolio P
+    for the duration specified in rates_periods, aiming for a specific desired_final_value.
 
-    return upper
+    Returns the value of solve_max_annual_expense; see there for the method and arguments.
+    """
+    return solve_max_annual_expense(P, withdrawal_time, rates_periods, desired_final_value, one_off_events, config, warm_start).value
 
 
-def find_max_annual_expense(P, withdrawal_time, rates_periods, desired_final_value=0.0, one_off_events=None):
+def solve_max_annual_expense(P, withdrawal_time, rates_periods, desired_final_value=0.0, one_off_events=None, config=None,
+                             warm_start=None, checkpoints=None):
     """
     Find the maximum initial annual withdrawal (W_initial) sustainable from portfolio P
     for the duration specified in rates_periods, aiming for a specific desired_final_value.
-    Uses a bisection method.
+
+    For a given P the final balance is affine in W_initial:
+    final(W) = final(0) - W * cost, where cost compounds every inflation-adjusted withdrawal
+    forward to the end of the horizon. W is solved directly from these two coefficients. When
+    they are degenerate the solver falls back to an iterative search: secant steps from
+    warm_start if one is given, otherwise a bracket search, each finished by brent_root.
 
     Args:
         P (float): Initial portfolio value.
         withdrawal_time (str): "start" or "end".
-        rates_periods (list of dicts): List of rate periods, e.g.,
+        rates_periods (list of dicts or RateSchedule): List of rate periods, e.g.,
                                        [{'duration': D_years, 'r': R_decimal, 'i': I_decimal}, ...].
         desired_final_value (float, optional): Target value. Defaults to 0.0.
-    """
-    if not rates_periods:
-        raise ValueError(gettext("rates_periods list cannot be empty."))
+        one_off_events (list of dicts or np.ndarray, optional): One-off income/expense events.
+        config (SolverConfig, optional): Solver settings. Defaults to DEFAULT_SOLVER_CONFIG.
+        warm_start (SolverResult, optional): A previous result for a nearby scenario.
+        checkpoints (SimulationCheckpoints, optional): Built for this scenario; final balances and
+                                       the withdrawal cost are then read from them instead of simulated.
 
-    total_T_from_periods = sum(p.get('duration', 0) for p in rates_periods)
+    Returns:
+        SolverResult: value is the maximum sustainable W_initial (0.0 if none).
+    """
+    config = config or DEFAULT_SOLVER_CONFIG
+    schedule = compile_rate_schedule(rates_periods)
+    total_T_from_periods = schedule.total_T
 
     if total_T_from_periods == 0:
-        return 0.0 # No withdrawals possible over zero time
+        return _solved(0.0) # No withdrawals possible over zero time
+
+    if P <= 0 and desired_final_value <= 0: # If portfolio is zero or negative, and no positive target, max W is 0
+        return _solved(0.0)
+
+    one_off_events = compile_one_off_events(one_off_events, total_T_from_periods)
+    if checkpoints is None:
+        final_surplus = lambda w: simulate_final_balance(P, w, withdrawal_time, schedule, desired_final_value, one_off_events=one_off_events)
+        cost = _withdrawal_cost_factor(withdrawal_time, schedule)
+    else:
+        final_surplus = lambda w: checkpoint_final_balance(checkpoints, P, w) - desired_final_value
+        cost = -float(checkpoints.withdrawal[-1])
+    surplus = _BudgetedObjective(final_surplus, config, increasing=False)
+
+    try:
+        surplus_without_withdrawals = surplus(0.0)
+        if cost > 0 and np.isfinite(cost) and np.isfinite(surplus_without_withdrawals):
+            if surplus_without_withdrawals <= 0:
+                return _solved(0.0, slope=-cost, evaluations=surplus.calls) # P is not enough to reach DFV even without withdrawals
+            return _solved(surplus_without_withdrawals / cost, slope=-cost, evaluations=surplus.calls)
+
+        if warm_start is not None and np.isfinite(warm_start.value):
+            result = _warm_started_root(surplus, warm_start, False, 0.0, config.pv_max_guess_limit, config.tolerance, config.relative_tolerance)
+            if result is not None:
+                return result._replace(evaluations=surplus.calls)
+    except _SolveBudgetExhausted:
+        return surplus.partial(0.0)
+    return _find_max_annual_expense_iterative(P, withdrawal_time, schedule, desired_final_value, one_off_events, config, surplus)
+
+
+def _find_max_annual_expense_iterative(P, withdrawal_time, rates_periods, desired_final_value=0.0, one_off_events=None,
+                                       config=DEFAULT_SOLVER_CONFIG, surplus=None):
+    """
+    Iterative fallback for solve_max_annual_expense when the closed-form solve does not apply:
+    grows an upper bound until it is unsustainable (up to PV_MAX_GUESS_LIMIT), then runs
+    brent_root on [0, upper]. surplus is the caller's _BudgetedObjective, so the whole solve
+    shares one budget.
+
+    Returns:
+        SolverResult: value is 0.0 if P cannot reach the target even without withdrawals.
+    """
+    schedule = compile_rate_schedule(rates_periods)
+    total_T_from_periods = schedule.total_T
+    one_off_events = compile_one_off_events(one_off_events, total_T_from_periods)
+    if surplus is None:
+        surplus = _BudgetedObjective(
+            lambda w: simulate_final_balance(P, w, withdrawal_time, schedule, desired_final_value, one_off_events=one_off_events),
+            config, increasing=False)
+    try:
+        return _max_annual_expense_search(surplus, P, schedule, desired_final_value, config)
+    except _SolveBudgetExhausted:
+        return surplus.partial(0.0)
+
 
+def _max_annual_expense_search(surplus, P, schedule, desired_final_value, config):
+    total_T_from_periods = schedule.total_T
     lower = 0.0
+    f_lower = surplus(lower)
+    if f_lower <= 0:
+        return _solved(lower, evaluations=surplus.calls) # P is not enough to reach DFV even without withdrawals
 
-    # Heuristic for upper bound
-    if total_T_from_periods > 0:
-        # Estimate based on average withdrawal if portfolio just depletes to desired_final_value
-        # This is a very rough estimate.
-        avg_r = sum(p['r'] * p['duration'] for p in rates_periods) / total_T_from_periods if total_T_from_periods > 0 else 0
-        # Effective principal available for withdrawals over the period
-        P_adjusted_for_dfv = P - (desired_final_value / ((1 + avg_r)**total_T_from_periods if (1 + avg_r) > 0 else 1))
+    # Rough first guess: spread P (less the discounted target) over the horizon, with a 1.5 safety factor
+    avg_r = float(schedule.r.mean())
+    P_adjusted_for_dfv = P - (desired_final_value / ((1 + avg_r) ** total_T_from_periods if (1 + avg_r) > 0 else 1))
+    upper = max(P_adjusted_for_dfv / (total_T_from_periods / 1.5), config.w_min_guess_for_max_expense)
+    f_upper = surplus(upper)
+    while f_upper >= 0:
+        if upper >= config.pv_max_guess_limit:
+            return _solved(upper, evaluations=surplus.calls) # Sustainable up to the search limit
+        upper = min(upper * 2.0, config.pv_max_guess_limit)
+        f_upper = surplus(upper)
 
-        if P_adjusted_for_dfv <= 0: # If P is not enough to even reach DFV without withdrawals
-            upper = 0.0
-        else:
-            # Simple average withdrawal guess
-            upper = (P_adjusted_for_dfv / (total_T_from_periods / 1.5)) if total_T_from_periods > 0 else 0 # Added safety factor 1.5
-            upper = max(upper, current_app.config.get('W_MIN_GUESS_FOR_MAX_EXPENSE', 1.0))
-    else: # total_T_from_periods is 0
-        upper = 0.0
-
-    upper = max(upper, current_app.config.get('W_MIN_GUESS_FOR_MAX_EXPENSE', 1.0))
-    if P <= 0 and desired_final_value <=0 : # If portfolio is zero or negative, and no positive target, max W is 0
-        upper = 0.0
-
-    # If P is positive but upper is 0 (e.g. P_adjusted_for_dfv was negative), check if W=0 is valid
-    if upper == 0.0 and P > 0:
-        if simulate_final_balance(P, 0, withdrawal_time, rates_periods, desired_final_value, one_off_events=one_off_events) >= 0:
-            return 0.0 # W=0 is sustainable
-        # else: P is not enough even for W=0 to reach DFV, so need to find a negative W if that's allowed, or stick to 0.
-        # Assuming W must be non-negative.
-
-
-    # Bisection search for W_initial
-    iteration_count = 0
-    max_iterations = 100 # Safety break
-
-    # Loop while the difference between upper and lower is greater than tolerance
-    while (upper - lower) > current_app.config['DEFAULT_TOLERANCE']:
-        iteration_count += 1
-        if iteration_count > max_iterations:
-            break
+    root = brent_root(surplus, lower, upper, f_lower, f_upper, xtol=config.tolerance, rtol=config.relative_tolerance,
+                      ftol=config.tolerance, max_evaluations=config.max_evaluations)
+    return _root_solution(root, surplus.calls, config.tolerance)
 
-        mid_W = (lower + upper) / 2.0
-        if mid_W == lower or mid_W == upper: # Precision limit reached
-            break
 
-        # If simulating with mid_W results in a final balance less than desired,
-        # then mid_W is too high. So, new upper bound is mid_W.
-        if simulate_final_balance(P, mid_W, withdrawal_time, rates_periods, desired_final_value, one_off_events=one_off_events) < 0:
-            upper = mid_W
-        # Otherwise, mid_W is sustainable or more than sustainable.
-        # So, new lower bound is mid_W, try for a higher W.
-        else:
-            lower = mid_W
+def sensitivity_grid(mode, base_value, withdrawal_time, r_values, i_values, T_values, desired_final_value=0.0, one_off_events=None, config=None):
+    """
+    Solve a single-period scenario over a grid of constant annual returns, inflation rates
+    and durations in one vectorized pass.
 
-    # 'lower' should be the highest sustainable W_initial found.
-    # Final check on 'lower' to ensure it's truly valid and non-negative.
-    if lower < 0: return 0.0 # Should not happen if initial lower is 0.0
+    Every grid cell uses the same affine relations as find_required_portfolio and
+    find_max_annual_expense, with their coefficients computed by batch_annual_simulation for
+    all cells at once. Cells where those relations are degenerate (e.g. a -100% return) are
+    solved individually with the scalar solvers, so each cell matches them.
 
-    if simulate_final_balance(P, lower, withdrawal_time, rates_periods, desired_final_value, one_off_events=one_off_events) < -current_app.config['DEFAULT_TOLERANCE']:
-        # If even 'lower' doesn't meet target (within tolerance), means no positive W could be found.
-        return 0.0
+    Args:
+        mode (str): MODE_WITHDRAWAL (base_value is W; solve for the required portfolio) or
+                    MODE_PORTFOLIO (base_value is P; solve for the maximum annual withdrawal).
+        base_value (float): Initial annual withdrawal or initial portfolio, depending on mode.
+        withdrawal_time (str): "start" or "end".
+        r_values (array-like): Annual returns (decimals) along the grid's last axis.
+        i_values (array-like): Annual inflation rates (decimals) along the grid's middle axis.
+        T_values (array-like of int): Durations in years (> 0) along the grid's first axis.
+        desired_final_value (float, optional): Target value. Defaults to 0.0.
+        one_off_events (list of dicts, optional): One-off income/expense events.
+        config (SolverConfig, optional): Solver settings. Defaults to DEFAULT_SOLVER_CONFIG.
+
+    Returns:
+        np.ndarray: Shape (len(T_values), len(i_values), len(r_values)); inf where no portfolio
+                    within config.pv_max_guess_limit suffices.
+    """
+    config = config or DEFAULT_SOLVER_CONFIG
+    if mode not in (MODE_WITHDRAWAL, MODE_PORTFOLIO):
+        raise EngineError(INVALID_MODE, "Invalid mode selected.")
+    r_values = np.asarray(r_values, dtype=np.float64)
+    i_values = np.asarray(i_values, dtype=np.float64)
+    T_values = np.asarray(T_values, dtype=np.int64)
+    if r_values.size == 0 or i_values.size == 0 or T_values.size == 0 or np.any(T_values <= 0):
+        raise EngineError(NON_POSITIVE_DURATION, "Total duration from rates_periods must be greater than zero.")
+
+    grid_shape = (len(T_values), len(i_values), len(r_values))
+    T_grid, i_grid, r_grid = (axis.ravel() for axis in np.meshgrid(T_values, i_values, r_values, indexing='ij'))
+    max_T = int(T_values.max())
+    r_matrix = np.broadcast_to(r_grid[:, np.newaxis], (len(r_grid), max_T))
+    i_matrix = np.broadcast_to(i_grid[:, np.newaxis], (len(i_grid), max_T))
+    cash_flows = np.broadcast_to(compile_one_off_events(one_off_events, max_T), r_matrix.shape)
+
+    def final_balances(PV, W_initial, with_events):
+        _, balances, _ = batch_annual_simulation(PV, W_initial, withdrawal_time, r_matrix, i_matrix, horizons=T_grid,
+                                                 cash_flows=cash_flows if with_events else None)
+        return balances[:, -1]
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        if mode == MODE_WITHDRAWAL:
+            W_initial = base_value
+            if W_initial == 0 and desired_final_value == 0:
+                return np.zeros(grid_shape)
+            growth = (1.0 + r_grid) ** T_grid
+            shortfall_at_zero = final_balances(0.0, W_initial, True) - desired_final_value
+            required_pv = np.where(shortfall_at_zero >= 0, 0.0, -shortfall_at_zero / growth)
+            search_limits = {T: max(config.pv_max_guess_limit,
+                                    _initial_portfolio_upper_bound(W_initial, int(T), desired_final_value))
+                             for T in np.unique(T_values)}
+            search_limit = np.vectorize(search_limits.get, otypes=[np.float64])(T_grid)
+            values = np.where(required_pv > search_limit, np.inf, required_pv)
+            solved = (growth > 0) & np.isfinite(growth) & np.isfinite(shortfall_at_zero)
+        else:
+            P = base_value
+            if P <= 0 and desired_final_value <= 0:
+                return np.zeros(grid_shape)
+            surplus = final_balances(P, 0.0, True) - desired_final_value
+            cost = -final_balances(0.0, 1.0, False)
+            values = np.where(surplus <= 0, 0.0, surplus / cost)
+            solved = (cost > 0) & np.isfinite(cost) & np.isfinite(surplus)
 
-    return lower
+    scalar_solver = find_required_portfolio if mode == MODE_WITHDRAWAL else find_max_annual_expense
+    for cell in np.flatnonzero(~solved):
+        schedule = RateSchedule(np.full(T_grid[cell], r_grid[cell]), np.full(T_grid[cell], i_grid[cell]))
+        values[cell] = scalar_solver(base_value, withdrawal_time, schedule, desired_final_value, one_off_events, config)
+    return values.reshape(grid_shape)
@@ -0,0 +1,107 @@
+import glob
+import hashlib
+import logging
+import os
+import tempfile
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HISTORICAL_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DEFAULT_HISTORICAL_DATASET = 'us_stocks_cpi_annual.csv'
+# Row order of the binary store; each row is one contiguous float64 series indexed by year offset
+HISTORICAL_STORE_SERIES = ('year', 'stock_return', 'inflation')
+HISTORICAL_STORE_DIGEST_LENGTH = 16 # Hex digits of the CSV's SHA-256 in the store's file name
+
+HistoricalDataset = namedtuple('HistoricalDataset', ['years', 'returns', 'inflation'])
+HistoricalDataset.__doc__ = """
+Annual market history: calendar years (int64) with each year's return and inflation as
+decimals (float64). returns and inflation are read-only views of the memory-mapped store
+(or of the parsed CSV when the store has not been built).
+"""
+
+
+def historical_store_path(name=DEFAULT_HISTORICAL_DATASET):
+    """
+    Path of the binary (.npy) store built from the current contents of the CSV dataset name.
+    The file name carries a digest of the CSV, so a store built from an older version of the
+    CSV is never mistaken for this one.
+    """
+    with open(os.path.join(HISTORICAL_DATA_DIR, name), 'rb') as data_file:
+        digest = hashlib.sha256(data_file.read()).hexdigest()[:HISTORICAL_STORE_DIGEST_LENGTH]
+    return os.path.join(HISTORICAL_DATA_DIR, '%s.%s.npy' % (os.path.splitext(name)[0], digest))
+
+
+def _parse_historical_csv(name):
+    """Parse a CSV dataset (columns: year, stock_return, inflation; values in percent) into store layout."""
+    with open(os.path.join(HISTORICAL_DATA_DIR, name)) as data_file:
+        table = np.genfromtxt([line for line in data_file if not line.startswith('#')], delimiter=',', names=True)
+    if len(table) == 0 or np.any(np.diff(table['year']) != 1):
+        raise ValueError("Historical dataset %s must list consecutive years." % name)
+    return np.stack([table['year'], table['stock_return'] / 100.0, table['inflation'] / 100.0])
+
+
+def build_historical_store(name=DEFAULT_HISTORICAL_DATASET):
+    """
+    Convert a bundled CSV dataset into its binary store: a (series, years) float64 .npy file
+    with rows in HISTORICAL_STORE_SERIES order, named after a digest of the CSV (see
+    historical_store_path). The file is written atomically, and stores built from earlier
+    versions of the CSV are then removed; workers that already mapped one keep a consistent view.
+
+    Run at build or deploy time (python -m project.historical_data); requests never write it.
+
+    Returns:
+        str: Path of the written store.
+    """
+    store_path = historical_store_path(name)
+    fd, tmp_path = tempfile.mkstemp(dir=HISTORICAL_DATA_DIR, suffix='.npy.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as store_file:
+            np.save(store_file, _parse_historical_csv(name))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, store_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    stem = glob.escape(os.path.join(HISTORICAL_DATA_DIR, os.path.splitext(name)[0]))
+    for stale_path in glob.glob(stem + '.npy') + glob.glob(stem + '.*.npy'):
+        if stale_path != store_path:
+            os.unlink(stale_path)
+    return store_path
+
+
+@lru_cache(maxsize=None)
+def load_historical_dataset(name=DEFAULT_HISTORICAL_DATASET):
+    """
+    Open a historical dataset from its binary store, memory-mapped read-only.
+
+    The store is mapped on first use and the mapping is reused for the life of the process,
+    so every worker shares the operating system's page cache instead of holding its own
+    parsed copy. If no store has been built from the current CSV (it is missing, or the CSV
+    was edited since), a warning is logged and the CSV is parsed into memory instead (the
+    package directory may be read-only or shared, so requests never write the store).
+
+    Args:
+        name (str): CSV file name inside project/data.
+
+    Returns:
+        HistoricalDataset: Years plus zero-copy return and inflation series.
+    """
+    store_path = historical_store_path(name)
+    if os.path.exists(store_path):
+        store = np.load(store_path, mmap_mode='r')
+    else:
+        logger.warning("No historical store built from the current %s (expected %s); parsing it in memory. "
+                       "Build the store with python -m project.historical_data.", name, store_path)
+        store = _parse_historical_csv(name)
+        store.setflags(write=False)
+    if store.ndim != 2 or store.shape[0] != len(HISTORICAL_STORE_SERIES):
+        raise ValueError("Historical store %s has an unexpected layout." % store_path)
+    return HistoricalDataset(store[0].astype(np.int64), store[1], store[2])
+
+
+if __name__ == '__main__':
+    print(build_historical_store())
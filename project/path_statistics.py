@@ -0,0 +1,181 @@
+import numpy as np
+
+from .constants import MONTE_CARLO_PERCENTILES
+
+SKETCH_RELATIVE_ACCURACY = 0.005 # Each bucket's value is within 0.5% of every balance in it (see percentile_bands)
+SKETCH_MIN_VALUE = 1.0 # Balances with magnitude at or below this are counted as zero
+SKETCH_MAX_VALUE = 1e15 # Larger magnitudes share the top bucket
+
+
+def ruin_years(balances, withdraw_at_start):
+    """
+    First year (1-based) in which each path's balance is negative once that year's
+    withdrawal has been taken; 0 for paths that are never ruined.
+
+    Args:
+        balances (np.ndarray): Year-major balances, shape (years + 1, paths).
+        withdraw_at_start (bool): True for start-of-year withdrawals.
+    """
+    after_withdrawal = balances[:-1] if withdraw_at_start else balances[1:]
+    ruined = after_withdrawal < 0
+    return np.where(ruined.any(axis=0), ruined.argmax(axis=0) + 1, 0)
+
+
+def merge_moments(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+    """
+    Combine per-year (count, mean, sum of squared deviations) from two groups of paths
+    (Chan et al. parallel variance update).
+    """
+    count = count_a + count_b
+    if count == 0:
+        return count, mean_a, m2_a
+    delta = mean_b - mean_a
+    mean = mean_a + delta * (count_b / count)
+    m2 = m2_a + m2_b + np.square(delta) * (count_a * count_b / count)
+    return count, mean, m2
+
+
+class PathStatistics:
+    """
+    Bounded-memory summary of simulated balance paths, built chunk by chunk.
+
+    Tracks success and first-ruin counts, per-year running mean/variance and, optionally,
+    a per-year quantile sketch. The sketch buckets |balance| on a logarithmic scale
+    (separately for positive and negative balances), so quantiles carry a bounded relative
+    error, memory depends only on the number of years, and merging two sketches is an exact
+    addition of counts. Statistics from separate chunks or worker processes can therefore be
+    merged in any grouping with the same result.
+    """
+
+    def __init__(self, total_T, withdraw_at_start, desired_final_value=0.0, track_quantiles=True,
+                 relative_accuracy=SKETCH_RELATIVE_ACCURACY):
+        self.total_T = total_T
+        self.withdraw_at_start = withdraw_at_start
+        self.desired_final_value = desired_final_value
+        self.num_paths = 0
+        self.successes = 0
+        self.ruin_year_counts = np.zeros(total_T, dtype=np.int64)
+        self.balance_mean = np.zeros(total_T + 1, dtype=np.float64)
+        self.balance_m2 = np.zeros(total_T + 1, dtype=np.float64)
+
+        self.track_quantiles = track_quantiles
+        self._log_gamma = np.log1p(2 * relative_accuracy / (1 - relative_accuracy))
+        self._num_buckets = int(np.ceil(np.log(SKETCH_MAX_VALUE / SKETCH_MIN_VALUE) / self._log_gamma))
+        if track_quantiles:
+            self._positive_counts = np.zeros((total_T + 1, self._num_buckets), dtype=np.int64)
+            self._negative_counts = np.zeros((total_T + 1, self._num_buckets), dtype=np.int64)
+            self._zero_counts = np.zeros(total_T + 1, dtype=np.int64)
+
+    def update(self, balances):
+        """
+        Add a chunk of paths.
+
+        Args:
+            balances (np.ndarray): Year-major balances, shape (total_T + 1, paths).
+        """
+        num_paths = balances.shape[1]
+        if num_paths == 0:
+            return
+        path_ruin_years = ruin_years(balances, self.withdraw_at_start)
+        self.successes += int(np.count_nonzero((path_ruin_years == 0) & (balances[-1] >= self.desired_final_value)))
+        self.ruin_year_counts += np.bincount(path_ruin_years, minlength=self.total_T + 1)[1:]
+
+        chunk_mean = balances.mean(axis=1)
+        chunk_m2 = np.square(balances - chunk_mean[:, np.newaxis]).sum(axis=1)
+        self.num_paths, self.balance_mean, self.balance_m2 = merge_moments(
+            self.num_paths, self.balance_mean, self.balance_m2, num_paths, chunk_mean, chunk_m2)
+
+        if self.track_quantiles:
+            self._add_to_sketch(balances)
+
+    def _add_to_sketch(self, balances):
+        magnitude = np.abs(balances)
+        nonzero = magnitude > SKETCH_MIN_VALUE
+        self._zero_counts += balances.shape[1] - np.count_nonzero(nonzero, axis=1)
+
+        year_offsets = np.broadcast_to((np.arange(self.total_T + 1) * self._num_buckets)[:, np.newaxis], balances.shape)
+        bucket = np.ceil(np.log(magnitude[nonzero] / SKETCH_MIN_VALUE) / self._log_gamma).astype(np.int64) - 1
+        np.clip(bucket, 0, self._num_buckets - 1, out=bucket)
+        flat_index = year_offsets[nonzero] + bucket
+        negative = balances[nonzero] < 0
+        size = (self.total_T + 1) * self._num_buckets
+        self._positive_counts += np.bincount(flat_index[~negative], minlength=size).reshape(self._positive_counts.shape)
+        self._negative_counts += np.bincount(flat_index[negative], minlength=size).reshape(self._negative_counts.shape)
+
+    def merge(self, other):
+        """Fold another PathStatistics (same horizon and settings) into this one."""
+        self.successes += other.successes
+        self.ruin_year_counts += other.ruin_year_counts
+        self.num_paths, self.balance_mean, self.balance_m2 = merge_moments(
+            self.num_paths, self.balance_mean, self.balance_m2, other.num_paths, other.balance_mean, other.balance_m2)
+        if self.track_quantiles:
+            self._positive_counts += other._positive_counts
+            self._negative_counts += other._negative_counts
+            self._zero_counts += other._zero_counts
+        return self
+
+    @property
+    def success_probability(self):
+        return self.successes / self.num_paths if self.num_paths else 0.0
+
+    @property
+    def balance_std(self):
+        return np.sqrt(self.balance_m2 / self.num_paths) if self.num_paths else np.zeros(self.total_T + 1)
+
+    def percentile_bands(self, percentiles=MONTE_CARLO_PERCENTILES):
+        """
+        Approximate per-year balance percentiles from the sketch.
+
+        Uses np.percentile's linear interpolation between the paths ranked just below and above
+        each percentile, with each path's balance replaced by its bucket's value. A band
+        therefore differs from the exact one by at most SKETCH_RELATIVE_ACCURACY times the
+        interpolated magnitude of those two balances, plus SKETCH_MIN_VALUE. That is 0.5% of the
+        exact band unless the two balances lie on opposite sides of zero.
+
+        Returns:
+            np.ndarray: Shape (len(percentiles), total_T + 1).
+        """
+        if not self.track_quantiles:
+            raise ValueError("Quantile tracking is disabled for these statistics.")
+        gamma = np.exp(self._log_gamma)
+        representatives = SKETCH_MIN_VALUE * 2 * gamma ** np.arange(1, self._num_buckets + 1) / (gamma + 1)
+        # Buckets in ascending value order: most negative first, then zero, then positive
+        values = np.concatenate([-representatives[::-1], [0.0], representatives])
+        counts = np.concatenate([self._negative_counts[:, ::-1], self._zero_counts[:, np.newaxis], self._positive_counts], axis=1)
+        cumulative = np.cumsum(counts, axis=1)
+
+        bands = np.empty((len(percentiles), self.total_T + 1), dtype=np.float64)
+        for band_idx, percentile in enumerate(percentiles):
+            rank = percentile / 100.0 * (self.num_paths - 1)
+            lower_rank = np.floor(rank)
+            upper_rank = min(lower_rank + 1, self.num_paths - 1)
+            lower = values[np.argmax(cumulative > lower_rank, axis=1)]
+            upper = values[np.argmax(cumulative > upper_rank, axis=1)]
+            bands[band_idx] = lower + (upper - lower) * (rank - lower_rank)
+        return bands
+
+    def to_result(self, percentiles=MONTE_CARLO_PERCENTILES):
+        """Summary in the same shape as monte_carlo_simulation's result."""
+        result = {
+            'years': np.arange(0, self.total_T + 1),
+            'num_paths': self.num_paths,
+            'success_probability': self.success_probability,
+            'ruin_year_counts': self.ruin_year_counts,
+            'balance_mean': self.balance_mean,
+            'balance_std': self.balance_std,
+            'percentiles': tuple(percentiles),
+        }
+        if self.track_quantiles:
+            result['balance_bands'] = self.percentile_bands(percentiles)
+        return result
+
+
+def aggregate_path_chunks(chunks, total_T, withdraw_at_start, desired_final_value=0.0):
+    """
+    Consume an iterable of (total_T + 1, paths) balance chunks into a PathStatistics,
+    holding at most one chunk in memory at a time.
+    """
+    statistics = PathStatistics(total_T, withdraw_at_start, desired_final_value)
+    for balances in chunks:
+        statistics.update(balances)
+    return statistics
@@ -0,0 +1,83 @@
+"""
+Lightweight Plotly figure specs.
+
+Building go.Figure objects validates every property on every request, and the figures are then
+serialized again. Here the styling of each trace and layout (mode, names, colours, titles,
+hover templates) is validated once through plotly.graph_objects and cached as plain dicts;
+translated strings are part of the cache key, so each locale gets its own entry. A request
+gets a deep copy of the cached dicts with its data arrays swapped in, which yields the same
+figure JSON that the equivalent go.Figure would, without validating the arrays. Callers may
+modify the specs they get; the cached templates are never handed out.
+"""
+import copy
+from functools import lru_cache
+
+import numpy as np
+import plotly.graph_objects as go
+
+from .constants import PLOT_TEMPLATE_CACHE_SIZE
+
+
+def _freeze(value):
+    """Hashable, order-preserving form of nested style dicts and lists."""
+    if isinstance(value, dict):
+        return ('d', tuple((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return ('l', tuple(_freeze(item) for item in value))
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, tuple) and len(value) == 2 and value[0] in ('d', 'l'):
+        kind, items = value
+        return {key: _thaw(item) for key, item in items} if kind == 'd' else [_thaw(item) for item in items]
+    return value
+
+
+def _plain(values):
+    """Data array as the plain list go validators produce: numpy scalars unwrapped, tuples made lists."""
+    if isinstance(values, np.ndarray):
+        return values.tolist()
+    return [_plain(value) if isinstance(value, (list, tuple, np.ndarray)) else value.item() if isinstance(value, np.generic) else value
+            for value in values]
+
+
+@lru_cache(maxsize=PLOT_TEMPLATE_CACHE_SIZE)
+def _trace_template(trace_type, data_keys, frozen_style):
+    placeholders = {key: [] for key in data_keys} # Keeps the data keys where go puts them
+    return getattr(go, trace_type)(**placeholders, **_thaw(frozen_style)).to_plotly_json()
+
+
+@lru_cache(maxsize=PLOT_TEMPLATE_CACHE_SIZE)
+def _layout_template(frozen_layout):
+    return go.Figure().update_layout(**_thaw(frozen_layout)).layout.to_plotly_json()
+
+
+def trace_spec(trace_type, data, **style):
+    """
+    JSON dict of go.<trace_type>(**data, **style), e.g. trace_spec('Scatter', {'x': years, 'y': balances}, mode='lines').
+
+    Args:
+        trace_type (str): Name of a plotly.graph_objects trace class.
+        data (dict): Data arrays (x, y, customdata, ...), swapped in without validation.
+        **style: Everything else, validated once per distinct value.
+    """
+    spec = copy.deepcopy(_trace_template(trace_type, tuple(data), _freeze(style)))
+    for key, values in data.items():
+        spec[key] = _plain(values)
+    return spec
+
+
+def layout_spec(**layout):
+    """JSON dict of go.Figure().update_layout(**layout).layout, including the default template."""
+    return copy.deepcopy(_layout_template(_freeze(layout)))
+
+
+def figure_spec(traces, **layout):
+    """{'data': traces, 'layout': layout_spec(**layout)}, the dict form of a go.Figure."""
+    return {'data': list(traces), 'layout': layout_spec(**layout)}
+
+
+def with_layout_template(spec):
+    """A template-less {'data', 'layout'} spec with its layout completed as go.Figure would, for pyo.plot(..., validate=False)."""
+    return {'data': spec['data'], 'layout': layout_spec(**spec['layout'])}
@@ -0,0 +1,281 @@
+"""
+Bounded in-process memoisation of solver and simulation results.
+
+Results are keyed by a canonical digest of the compiled scenario (amount, withdrawal timing,
+per-year rate schedule, per-year one-off cash flows, desired final value and solver settings),
+so equivalent inputs hit the same entry however their rate periods or events were written.
+The digest is stable across processes, so a ResultCache can also consult a shared backend
+(see project/shared_cache.py) that every worker and replica reads and fills.
+
+A miss is computed from per-year simulation checkpoints (see CheckpointStore): a scenario that
+differs from a recent one only from some year onwards resumes from that year's state.
+"""
+import hashlib
+import logging
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .constants import RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS, SIMULATION_CHECKPOINT_ENTRIES, SOLVER_CONVERGED
+from .shared_cache import SOLVER_CODEC, SIMULATION_CODEC, open_shared_backend
+from .financial_calcs import (RateSchedule, SolverConfig, DEFAULT_SOLVER_CONFIG, compile_rate_schedule, compile_one_off_events,
+                              first_changed_year, build_simulation_checkpoints, simulate_from_checkpoints,
+                              solve_required_portfolio, solve_max_annual_expense)
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a per-entry time-to-live.
+
+    Counters: hits, misses, evictions (entries dropped to stay within max_entries),
+    expirations (entries found past their time-to-live) and shared_hits (local misses served
+    by the shared backend).
+
+    Args:
+        shared: Optional cross-process backend with get(key) and set(key, value, ttl) on bytes.
+            get_or_compute consults it on a local miss for results that have a codec.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_MAX_ENTRIES, ttl=RESULT_CACHE_TTL_SECONDS, clock=time.monotonic, shared=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.shared_hits = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute, codec=None, store_if=None):
+        """
+        Return the cached value for key, computing and storing it on a miss.
+
+        With a codec (see shared_cache.ResultCodec) a local miss is first looked up in the
+        shared backend, and newly computed values are written to it. A shared entry that does
+        not decode is logged and treated as a miss, and the recomputed value replaces it. If
+        store_if is given, computed values for which it returns False are returned without
+        being stored.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        shared = self.shared if codec is not None else None
+        blob = shared.get(key) if shared is not None else None
+        if blob is not None:
+            try:
+                value = codec.decode(blob)
+            except ValueError as e:
+                logger.warning("Ignoring undecodable shared cache entry: %s", e)
+                blob = None
+            else:
+                with self._lock:
+                    self.shared_hits += 1
+        if blob is None:
+            value = compute()
+            if store_if is not None and not store_if(value):
+                return value
+            if shared is not None:
+                shared.set(key, codec.encode(value), self.ttl)
+        self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = self.expirations = self.shared_hits = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions, 'expirations': self.expirations,
+                    'shared_hits': self.shared_hits, 'shared_backend': repr(self.shared) if self.shared else None}
+
+
+class CheckpointStore:
+    """
+    Thread-safe store of recently built SimulationCheckpoints, most recently used first.
+
+    checkpoints() starts each build from the stored entry sharing the longest run of leading
+    years with the requested scenario, so only the years from the first change onwards are
+    recomputed. Counters: builds (from year 0), resumes (from a later year), reuses (scenario
+    unchanged) and recomputed_years.
+    """
+
+    def __init__(self, max_entries=SIMULATION_CHECKPOINT_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = []
+        self._lock = threading.Lock()
+        self.builds = self.resumes = self.reuses = self.recomputed_years = 0
+
+    def checkpoints(self, withdrawal_time, rates_periods, one_off_events=None):
+        """SimulationCheckpoints for the scenario (see build_simulation_checkpoints for arguments)."""
+        schedule = compile_rate_schedule(rates_periods)
+        cash_flows = compile_one_off_events(one_off_events, schedule.total_T)
+        with self._lock:
+            candidates = list(self._entries)
+        reusable = [(first_changed_year(entry, withdrawal_time, schedule, cash_flows), entry) for entry in candidates]
+        years, previous = max(reusable, key=lambda item: item[0], default=(0, None))
+        checkpoints = build_simulation_checkpoints(withdrawal_time, schedule, cash_flows, previous if years else None)
+        with self._lock:
+            if checkpoints is previous:
+                self.reuses += 1
+            else:
+                self.resumes += checkpoints.resumed_from > 0
+                self.builds += checkpoints.resumed_from == 0
+                self.recomputed_years += schedule.total_T - checkpoints.resumed_from
+            self._entries = [checkpoints] + [entry for entry in self._entries if entry is not checkpoints][:self.max_entries - 1]
+        return checkpoints
+
+    def clear(self):
+        with self._lock:
+            self._entries = []
+            self.builds = self.resumes = self.reuses = self.recomputed_years = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries, 'builds': self.builds,
+                    'resumes': self.resumes, 'reuses': self.reuses, 'recomputed_years': self.recomputed_years}
+
+
+_MISSING = object()
+RESULT_CACHE = ResultCache()
+SIMULATION_CHECKPOINTS = CheckpointStore()
+
+
+def configure_shared_cache(url, cache=RESULT_CACHE):
+    """
+    Attach the shared backend described by url to cache, or detach it when url is empty.
+
+    Raises:
+        ValueError: For an unsupported or malformed URL.
+    """
+    cache.shared = open_shared_backend(url) if url else None
+    return cache.shared
+
+
+def scenario_key(kind, *parts):
+    """
+    Canonical digest of a computation and its inputs. Supports str, int, float, None,
+    np.ndarray, RateSchedule and SolverConfig parts.
+
+    Returns:
+        bytes: 16-byte BLAKE2b digest, stable across processes.
+    """
+    digest = hashlib.blake2b(kind.encode(), digest_size=16)
+    for part in parts:
+        if isinstance(part, RateSchedule):
+            for values in (part.r, part.i, part.vol):
+                digest.update(b'a%d:' % values.size + values.tobytes())
+        elif isinstance(part, SolverConfig):
+            digest.update(b'c%d:' % len(part) + struct.pack('<%dd' % len(part), *part))
+        elif isinstance(part, np.ndarray):
+            values = np.ascontiguousarray(part, dtype=np.float64)
+            digest.update(b'a%d:' % values.size + values.tobytes())
+        elif isinstance(part, str):
+            digest.update(b's%d:' % len(part) + part.encode())
+        elif part is None:
+            digest.update(b'n')
+        else:
+            digest.update(b'f' + struct.pack('<d', float(part)))
+    return digest.digest()
+
+
+def _is_converged(result):
+    return result.status == SOLVER_CONVERGED
+
+
+def _freeze(result):
+    """Mark arrays in a result read-only, since cached results are shared between callers."""
+    for item in (result if isinstance(result, tuple) else (result,)):
+        if isinstance(item, np.ndarray):
+            item.setflags(write=False)
+    return result
+
+
+def _solver_checkpoints(checkpoint_store, withdrawal_time, schedule, cash_flows):
+    """Checkpoints for a solver, or None for an empty horizon (which the solvers answer directly)."""
+    return checkpoint_store.checkpoints(withdrawal_time, schedule, cash_flows) if schedule.total_T > 0 else None
+
+
+def cached_solve_required_portfolio(W_initial, withdrawal_time, rates_periods, desired_final_value=0.0, one_off_events=None,
+                                    config=None, cache=RESULT_CACHE, checkpoint_store=SIMULATION_CHECKPOINTS):
+    """
+    solve_required_portfolio, memoised in cache (see solve_required_portfolio for arguments).
+    Partial results are not stored.
+    """
+    schedule = compile_rate_schedule(rates_periods)
+    cash_flows = compile_one_off_events(one_off_events, schedule.total_T)
+    config = config or DEFAULT_SOLVER_CONFIG
+    key = scenario_key('solve_required_portfolio', W_initial, withdrawal_time, schedule, cash_flows, desired_final_value, config)
+    return cache.get_or_compute(key, lambda: solve_required_portfolio(
+        W_initial, withdrawal_time, schedule, desired_final_value, cash_flows, config,
+        checkpoints=_solver_checkpoints(checkpoint_store, withdrawal_time, schedule, cash_flows)), SOLVER_CODEC, _is_converged)
+
+
+def cached_find_required_portfolio(W_initial, withdrawal_time, rates_periods, desired_final_value=0.0, one_off_events=None,
+                                   config=None, cache=RESULT_CACHE):
+    """find_required_portfolio, memoised in cache (see find_required_portfolio for arguments)."""
+    return cached_solve_required_portfolio(W_initial, withdrawal_time, rates_periods, desired_final_value, one_off_events,
+                                           config, cache=cache).value
+
+
+def cached_solve_max_annual_expense(P, withdrawal_time, rates_periods, desired_final_value=0.0, one_off_events=None,
+                                    config=None, cache=RESULT_CACHE, checkpoint_store=SIMULATION_CHECKPOINTS):
+    """
+    solve_max_annual_expense, memoised in cache (see solve_max_annual_expense for arguments).
+    Partial results are not stored.
+    """
+    schedule = compile_rate_schedule(rates_periods)
+    cash_flows = compile_one_off_events(one_off_events, schedule.total_T)
+    config = config or DEFAULT_SOLVER_CONFIG
+    key = scenario_key('solve_max_annual_expense', P, withdrawal_time, schedule, cash_flows, desired_final_value, config)
+    return cache.get_or_compute(key, lambda: solve_max_annual_expense(
+        P, withdrawal_time, schedule, desired_final_value, cash_flows, config,
+        checkpoints=_solver_checkpoints(checkpoint_store, withdrawal_time, schedule, cash_flows)), SOLVER_CODEC, _is_converged)
+
+
+def cached_find_max_annual_expense(P, withdrawal_time, rates_periods, desired_final_value=0.0, one_off_events=None,
+                                   config=None, cache=RESULT_CACHE):
+    """find_max_annual_expense, memoised in cache (see find_max_annual_expense for arguments)."""
+    return cached_solve_max_annual_expense(P, withdrawal_time, rates_periods, desired_final_value, one_off_events,
+                                           config, cache=cache).value
+
+
+def cached_annual_simulation(PV, W_initial, withdrawal_time, rates_periods, one_off_events=None, cache=RESULT_CACHE,
+                             checkpoint_store=SIMULATION_CHECKPOINTS):
+    """
+    annual_simulation, memoised in cache (see annual_simulation for arguments) and computed
+    from checkpoint_store on a miss. The returned arrays are read-only because they are shared
+    with later callers.
+    """
+    schedule = compile_rate_schedule(rates_periods)
+    cash_flows = compile_one_off_events(one_off_events, schedule.total_T)
+    key = scenario_key('annual_simulation', PV, W_initial, withdrawal_time, schedule, cash_flows)
+    return cache.get_or_compute(key, lambda: _freeze(simulate_from_checkpoints(
+        checkpoint_store.checkpoints(withdrawal_time, schedule, cash_flows), PV, W_initial)), SIMULATION_CODEC)
@@ -1,7 +1,7 @@
 from flask import Blueprint, current_app, request, jsonify, render_template, Response
 from flask_wtf.csrf import generate_csrf # Re-add this import
 from flask_babel import gettext, get_locale
-from babel.numbers import format_currency
+from babel.numbers import format_currency, format_percent
 import numpy as np
 import plotly.graph_objects as go
 import plotly.offline as pyo
@@ -9,79 +9,198 @@ import io
 import csv
 import datetime
 
-from .financial_calcs import annual_simulation, simulate_final_balance, find_required_portfolio, find_max_annual_expense
-from .constants import MODE_WITHDRAWAL, MODE_PORTFOLIO, TIME_START, TIME_END, MAX_SCENARIOS_COMPARE
+from .financial_calcs import monte_carlo_simulation, historical_backtest, sensitivity_grid, compile_rate_schedule, compile_one_off_events
+from .engine_adapter import solver_config, error_message, solver_notice
+from .currency_format import format_currencies
+from .plot_specs import trace_spec, figure_spec, with_layout_template
+from .result_cache import cached_find_required_portfolio, cached_solve_required_portfolio, cached_solve_max_annual_expense, cached_annual_simulation
+from .constants import MODE_WITHDRAWAL, MODE_PORTFOLIO, TIME_START, TIME_END, MAX_SCENARIOS_COMPARE, MONTE_CARLO_DEFAULT_PATHS, MONTE_CARLO_MAX_PATHS, SENSITIVITY_MAX_AXIS_POINTS, SENSITIVITY_MAX_GRID_CELLS, SOLVER_PARTIAL
+from .constants import ARTIFACT_NUMBERS, ARTIFACT_CHARTS, ARTIFACT_TABLE, UPDATE_ARTIFACTS, TABLE_PAGE_SIZE, TABLE_MAX_PAGE_SIZE
 
 DEFAULT_CURRENCY = 'USD'
 
 project_blueprint = Blueprint('project', __name__)
 
-def generate_html_table(years, balances, withdrawals):
-    if not np.any(years) or not balances or not withdrawals:
-        return "<p>" + gettext("No data available to display in table.") + "</p>"
+def table_columns(years, balances, withdrawals):
+    """
+    The yearly results table as raw numeric columns, rendered (and paginated) by the client.
+
+    Returns:
+        dict: {'year': [...], 'balance': [...], 'withdrawal': [...]}, one entry per simulated year:
+              the year number (from 1), the balance after that year and that year's withdrawal,
+              rounded to cents (None for non-finite values).
+    """
+    total_rows = len(withdrawals)
+    return {'year': (np.asarray(years[:total_rows], dtype=np.int64) + 1).tolist(),
+            'balance': _plot_values(balances[1:total_rows + 1]), 'withdrawal': _plot_values(withdrawals)}
+
+def table_page(table, page, page_size):
+    """
+    Rows (page - 1) * page_size onwards of a table_columns() table, at most page_size of them.
+
+    Returns:
+        dict: The sliced columns plus 'page', 'page_size' and 'total_rows' (of the whole table).
+    """
+    start = (page - 1) * page_size
+    rows = {column: values[start:start + page_size] for column, values in table.items()}
+    rows.update({'page': page, 'page_size': page_size, 'total_rows': len(table['year'])})
+    return rows
+
+PLOT_CONFIG = {'displayModeBar': False, 'responsive': True}
+
+def _plot_values(values):
+    """Values as a JSON-safe list for a plot spec: rounded to cents, with gaps (None) for non-finite entries."""
+    values = np.round(np.asarray(values, dtype=np.float64), 2)
+    if np.all(np.isfinite(values)):
+        return values.tolist()
+    return [value if np.isfinite(value) else None for value in values.tolist()]
+
+def scenario_plot_specs(years, balances, sim_withdrawals, withdrawal_time):
+    """
+    Plotly figure specs (plain dicts) for a scenario's balance and withdrawal charts.
+
+    A spec only holds the x/y arrays, formatted hover labels, trace styling and titles (no
+    layout template), so it serializes compactly for /update, whose client patches its charts
+    with Plotly.react; the result page renders the same specs to HTML (see generate_plots).
+
+    Returns:
+        tuple: (portfolio_spec, withdrawal_spec), each {'data': [trace], 'layout': layout}.
+    """
     locale_str = get_locale().language if get_locale() else 'en_US'
-    header = "<thead><tr><th>" + gettext("Year") + \
-             "</th><th>" + gettext("Portfolio Balance ({currency})").format(currency=DEFAULT_CURRENCY) + \
-             "</th><th>" + gettext("Annual Withdrawal ({currency})").format(currency=DEFAULT_CURRENCY) + \
-             "</th></tr></thead>"
-    body_rows = []
-    for t_idx in range(len(withdrawals)):
-        year_display = int(years[t_idx] + 1)
-        balance_at_year_end_or_start = balances[t_idx+1]
-        withdrawal_for_year = withdrawals[t_idx]
-
-        formatted_balance = format_currency(balance_at_year_end_or_start, DEFAULT_CURRENCY, locale=locale_str)
-        formatted_withdrawal = format_currency(withdrawal_for_year, DEFAULT_CURRENCY, locale=locale_str)
-        body_rows.append(f"<tr><td>{year_display}</td><td>{formatted_balance}</td><td>{formatted_withdrawal}</td></tr>")
-    return f"<table class='data-table'> {header} <tbody>{''.join(body_rows)}</tbody> </table>"
-
-def generate_plots(W, withdrawal_time, mode, rates_periods, P_value=None, desired_final_value=0.0, one_off_events=None):
+    years = np.asarray(years).tolist()
+    portfolio_spec = {
+        'data': [trace_spec(
+            'Scatter', {'x': years, 'y': _plot_values(balances), 'customdata': [[fb] for fb in format_currencies(balances, DEFAULT_CURRENCY, locale_str)]},
+            mode='lines+markers', name=gettext('Portfolio Balance'), hovertemplate=gettext('Year: %{x}<br>Balance: %{customdata[0]}<extra></extra>')
+        )],
+        'layout': {
+            'title': {'text': gettext('Portfolio Balance (Withdrawals at %(withdrawal_time)s)', withdrawal_time=withdrawal_time.capitalize())},
+            'xaxis': {'title': {'text': gettext('Years')}},
+            'yaxis': {'title': {'text': gettext('Portfolio Value ({currency})').format(currency=DEFAULT_CURRENCY)}}
+        }
+    }
+    withdrawal_spec = {
+        'data': [trace_spec(
+            'Scatter', {'x': years[:-1], 'y': _plot_values(sim_withdrawals), 'customdata': [[fw] for fw in format_currencies(sim_withdrawals, DEFAULT_CURRENCY, locale_str)]},
+            mode='lines+markers', name=gettext('Annual Withdrawal'), marker={'color': 'orange'}, uid='unique_withdrawal',
+            hovertemplate=gettext('Year: %{x}<br>Withdrawal: %{customdata[0]}<extra></extra>')
+        )],
+        'layout': {
+            'title': {'text': gettext('Annual Withdrawals')}, 'xaxis': {'title': {'text': gettext('Years')}},
+            'yaxis': {'title': {'text': gettext('Withdrawal ({currency})').format(currency=DEFAULT_CURRENCY)}}
+        }
+    }
+    return portfolio_spec, withdrawal_spec
+
+def generate_plot_specs(W, withdrawal_time, mode, rates_periods, P_value=None, desired_final_value=0.0, one_off_events=None, solutions=None,
+                        artifacts=UPDATE_ARTIFACTS):
+    """
+    Solve the scenario for the given mode and build its plot specs and table.
+    solutions (dict, optional) receives the mode's SolverResult under the mode. artifacts selects what is built
+    besides the solution: with neither ARTIFACT_CHARTS nor ARTIFACT_TABLE the scenario is not
+    simulated at all.
+
+    Returns:
+        tuple: (required_portfolio, calculated_W, portfolio_spec, withdrawal_spec, table, error).
+               Specs and table (see table_columns) are None unless requested. If the scenario
+               cannot be solved, error is a translated message and the specs and table are None.
+    """
     if one_off_events is None:
         one_off_events = []
     if not rates_periods:
-        return 0, 0, "<div>" + gettext("Error: No rate periods provided.") + "</div>", "<div></div>", "<p>" + gettext("Table data error.") + "</p>"
+        return 0, 0, None, None, None, gettext("Error: No rate periods provided.")
+    rates_periods = compile_rate_schedule(rates_periods) # Compiled once for the solver and the simulation
+    one_off_events = compile_one_off_events(one_off_events, rates_periods.total_T)
     if mode == MODE_WITHDRAWAL:
-        required_portfolio = find_required_portfolio(W, withdrawal_time, rates_periods, desired_final_value=desired_final_value, one_off_events=one_off_events)
+        solution = cached_solve_required_portfolio(W, withdrawal_time, rates_periods, desired_final_value=desired_final_value, one_off_events=one_off_events, config=solver_config())
+        if solutions is not None: solutions[mode] = solution
+        required_portfolio = solution.value
         calculated_W = W
+        if required_portfolio == float('inf') and solution.status == SOLVER_PARTIAL:
+            error = gettext("The calculation took too long and was stopped before a suitable portfolio was found. Try a shorter duration or less extreme rates.")
+            return float('inf'), calculated_W, None, None, None, error
         if required_portfolio == float('inf'):
-            error_message = "<div>" + gettext("Cannot find a suitable portfolio. Withdrawals may be too high or periods too long/unfavorable (possibly compounded by one-off events).") + "</div>"
-            return float('inf'), calculated_W, error_message, "<div></div>", "<p>" + gettext("Table data not available due to error.") + "</p>"
+            error = gettext("Cannot find a suitable portfolio. Withdrawals may be too high or periods too long/unfavorable (possibly compounded by one-off events).")
+            return float('inf'), calculated_W, None, None, None, error
     else: # MODE_PORTFOLIO
         required_portfolio = P_value
-        calculated_W = find_max_annual_expense(required_portfolio, withdrawal_time, rates_periods, desired_final_value=desired_final_value, one_off_events=one_off_events)
+        solution = cached_solve_max_annual_expense(required_portfolio, withdrawal_time, rates_periods, desired_final_value=desired_final_value, one_off_events=one_off_events, config=solver_config())
+        if solutions is not None: solutions[mode] = solution
+        calculated_W = solution.value
     if calculated_W is None or (isinstance(calculated_W, float) and (np.isnan(calculated_W) or np.isinf(calculated_W))):
-        error_message = "<div>" + gettext("Error calculating sustainable withdrawal. Inputs might be unrealistic for the given portfolio (possibly compounded by one-off events).") + "</div>"
-        return required_portfolio, 0, error_message, "<div></div>", "<p>" + gettext("Table data not available due to error in withdrawal calculation.") + "</p>"
-    years, balances, sim_withdrawals = annual_simulation(required_portfolio, calculated_W, withdrawal_time, rates_periods, one_off_events=one_off_events)
-    plot_config = {'displayModeBar': False, 'responsive': True}
+        error = gettext("Error calculating sustainable withdrawal. Inputs might be unrealistic for the given portfolio (possibly compounded by one-off events).")
+        return required_portfolio, 0, None, None, None, error
+    if ARTIFACT_CHARTS not in artifacts and ARTIFACT_TABLE not in artifacts:
+        return required_portfolio, calculated_W, None, None, None, None
+    years, balances, sim_withdrawals = cached_annual_simulation(required_portfolio, calculated_W, withdrawal_time, rates_periods, one_off_events=one_off_events)
+    portfolio_spec, withdrawal_spec = scenario_plot_specs(years, balances, sim_withdrawals, withdrawal_time) if ARTIFACT_CHARTS in artifacts else (None, None)
+    table = table_columns(years, balances, sim_withdrawals) if ARTIFACT_TABLE in artifacts else None
+    return required_portfolio, calculated_W, portfolio_spec, withdrawal_spec, table, None
+
+def generate_plots(W, withdrawal_time, mode, rates_periods, P_value=None, desired_final_value=0.0, one_off_events=None, solutions=None):
+    """
+    generate_plot_specs with the plots rendered as HTML divs (an error div in place of the
+    portfolio plot if the scenario cannot be solved), for server-rendered pages.
+
+    Returns:
+        tuple: (required_portfolio, calculated_W, portfolio_plot_html, withdrawal_plot_html, table).
+    """
+    required_portfolio, calculated_W, portfolio_spec, withdrawal_spec, table, error = generate_plot_specs(
+        W, withdrawal_time, mode, rates_periods, P_value, desired_final_value, one_off_events, solutions)
+    if error is not None:
+        return required_portfolio, calculated_W, "<div>" + error + "</div>", "<div></div>", table
+    portfolio_plot = pyo.plot(with_layout_template(portfolio_spec), include_plotlyjs=False, output_type='div', config=PLOT_CONFIG, validate=False)
+    withdrawal_plot = pyo.plot(with_layout_template(withdrawal_spec), include_plotlyjs=False, output_type='div', config=PLOT_CONFIG, validate=False)
+    return required_portfolio, calculated_W, portfolio_plot, withdrawal_plot, table
+
+def generate_fan_chart(years, percentiles, balance_bands):
+    """
+    Render percentile balance bands as a Plotly fan chart: outer percentile pairs are drawn as
+    shaded bands from the outside in, and the middle percentile as a line.
+    """
     locale_str = get_locale().language if get_locale() else 'en_US'
-    fig1 = go.Figure()
-    formatted_balances_hover = [format_currency(b, DEFAULT_CURRENCY, locale=locale_str) for b in balances]
-    fig1.add_trace(go.Scatter(
-        x=years, y=balances, mode='lines+markers', name=gettext('Portfolio Balance'),
-        customdata=[(fb,) for fb in formatted_balances_hover],
-        hovertemplate=gettext('Year: %{x}<br>Balance: %{customdata[0]}<extra></extra>')
-    ))
-    fig1.update_layout(
-        title=gettext('Portfolio Balance (Withdrawals at %(withdrawal_time)s)', withdrawal_time=withdrawal_time.capitalize()),
+    fig = go.Figure()
+    num_bands = len(percentiles)
+    for lower_idx in range(num_bands // 2):
+        upper_idx = num_bands - 1 - lower_idx
+        band_name = gettext('P%(low)s-P%(high)s', low=percentiles[lower_idx], high=percentiles[upper_idx])
+        for band_idx in (lower_idx, upper_idx):
+            formatted_hover = format_currencies(balance_bands[band_idx], DEFAULT_CURRENCY, locale_str)
+            fig.add_trace(go.Scatter(
+                x=years, y=balance_bands[band_idx], mode='lines', line=dict(width=0, color='rgba(31,119,180,0.3)'),
+                fill='tonexty' if band_idx == upper_idx else None, fillcolor='rgba(31,119,180,%.2f)' % (0.15 + 0.15 * lower_idx),
+                name=band_name, legendgroup=band_name, showlegend=band_idx == upper_idx,
+                customdata=[('P%s' % percentiles[band_idx], fb) for fb in formatted_hover],
+                hovertemplate=gettext('Year: %{x}<br>%{customdata[0]}: %{customdata[1]}<extra></extra>')
+            ))
+    if num_bands % 2:
+        median_idx = num_bands // 2
+        formatted_hover = format_currencies(balance_bands[median_idx], DEFAULT_CURRENCY, locale_str)
+        fig.add_trace(go.Scatter(
+            x=years, y=balance_bands[median_idx], mode='lines', name=gettext('P%(p)s', p=percentiles[median_idx]),
+            line=dict(color='rgb(31,119,180)'), customdata=[('P%s' % percentiles[median_idx], fb) for fb in formatted_hover],
+            hovertemplate=gettext('Year: %{x}<br>%{customdata[0]}: %{customdata[1]}<extra></extra>')
+        ))
+    fig.update_layout(
+        title=gettext('Portfolio Balance Range (Monte Carlo)'),
         xaxis_title=gettext('Years'), yaxis_title=gettext('Portfolio Value ({currency})').format(currency=DEFAULT_CURRENCY)
     )
-    portfolio_plot = pyo.plot(fig1, include_plotlyjs=False, output_type='div', config=plot_config)
-    fig2 = go.Figure()
-    formatted_withdrawals_hover = [format_currency(w, DEFAULT_CURRENCY, locale=locale_str) for w in sim_withdrawals]
-    fig2.add_trace(go.Scatter(
-        x=years[:-1], y=sim_withdrawals, mode='lines+markers', name=gettext('Annual Withdrawal'),
-        marker_color='orange', customdata=[(fw,) for fw in formatted_withdrawals_hover],
-        hovertemplate=gettext('Year: %{x}<br>Withdrawal: %{customdata[0]}<extra></extra>'),
-        uid="unique_withdrawal"
+    return pyo.plot(fig, include_plotlyjs=False, output_type='div', config=PLOT_CONFIG)
+
+def generate_backtest_chart(start_years, final_balances):
+    """Render each historical window's final balance as a Plotly bar chart keyed by start year."""
+    locale_str = get_locale().language if get_locale() else 'en_US'
+    formatted_hover = format_currencies(final_balances, DEFAULT_CURRENCY, locale_str)
+    fig = go.Figure(go.Bar(
+        x=start_years, y=final_balances, customdata=formatted_hover,
+        marker_color=['rgb(31,119,180)' if b >= 0 else 'rgb(214,39,40)' for b in final_balances],
+        hovertemplate=gettext('Start year: %{x}<br>Final balance: %{customdata}<extra></extra>')
     ))
-    fig2.update_layout(
-        title=gettext('Annual Withdrawals'), xaxis_title=gettext('Years'),
-        yaxis_title=gettext('Withdrawal ({currency})').format(currency=DEFAULT_CURRENCY)
+    fig.update_layout(
+        title=gettext('Final Balance by Historical Start Year'),
+        xaxis_title=gettext('Start Year'), yaxis_title=gettext('Portfolio Value ({currency})').format(currency=DEFAULT_CURRENCY)
     )
-    withdrawal_plot = pyo.plot(fig2, include_plotlyjs=False, output_type='div', config=plot_config)
-    table_html = generate_html_table(years, balances, sim_withdrawals)
-    return required_portfolio, calculated_W, portfolio_plot, withdrawal_plot, table_html
+    return pyo.plot(fig, include_plotlyjs=False, output_type='div', config=PLOT_CONFIG)
 
 MAX_ONE_OFF_EVENTS_INDEX = 5
 MAX_ONE_OFF_EVENTS_COMPARE = 3
@@ -128,7 +247,7 @@ def index():
                         elif duration < 0: raise ValueError(gettext("Period %(k)s duration cannot be negative.", k=k))
                     except ValueError as e:
                         current_app.logger.error(f"Invalid input for period {k}: {e} - Form data for period: dur='{dur_str}', r='{r_str}', i='{i_str}'")
-                        return render_template('index.html', error=str(e), defaults=form_params_for_result_page, current_year=datetime.datetime.now().year)
+                        return render_template('index.html', error=error_message(e), defaults=form_params_for_result_page, current_year=datetime.datetime.now().year)
             if not rates_periods_data:
                 r_perc_form = float(form_data.get('r', 0)); i_perc_form = float(form_data.get('i', 0)); T_form = int(form_data.get('T', 0))
                 if T_form <= 0: raise ValueError(gettext("Time horizon (T) must be greater than 0 for single period mode."))
@@ -155,25 +274,25 @@ def index():
                         raise ValueError(gettext("Invalid year or amount for one-off event #%(event_num)d.", event_num=k_event))
         except ValueError as e:
             current_app.logger.error(f"Invalid input in index route: {e} - Form data: {form_data}")
-            return render_template('index.html', error=str(e), defaults=form_params_for_result_page, current_year=datetime.datetime.now().year)
+            return render_template('index.html', error=error_message(e), defaults=form_params_for_result_page, current_year=datetime.datetime.now().year)
 
-        calculated_P_output, initial_W_input_for_fire_mode, portfolio_plot_W_mode, withdrawal_plot_W_mode, table_data_W_mode_html = "N/A", W_form, "", "", ""
-        calculated_W_output_for_expense_mode, initial_P_input_for_expense_mode_raw, portfolio_plot_P_mode, withdrawal_plot_P_mode, table_data_P_mode_html = "N/A", P_value_form, "", "", ""
+        calculated_P_output, initial_W_input_for_fire_mode, portfolio_plot_W_mode, withdrawal_plot_W_mode, table_data_W_mode = "N/A", W_form, "", "", None
+        calculated_W_output_for_expense_mode, initial_P_input_for_expense_mode_raw, portfolio_plot_P_mode, withdrawal_plot_P_mode, table_data_P_mode = "N/A", P_value_form, "", "", None
 
         if mode_form == MODE_WITHDRAWAL:
             P_calc_primary, W_actual_primary, p_plot_w, w_plot_w, table_w = generate_plots(W_form, withdrawal_time_form, MODE_WITHDRAWAL, rates_periods_data, None, D_form, one_off_events=one_off_events_data)
             if P_calc_primary == float('inf'):
                 return render_template('index.html', error=gettext("Cannot find a suitable portfolio for the given withdrawal. Inputs may be unrealistic."), defaults=form_params_for_result_page, current_year=datetime.datetime.now().year)
-            calculated_P_output, initial_W_input_for_fire_mode, portfolio_plot_W_mode, withdrawal_plot_W_mode, table_data_W_mode_html = P_calc_primary, W_actual_primary, p_plot_w, w_plot_w, table_w
+            calculated_P_output, initial_W_input_for_fire_mode, portfolio_plot_W_mode, withdrawal_plot_W_mode, table_data_W_mode = P_calc_primary, W_actual_primary, p_plot_w, w_plot_w, table_w
             initial_P_input_for_expense_mode_raw = P_calc_primary
             _, W_calc_secondary, p_plot_p, w_plot_w_secondary, table_p = generate_plots(initial_W_input_for_fire_mode, withdrawal_time_form, MODE_PORTFOLIO, rates_periods_data, initial_P_input_for_expense_mode_raw, D_form, one_off_events=one_off_events_data)
-            calculated_W_output_for_expense_mode, portfolio_plot_P_mode, withdrawal_plot_P_mode, table_data_P_mode_html = W_calc_secondary, p_plot_p, w_plot_w_secondary, table_p
+            calculated_W_output_for_expense_mode, portfolio_plot_P_mode, withdrawal_plot_P_mode, table_data_P_mode = W_calc_secondary, p_plot_p, w_plot_w_secondary, table_p
         elif mode_form == MODE_PORTFOLIO:
             P_actual_primary, W_calc_primary, p_plot_p, w_plot_w, table_p = generate_plots(W_form, withdrawal_time_form, MODE_PORTFOLIO, rates_periods_data, P_value_form, D_form, one_off_events=one_off_events_data)
-            initial_P_input_for_expense_mode_raw, calculated_W_output_for_expense_mode, portfolio_plot_P_mode, withdrawal_plot_P_mode, table_data_P_mode_html = P_actual_primary, W_calc_primary, p_plot_p, w_plot_w, table_p
+            initial_P_input_for_expense_mode_raw, calculated_W_output_for_expense_mode, portfolio_plot_P_mode, withdrawal_plot_P_mode, table_data_P_mode = P_actual_primary, W_calc_primary, p_plot_p, w_plot_w, table_p
             initial_W_input_for_fire_mode = W_calc_primary
             P_calc_secondary, _, p_plot_w_secondary, w_plot_w_secondary, table_w = generate_plots(initial_W_input_for_fire_mode, withdrawal_time_form, MODE_WITHDRAWAL, rates_periods_data, None, D_form, one_off_events=one_off_events_data)
-            calculated_P_output, portfolio_plot_W_mode, withdrawal_plot_W_mode, table_data_W_mode_html = P_calc_secondary, p_plot_w_secondary, w_plot_w_secondary, table_w
+            calculated_P_output, portfolio_plot_W_mode, withdrawal_plot_W_mode, table_data_W_mode = P_calc_secondary, p_plot_w_secondary, w_plot_w_secondary, table_w
 
         primary_result_label = ""
         primary_result_value_formatted = gettext("N/A")
@@ -200,7 +319,7 @@ def index():
             form_params_for_result_page.update({'r_form_val': rates_periods_data[0]['r'] * 100, 'i_form_val': rates_periods_data[0]['i'] * 100, 'T_form_val': rates_periods_data[0]['duration']})
         form_params_for_result_page.update({'D_form_val': D_form, 'withdrawal_time_form_val': withdrawal_time_form, 'initial_mode_from_index': mode_form})
         P_for_js = P_value_form if mode_form == MODE_PORTFOLIO and P_value_form is not None else (calculated_P_output if mode_form == MODE_WITHDRAWAL and isinstance(calculated_P_output, (int, float)) else 0.0)
-        form_params_for_result_page.update({'P_input_raw_for_js': P_for_js, 'TIME_END_const': TIME_END, 'MODE_WITHDRAWAL_const': MODE_WITHDRAWAL})
+        form_params_for_result_page.update({'P_input_raw_for_js': P_for_js, 'TIME_END_const': TIME_END, 'MODE_WITHDRAWAL_const': MODE_WITHDRAWAL, 'MODE_PORTFOLIO_const': MODE_PORTFOLIO, 'TABLE_PAGE_SIZE_const': TABLE_PAGE_SIZE})
 
         one_off_events_for_template = []
         if one_off_events_data:
@@ -217,10 +336,10 @@ def index():
             'primary_result_value_formatted': primary_result_value_formatted,
             'fire_W_input_val': initial_W_input_for_fire_mode,
             'fire_P_calculated_val': format_currency(calculated_P_output, DEFAULT_CURRENCY, locale=locale_str) if isinstance(calculated_P_output, (int, float)) and calculated_P_output != float('inf') else gettext("N/A"),
-            'portfolio_plot_fire': portfolio_plot_W_mode, 'withdrawal_plot_fire': withdrawal_plot_W_mode, 'table_data_fire_html': table_data_W_mode_html,
+            'portfolio_plot_fire': portfolio_plot_W_mode, 'withdrawal_plot_fire': withdrawal_plot_W_mode, 'table_data_fire': table_data_W_mode,
             'expense_P_input_val': initial_P_input_for_expense_mode_template,
             'expense_W_calculated_val': format_currency(calculated_W_output_for_expense_mode, DEFAULT_CURRENCY, locale=locale_str) if isinstance(calculated_W_output_for_expense_mode, (int, float)) and calculated_W_output_for_expense_mode != float('inf') else gettext("N/A"),
-            'portfolio_plot_expense': portfolio_plot_P_mode, 'withdrawal_plot_expense': withdrawal_plot_P_mode, 'table_data_expense_html': table_data_P_mode_html,
+            'portfolio_plot_expense': portfolio_plot_P_mode, 'withdrawal_plot_expense': withdrawal_plot_P_mode, 'table_data_expense': table_data_P_mode,
             'rates_periods_info_json': rates_periods_data,
             'one_off_events_input': one_off_events_for_template
         }
@@ -281,71 +400,257 @@ def index():
         default_form_data['current_year'] = datetime.datetime.now().year
         return render_template('index.html', defaults=default_form_data, current_year=default_form_data.get('current_year'))
 
+def _parse_volatility(vol_str, error_message):
+    """Parse an optional volatility percentage (used by Monte Carlo) into a decimal."""
+    vol_perc = float(vol_str)
+    if not (0 <= vol_perc <= 100): raise ValueError(error_message)
+    return vol_perc / 100
+
+def parse_update_form(form_data):
+    """
+    Parse and validate the scenario fields shared by /update and /monte_carlo.
+    Optional 'period{k}_vol' / 'vol' fields (volatility in %) are added to the rate periods as 'vol'.
+
+    Returns:
+        tuple: (W, D, withdrawal_time, P, rates_periods, one_off_events). Raises ValueError on invalid input.
+    """
+    W_form = float(form_data.get('W', '0')); D_form_str = form_data.get('D', '0.0'); D_form = float(D_form_str) if D_form_str else 0.0
+    withdrawal_time = form_data.get('withdrawal_time', TIME_END); P_value = float(form_data.get('P', '0'))
+    if W_form < 0: raise ValueError(gettext("Annual withdrawal (W) cannot be negative."))
+    if D_form < 0: raise ValueError(gettext("Desired final portfolio value (D) cannot be negative."))
+    if P_value < 0: raise ValueError(gettext("Initial Portfolio (P) must be >= 0."))
+
+    rates_periods_data = []
+    for k in range(1, 4):
+        dur_str, r_str, i_str = form_data.get(f'period{k}_duration'), form_data.get(f'period{k}_r'), form_data.get(f'period{k}_i')
+        if dur_str and r_str and i_str:
+            try:
+                duration, r_perc, i_perc = int(dur_str), float(r_str), float(i_str)
+                if duration > 0:
+                    if not (-50 <= r_perc <= 100): raise ValueError(gettext("Period %(k)s annual return (r) must be between -50% and 100%.", k=k))
+                    if not (-50 <= i_perc <= 100): raise ValueError(gettext("Period %(k)s inflation rate (i) must be between -50% and 100%.", k=k))
+                    period = {'duration': duration, 'r': r_perc / 100, 'i': i_perc / 100}
+                    vol_str = form_data.get(f'period{k}_vol')
+                    if vol_str: period['vol'] = _parse_volatility(vol_str, gettext("Period %(k)s volatility must be between 0% and 100%.", k=k))
+                    rates_periods_data.append(period)
+                elif duration < 0: raise ValueError(gettext("Period %(k)s duration cannot be negative.", k=k))
+            except ValueError as e: raise ValueError(gettext("Invalid input for period %(k)s: %(error)s", k=k, error=str(e)))
+    if not rates_periods_data:
+        r_perc_form, i_perc_form, T_form = float(form_data.get('r', '0')), float(form_data.get('i', '0')), int(form_data.get('T', '0'))
+        if T_form <= 0: raise ValueError(gettext("Time horizon (T) must be greater than 0 for single period mode."))
+        if not (-50 <= r_perc_form <= 100): raise ValueError(gettext("Annual return (r) must be between -50% and 100%."))
+        if not (-50 <= i_perc_form <= 100): raise ValueError(gettext("Inflation rate (i) must be between -50% and 100%."))
+        period = {'duration': T_form, 'r': r_perc_form / 100, 'i': i_perc_form / 100}
+        vol_str = form_data.get('vol')
+        if vol_str: period['vol'] = _parse_volatility(vol_str, gettext("Volatility must be between 0% and 100%."))
+        rates_periods_data.append(period)
+
+    one_off_events_data = []
+    for k_event in range(1, MAX_ONE_OFF_EVENTS_INDEX + 1):
+        year_str = form_data.get(f'one_off_{k_event}_year')
+        amount_str = form_data.get(f'one_off_{k_event}_amount')
+        if year_str and amount_str:
+            try:
+                year_val = int(year_str)
+                amount_val = float(amount_str)
+                if year_val <= 0: raise ValueError(gettext("One-off event year must be positive."))
+                one_off_events_data.append({'year': year_val, 'amount': amount_val})
+            except ValueError:
+                raise ValueError(gettext("Invalid year or amount for one-off event #%(event_num)d.", event_num=k_event))
+    return W_form, D_form, withdrawal_time, P_value, rates_periods_data, one_off_events_data
+
+def _parse_choices(value, allowed, error_message):
+    """Comma-separated choices from value, in the order of allowed; all of allowed if value is empty."""
+    chosen = [choice.strip() for choice in (value or '').split(',') if choice.strip()]
+    if any(choice not in allowed for choice in chosen): raise ValueError(error_message)
+    return tuple(choice for choice in allowed if choice in chosen) if chosen else tuple(allowed)
+
+def parse_update_selection(form_data):
+    """
+    Parse the optional 'modes' (MODE_WITHDRAWAL, MODE_PORTFOLIO) and 'artifacts' (see UPDATE_ARTIFACTS)
+    fields of /update, each a comma-separated list that defaults to everything.
+
+    Returns:
+        tuple: (modes, artifacts). Raises ValueError on unknown entries.
+    """
+    modes = _parse_choices(form_data.get('modes'), (MODE_WITHDRAWAL, MODE_PORTFOLIO), gettext("Invalid mode selected."))
+    artifacts = _parse_choices(form_data.get('artifacts'), UPDATE_ARTIFACTS, gettext("Invalid result type requested."))
+    return modes, artifacts
+
 @project_blueprint.route('/update', methods=['POST'])
 def update():
     current_app.logger.info(f"Update route called. Method: {request.method}")
     form_data = request.form
     W_form, D_form, withdrawal_time, P_value, rates_periods_data = 0.0, 0.0, TIME_END, 0.0, []
     try:
-        W_form = float(form_data.get('W', '0')); D_form_str = form_data.get('D', '0.0'); D_form = float(D_form_str) if D_form_str else 0.0
-        withdrawal_time = form_data.get('withdrawal_time', TIME_END); P_value = float(form_data.get('P', '0'))
-        if W_form < 0: raise ValueError(gettext("Annual withdrawal (W) cannot be negative."))
-        if D_form < 0: raise ValueError(gettext("Desired final portfolio value (D) cannot be negative."))
-        if P_value < 0: raise ValueError(gettext("Initial Portfolio (P) must be >= 0."))
-
-        rates_periods_data = []
-        for k in range(1, 4):
-            dur_str, r_str, i_str = form_data.get(f'period{k}_duration'), form_data.get(f'period{k}_r'), form_data.get(f'period{k}_i')
-            if dur_str and r_str and i_str:
-                try:
-                    duration, r_perc, i_perc = int(dur_str), float(r_str), float(i_str)
-                    if duration > 0:
-                        if not (-50 <= r_perc <= 100): raise ValueError(gettext("Period %(k)s annual return (r) must be between -50% and 100%.", k=k))
-                        if not (-50 <= i_perc <= 100): raise ValueError(gettext("Period %(k)s inflation rate (i) must be between -50% and 100%.", k=k))
-                        rates_periods_data.append({'duration': duration, 'r': r_perc / 100, 'i': i_perc / 100})
-                    elif duration < 0: raise ValueError(gettext("Period %(k)s duration cannot be negative.", k=k))
-                except ValueError as e: raise ValueError(gettext("Invalid input for period %(k)s: %(error)s", k=k, error=str(e)))
-        if not rates_periods_data:
-            r_perc_form, i_perc_form, T_form = float(form_data.get('r', '0')), float(form_data.get('i', '0')), int(form_data.get('T', '0'))
-            if T_form <= 0: raise ValueError(gettext("Time horizon (T) must be greater than 0 for single period mode."))
-            if not (-50 <= r_perc_form <= 100): raise ValueError(gettext("Annual return (r) must be between -50% and 100%."))
-            if not (-50 <= i_perc_form <= 100): raise ValueError(gettext("Inflation rate (i) must be between -50% and 100%."))
-            rates_periods_data.append({'duration': T_form, 'r': r_perc_form / 100, 'i': i_perc_form / 100})
-
-        one_off_events_data = []
-        for k_event in range(1, MAX_ONE_OFF_EVENTS_INDEX + 1):
-            year_str = form_data.get(f'one_off_{k_event}_year')
-            amount_str = form_data.get(f'one_off_{k_event}_amount')
-            if year_str and amount_str:
-                try:
-                    year_val = int(year_str)
-                    amount_val = float(amount_str)
-                    if year_val <= 0: raise ValueError(gettext("One-off event year must be positive."))
-                    one_off_events_data.append({'year': year_val, 'amount': amount_val})
-                except ValueError:
-                    raise ValueError(gettext("Invalid year or amount for one-off event #%(event_num)d.", event_num=k_event))
-
+        W_form, D_form, withdrawal_time, P_value, rates_periods_data, one_off_events_data = parse_update_form(form_data)
+        modes, artifacts = parse_update_selection(form_data)
+        rate_schedule = compile_rate_schedule(rates_periods_data) # Shared by both modes
+        one_off_cash_flows = compile_one_off_events(one_off_events_data, rate_schedule.total_T)
     except ValueError as e:
         current_app.logger.error(f"Invalid input (ValueError) in update route: {e} - Form data: {form_data}")
-        return jsonify({'error': gettext('Invalid input: %(error)s', error=str(e))})
+        return jsonify({'error': gettext('Invalid input: %(error)s', error=error_message(e))})
     except Exception as e:
         current_app.logger.error(f"Unexpected error during input processing in update route: {e} - Form data: {form_data}", exc_info=True)
         return jsonify({'error': gettext('An unexpected error occurred while processing inputs.')})
 
-    required_portfolio_W, actual_W_for_mode_W, portfolio_plot_W, withdrawal_plot_W, table_data_W_html = generate_plots(W_form, withdrawal_time, MODE_WITHDRAWAL, rates_periods_data, None, D_form, one_off_events=one_off_events_data)
-    input_P_for_mode_P, calculated_W_for_mode_P, portfolio_plot_P, withdrawal_plot_P, table_data_P_html = generate_plots(W_form, withdrawal_time, MODE_PORTFOLIO, rates_periods_data, P_value, D_form, one_off_events=one_off_events_data)
+    solutions = {}
     locale_str_update = get_locale().language if get_locale() else 'en_US'
+    response = {}
+    for mode in modes: # Both modes share rate_schedule and one_off_cash_flows
+        required_portfolio, calculated_W, portfolio_plot, withdrawal_plot, table, plot_error = generate_plot_specs(
+            W_form, withdrawal_time, mode, rate_schedule, P_value if mode == MODE_PORTFOLIO else None, D_form,
+            one_off_events=one_off_cash_flows, solutions=solutions, artifacts=artifacts)
+        if ARTIFACT_NUMBERS in artifacts:
+            response.update({
+                'fire_number_' + mode: format_currency(required_portfolio, DEFAULT_CURRENCY, locale=locale_str_update) if required_portfolio != float('inf') else gettext("N/A"),
+                'raw_fire_number_' + mode: required_portfolio if required_portfolio != float('inf') else None,
+                'annual_expense_' + mode: format_currency(calculated_W, DEFAULT_CURRENCY, locale=locale_str_update) if calculated_W is not None and calculated_W != float('inf') else gettext("N/A"),
+                'raw_annual_expense_' + mode: calculated_W if calculated_W is not None and calculated_W != float('inf') else None,
+            })
+        if ARTIFACT_CHARTS in artifacts:
+            response.update({'portfolio_plot_' + mode: portfolio_plot, 'withdrawal_plot_' + mode: withdrawal_plot, 'plot_error_' + mode: plot_error})
+        if ARTIFACT_TABLE in artifacts:
+            response['table_data_' + mode] = table
+    response.update({
+        'solver_status': {mode: solutions[mode].status for mode in modes},
+        'solver_notice': solver_notice(solutions)
+    })
+    return jsonify(response)
+
+def parse_table_page(form_data):
+    """
+    Parse the 'mode' (MODE_WITHDRAWAL or MODE_PORTFOLIO), 'page' (from 1) and optional 'page_size'
+    fields of /table_rows.
+
+    Returns:
+        tuple: (mode, page, page_size). Raises ValueError on invalid input.
+    """
+    mode = form_data.get('mode', MODE_WITHDRAWAL)
+    if mode not in (MODE_WITHDRAWAL, MODE_PORTFOLIO): raise ValueError(gettext("Invalid mode selected."))
+    page, page_size = int(form_data.get('page', '1')), int(form_data.get('page_size', TABLE_PAGE_SIZE))
+    if page < 1: raise ValueError(gettext("Page must be at least 1."))
+    if not (1 <= page_size <= TABLE_MAX_PAGE_SIZE): raise ValueError(gettext("Page size must be between 1 and %(max)d.", max=TABLE_MAX_PAGE_SIZE))
+    return mode, page, page_size
+
+@project_blueprint.route('/table_rows', methods=['POST'])
+def table_rows():
+    """
+    One page of a mode's yearly results table (see table_page), for clients that display the
+    table without having fetched all of it. Takes the /update scenario fields plus those of
+    parse_table_page.
+    """
+    form_data = request.form
+    try:
+        W_form, D_form, withdrawal_time, P_value, rates_periods_data, one_off_events_data = parse_update_form(form_data)
+        mode, page, page_size = parse_table_page(form_data)
+    except ValueError as e:
+        current_app.logger.error(f"Invalid input (ValueError) in table_rows route: {e} - Form data: {form_data}")
+        return jsonify({'error': gettext('Invalid input: %(error)s', error=error_message(e))})
+
+    _, _, _, _, table, table_error = generate_plot_specs(
+        W_form, withdrawal_time, mode, rates_periods_data, P_value if mode == MODE_PORTFOLIO else None, D_form,
+        one_off_events=one_off_events_data, artifacts=(ARTIFACT_TABLE,))
+    return jsonify({'mode': mode, 'table': table_page(table, page, page_size) if table is not None else None, 'table_error': table_error})
+
+@project_blueprint.route('/monte_carlo', methods=['POST'])
+def monte_carlo():
+    current_app.logger.info(f"Monte Carlo route called. Method: {request.method}")
+    form_data = request.form
+    try:
+        W_form, D_form, withdrawal_time, P_value, rates_periods_data, one_off_events_data = parse_update_form(form_data)
+        num_paths = int(form_data.get('paths', MONTE_CARLO_DEFAULT_PATHS))
+        if not (1 <= num_paths <= MONTE_CARLO_MAX_PATHS): raise ValueError(gettext("Number of paths must be between 1 and %(max)d.", max=MONTE_CARLO_MAX_PATHS))
+        seed_str = form_data.get('seed')
+        seed = int(seed_str) if seed_str else None
+        if seed is not None and seed < 0: raise ValueError(gettext("Seed cannot be negative."))
+    except ValueError as e:
+        current_app.logger.error(f"Invalid input (ValueError) in monte_carlo route: {e} - Form data: {form_data}")
+        return jsonify({'error': gettext('Invalid input: %(error)s', error=error_message(e))})
+
+    result = monte_carlo_simulation(P_value, W_form, withdrawal_time, rates_periods_data, num_paths, seed=seed,
+                                    one_off_events=one_off_events_data, desired_final_value=D_form)
+    locale_str_mc = get_locale().language if get_locale() else 'en_US'
+    return jsonify({
+        'success_probability': result['success_probability'],
+        'success_probability_display': format_percent(result['success_probability'], locale=locale_str_mc),
+        'num_paths': result['num_paths'],
+        'ruin_year_counts': result['ruin_year_counts'].tolist(),
+        'percentiles': list(result['percentiles']),
+        'balance_bands': result['balance_bands'].tolist(),
+        'fan_chart': generate_fan_chart(result['years'], result['percentiles'], result['balance_bands'])
+    })
+
+@project_blueprint.route('/backtest', methods=['POST'])
+def backtest():
+    current_app.logger.info(f"Backtest route called. Method: {request.method}")
+    form_data = request.form
+    try:
+        W_form, D_form, withdrawal_time, P_value, rates_periods_data, one_off_events_data = parse_update_form(form_data)
+        total_T = sum(p['duration'] for p in rates_periods_data)
+        result = historical_backtest(P_value, W_form, withdrawal_time, total_T,
+                                     one_off_events=one_off_events_data, desired_final_value=D_form)
+    except ValueError as e:
+        current_app.logger.error(f"Invalid input (ValueError) in backtest route: {e} - Form data: {form_data}")
+        return jsonify({'error': gettext('Invalid input: %(error)s', error=error_message(e))})
+
+    locale_str_bt = get_locale().language if get_locale() else 'en_US'
+    worst_window = dict(result['worst_window'])
+    worst_window['final_balance_display'] = format_currency(worst_window['final_balance'], DEFAULT_CURRENCY, locale=locale_str_bt)
+    return jsonify({
+        'success_rate': result['success_rate'],
+        'success_rate_display': format_percent(result['success_rate'], locale=locale_str_bt),
+        'num_windows': len(result['start_years']),
+        'start_years': result['start_years'].tolist(),
+        'final_balances': result['final_balances'].tolist(),
+        'ruin_years': result['ruin_years'].tolist(),
+        'worst_window': worst_window,
+        'backtest_chart': generate_backtest_chart(result['start_years'], result['final_balances'])
+    })
+
+def _parse_grid_axis(form_data, name, default, label):
+    """
+    Read an optional sensitivity axis given as '{name}_min', '{name}_max' and '{name}_steps'.
+    Without a range the axis holds only the base scenario's value.
+    """
+    min_str, max_str = form_data.get(f'{name}_min'), form_data.get(f'{name}_max')
+    if not min_str or not max_str:
+        return np.array([default])
+    axis_min, axis_max, steps = float(min_str), float(max_str), int(form_data.get(f'{name}_steps', '11'))
+    if axis_min > axis_max: raise ValueError(gettext("%(label)s range minimum cannot exceed its maximum.", label=label))
+    if not (1 <= steps <= SENSITIVITY_MAX_AXIS_POINTS): raise ValueError(gettext("%(label)s steps must be between 1 and %(max)d.", label=label, max=SENSITIVITY_MAX_AXIS_POINTS))
+    return np.linspace(axis_min, axis_max, steps)
+
+@project_blueprint.route('/sensitivity', methods=['POST'])
+def sensitivity():
+    current_app.logger.info(f"Sensitivity route called. Method: {request.method}")
+    form_data = request.form
+    try:
+        mode = form_data.get('mode', MODE_WITHDRAWAL)
+        if mode not in (MODE_WITHDRAWAL, MODE_PORTFOLIO): raise ValueError(gettext("Invalid mode selected."))
+        W_form, D_form, withdrawal_time, P_value, _, one_off_events_data = parse_update_form(form_data)
+        r_values = _parse_grid_axis(form_data, 'r', float(form_data.get('r', '0')), gettext("Annual return (r)"))
+        i_values = _parse_grid_axis(form_data, 'i', float(form_data.get('i', '0')), gettext("Inflation rate (i)"))
+        T_values = np.unique(np.round(_parse_grid_axis(form_data, 'T', float(form_data.get('T', '0')), gettext("Time horizon (T)")))).astype(int)
+        if np.any(r_values < -50) or np.any(r_values > 100): raise ValueError(gettext("Annual return (r) must be between -50% and 100%."))
+        if np.any(i_values < -50) or np.any(i_values > 100): raise ValueError(gettext("Inflation rate (i) must be between -50% and 100%."))
+        if np.any(T_values <= 0): raise ValueError(gettext("Time horizon (T) must be greater than 0 for single period mode."))
+        if len(r_values) * len(i_values) * len(T_values) > SENSITIVITY_MAX_GRID_CELLS:
+            raise ValueError(gettext("Sensitivity grid cannot exceed %(max)d cells.", max=SENSITIVITY_MAX_GRID_CELLS))
+        base_value = W_form if mode == MODE_WITHDRAWAL else P_value
+        values = sensitivity_grid(mode, base_value, withdrawal_time, r_values / 100, i_values / 100, T_values,
+                                  desired_final_value=D_form, one_off_events=one_off_events_data, config=solver_config())
+    except ValueError as e:
+        current_app.logger.error(f"Invalid input (ValueError) in sensitivity route: {e} - Form data: {form_data}")
+        return jsonify({'error': gettext('Invalid input: %(error)s', error=error_message(e))})
+
+    # values[t][i][r] is one heatmap per duration (x: r, y: i); JSON has no infinity, so unreachable cells are null
     return jsonify({
-        'fire_number_W': format_currency(required_portfolio_W, DEFAULT_CURRENCY, locale=locale_str_update) if required_portfolio_W != float('inf') else gettext("N/A"),
-        'raw_fire_number_W': required_portfolio_W if required_portfolio_W != float('inf') else None,
-        'annual_expense_W': format_currency(actual_W_for_mode_W, DEFAULT_CURRENCY, locale=locale_str_update) if actual_W_for_mode_W is not None and actual_W_for_mode_W != float('inf') else gettext("N/A"),
-        'raw_annual_expense_W': actual_W_for_mode_W if actual_W_for_mode_W is not None and actual_W_for_mode_W != float('inf') else None,
-        'portfolio_plot_W': portfolio_plot_W, 'withdrawal_plot_W': withdrawal_plot_W, 'table_data_W_html': table_data_W_html,
-        'fire_number_P': format_currency(input_P_for_mode_P, DEFAULT_CURRENCY, locale=locale_str_update) if input_P_for_mode_P != float('inf') else gettext("N/A"),
-        'raw_fire_number_P': input_P_for_mode_P if input_P_for_mode_P != float('inf') else None,
-        'annual_expense_P': format_currency(calculated_W_for_mode_P, DEFAULT_CURRENCY, locale=locale_str_update) if calculated_W_for_mode_P is not None and calculated_W_for_mode_P != float('inf') else gettext("N/A"),
-        'raw_annual_expense_P': calculated_W_for_mode_P if calculated_W_for_mode_P is not None and calculated_W_for_mode_P != float('inf') else None,
-        'portfolio_plot_P': portfolio_plot_P, 'withdrawal_plot_P': withdrawal_plot_P, 'table_data_P_html': table_data_P_html
+        'mode': mode,
+        'r_values': r_values.tolist(),
+        'i_values': i_values.tolist(),
+        'T_values': T_values.tolist(),
+        'values': np.where(np.isfinite(values), values, None).tolist()
     })
 
 @project_blueprint.route('/compare', methods=['GET', 'POST'])
@@ -426,18 +731,20 @@ def compare():
                 current_app.logger.info(f"[CompareDebug] Scenario {n} calc params: W={W_val}, D={D_val}, time={withdrawal_time_val}, rates={scenario_rates_periods}, one_offs={scenario_one_off_events}")
                 scenario_input['rates_periods_data'] = scenario_rates_periods
 
-                portfolio = find_required_portfolio(W_val, withdrawal_time_val, scenario_rates_periods, D_val, one_off_events=scenario_one_off_events)
+                scenario_schedule = compile_rate_schedule(scenario_rates_periods)
+                scenario_cash_flows = compile_one_off_events(scenario_one_off_events, scenario_schedule.total_T)
+                portfolio = cached_find_required_portfolio(W_val, withdrawal_time_val, scenario_schedule, D_val, one_off_events=scenario_cash_flows, config=solver_config())
                 if portfolio == float('inf'):
                     scenario_input.update({'error': gettext("Scenario %(n)s: Cannot find suitable portfolio (inputs unrealistic).", n=n), 'fire_number': gettext("N/A"), 'years_data': [], 'balances_data': [], 'withdrawals_data': []})
                 else:
-                    years, balances, withdrawals = annual_simulation(portfolio, W_val, withdrawal_time_val, scenario_rates_periods, one_off_events=scenario_one_off_events)
-                    scenario_input.update({'fire_number': portfolio, 'years_data': years.tolist(), 'balances_data': balances, 'withdrawals_data': withdrawals})
+                    years, balances, withdrawals = cached_annual_simulation(portfolio, W_val, withdrawal_time_val, scenario_schedule, one_off_events=scenario_cash_flows)
+                    scenario_input.update({'fire_number': portfolio, 'years_data': years.tolist(), 'balances_data': list(balances), 'withdrawals_data': list(withdrawals)})
 
                 scenario_input['fire_number_display'] = format_currency(portfolio, DEFAULT_CURRENCY, locale=(get_locale().language if get_locale() else 'en_US')) if isinstance(portfolio, (int, float)) and portfolio != float('inf') else gettext("N/A")
 
             except ValueError as e:
                 current_app.logger.error(f"[CompareDebug] Invalid input for scenario {n} in compare route: {e} - Scenario Input: {scenario_input}")
-                scenario_input.update({'error': gettext("Scenario %(n)s: %(error)s", n=n, error=str(e)), 'fire_number_display': gettext("N/A"), 'enabled': False})
+                scenario_input.update({'error': gettext("Scenario %(n)s: %(error)s", n=n, error=error_message(e)), 'fire_number_display': gettext("N/A"), 'enabled': False})
             scenarios_data_for_template.append(scenario_input)
 
         plottable_scenarios = [s for s in scenarios_data_for_template if s.get('enabled') and not s.get('error') and 'years_data' in s and s['years_data']]
@@ -445,18 +752,18 @@ def compare():
         if not plottable_scenarios: message = gettext("No valid scenarios to plot. Please check inputs or enable scenarios.")
         else:
             current_app.logger.info(f"[CompareDebug] Plotting {len(plottable_scenarios)} scenarios.")
-            plot_config, locale_str_compare = {'displayModeBar': False, 'responsive': True}, (get_locale().language if get_locale() else 'en_US')
-            fig_balance, fig_withdrawal = go.Figure(), go.Figure()
+            plot_config, locale_str_compare = PLOT_CONFIG, (get_locale().language if get_locale() else 'en_US')
+            balance_traces, withdrawal_traces = [], []
             for sc_data in plottable_scenarios:
-                formatted_balances_compare = [format_currency(b, DEFAULT_CURRENCY, locale=locale_str_compare) for b in sc_data["balances_data"]]
-                formatted_withdrawals_compare = [format_currency(w, DEFAULT_CURRENCY, locale=locale_str_compare) for w in sc_data["withdrawals_data"]]
-                fig_balance.add_trace(go.Scatter(x=sc_data["years_data"], y=sc_data["balances_data"], mode='lines+markers', name=gettext("Scenario %(n)s Balance", n=sc_data['n']), customdata=[(fb,) for fb in formatted_balances_compare], hovertemplate=gettext('Year: %{x}<br>Balance: %{customdata[0]}<extra></extra>')))
+                formatted_balances_compare = format_currencies(sc_data["balances_data"], DEFAULT_CURRENCY, locale_str_compare)
+                formatted_withdrawals_compare = format_currencies(sc_data["withdrawals_data"], DEFAULT_CURRENCY, locale_str_compare)
+                balance_traces.append(trace_spec('Scatter', {'x': sc_data["years_data"], 'y': sc_data["balances_data"], 'customdata': [(fb,) for fb in formatted_balances_compare]}, mode='lines+markers', name=gettext("Scenario %(n)s Balance", n=sc_data['n']), hovertemplate=gettext('Year: %{x}<br>Balance: %{customdata[0]}<extra></extra>')))
                 plot_years_withdrawal = sc_data["years_data"][:-1] if len(sc_data["years_data"]) > 1 else []
-                fig_withdrawal.add_trace(go.Scatter(x=plot_years_withdrawal, y=sc_data["withdrawals_data"], mode='lines+markers', name=gettext("Scenario %(n)s Withdrawal", n=sc_data['n']), customdata=[(fw,) for fw in formatted_withdrawals_compare], uid=f"scenario_{sc_data['n']}_compare_withdrawal", hovertemplate=gettext('Year: %{x}<br>Withdrawal: %{customdata[0]}<extra></extra>')))
-            fig_balance.update_layout(title=gettext("Portfolio Balance Comparison"), xaxis_title=gettext("Years"), yaxis_title=gettext("Portfolio Value ({currency})").format(currency=DEFAULT_CURRENCY))
-            combined_balance_plot_html = pyo.plot(fig_balance, include_plotlyjs=False, output_type='div', config=plot_config)
-            fig_withdrawal.update_layout(title=gettext("Annual Withdrawals Comparison"), xaxis_title=gettext("Years"), yaxis_title=gettext("Withdrawal ({currency})").format(currency=DEFAULT_CURRENCY))
-            combined_withdrawal_plot_html = pyo.plot(fig_withdrawal, include_plotlyjs=False, output_type='div', config=plot_config)
+                withdrawal_traces.append(trace_spec('Scatter', {'x': plot_years_withdrawal, 'y': sc_data["withdrawals_data"], 'customdata': [(fw,) for fw in formatted_withdrawals_compare]}, mode='lines+markers', name=gettext("Scenario %(n)s Withdrawal", n=sc_data['n']), uid=f"scenario_{sc_data['n']}_compare_withdrawal", hovertemplate=gettext('Year: %{x}<br>Withdrawal: %{customdata[0]}<extra></extra>')))
+            fig_balance = figure_spec(balance_traces, title=gettext("Portfolio Balance Comparison"), xaxis_title=gettext("Years"), yaxis_title=gettext("Portfolio Value ({currency})").format(currency=DEFAULT_CURRENCY))
+            combined_balance_plot_html = pyo.plot(fig_balance, include_plotlyjs=False, output_type='div', config=plot_config, validate=False)
+            fig_withdrawal = figure_spec(withdrawal_traces, title=gettext("Annual Withdrawals Comparison"), xaxis_title=gettext("Years"), yaxis_title=gettext("Withdrawal ({currency})").format(currency=DEFAULT_CURRENCY))
+            combined_withdrawal_plot_html = pyo.plot(fig_withdrawal, include_plotlyjs=False, output_type='div', config=plot_config, validate=False)
 
         current_app.logger.info(f"[CompareDebug] scenarios_data_for_template before jsonify (first scenario sample): {scenarios_data_for_template[0] if scenarios_data_for_template else 'empty'}")
         current_app.logger.info(f"[CompareDebug] combined_balance_plot_html length: {len(combined_balance_plot_html) if combined_balance_plot_html else 0}")
@@ -0,0 +1,277 @@
+"""
+Cross-process backends for the result cache.
+
+Every gunicorn worker (and every replica) keeps its own ResultCache; a shared backend lets
+them reuse each other's results. Two backends are provided:
+
+    sqlite:////path/to/results.sqlite3  A local SQLite file. Put it on /dev/shm to keep it in
+                                        shared memory; all workers on the host share it.
+    redis://[:password@]host[:port][/db] Any server speaking the Redis protocol (Redis, Valkey,
+                                        KeyDB or a local stand-in), shared across hosts.
+
+Values are stored as packed little-endian float64 arrays rather than pickles, so entries are
+compact, cheap to decode and safe to read from a server other processes write to. Backend
+failures are logged and treated as misses: the shared cache can only ever make a request
+faster, never make it fail.
+"""
+import logging
+import os
+import socket
+import sqlite3
+import struct
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit, unquote
+
+import numpy as np
+
+from .constants import SHARED_CACHE_TIMEOUT_SECONDS, SHARED_CACHE_PURGE_INTERVAL, SHARED_CACHE_KEY_PREFIX
+from .financial_calcs import SolverResult
+
+logger = logging.getLogger(__name__)
+
+PACKED_FORMAT_VERSION = 1
+_PACKED_HEADER = struct.Struct('<BB')
+
+
+def pack_arrays(*arrays):
+    """
+    Pack one or more 1-D numeric arrays into bytes: a version byte, the array count, each
+    array's length (uint32) and then the values as consecutive little-endian float64.
+    """
+    values = [np.ascontiguousarray(array, dtype='<f8').ravel() for array in arrays]
+    lengths = struct.pack('<%dI' % len(values), *(value.size for value in values))
+    return _PACKED_HEADER.pack(PACKED_FORMAT_VERSION, len(values)) + lengths + b''.join(value.tobytes() for value in values)
+
+
+def unpack_arrays(blob):
+    """
+    Inverse of pack_arrays.
+
+    Returns:
+        list[np.ndarray]: Read-only float64 arrays viewing blob.
+
+    Raises:
+        ValueError: If blob is not a packed array set of this version.
+    """
+    if len(blob) < _PACKED_HEADER.size:
+        raise ValueError("Packed result is truncated.")
+    version, count = _PACKED_HEADER.unpack_from(blob)
+    if version != PACKED_FORMAT_VERSION:
+        raise ValueError("Unsupported packed result version %d." % version)
+    offset = _PACKED_HEADER.size + 4 * count
+    if len(blob) < offset:
+        raise ValueError("Packed result is truncated.")
+    lengths = struct.unpack_from('<%dI' % count, blob, _PACKED_HEADER.size)
+    if len(blob) != offset + 8 * sum(lengths):
+        raise ValueError("Packed result is truncated.")
+    arrays = []
+    for length in lengths:
+        arrays.append(np.frombuffer(blob, dtype='<f8', count=length, offset=offset))
+        offset += 8 * length
+    return arrays
+
+
+ResultCodec = namedtuple('ResultCodec', ['encode', 'decode'])
+ResultCodec.__doc__ = "Pair of functions converting a cached result to and from packed bytes."
+
+
+def _decode_simulation(blob):
+    arrays = unpack_arrays(blob)
+    if len(arrays) != 3:
+        raise ValueError("Packed simulation has %d arrays, expected 3." % len(arrays))
+    years, balances, withdrawals = arrays
+    years = years.astype(np.int64)
+    years.setflags(write=False)
+    return years, balances, withdrawals
+
+
+def _decode_solver_result(blob):
+    arrays = unpack_arrays(blob)
+    if len(arrays) != 1 or arrays[0].size != 1:
+        raise ValueError("Packed solver result has an unexpected shape.")
+    value = float(arrays[0][0])
+    return SolverResult(value, value, value, float('nan'), 0)
+
+
+# A converged solver result's value (the cache does not store partial results); the bracket,
+# slope and evaluation count only describe the solve that produced it and are not shared
+SOLVER_CODEC = ResultCodec(lambda result: pack_arrays([result.value]), _decode_solver_result)
+# annual_simulation's (years, balances, withdrawals)
+SIMULATION_CODEC = ResultCodec(lambda result: pack_arrays(*result), _decode_simulation)
+
+
+class _ProcessLocalConnections(threading.local):
+    """Per-thread connection slot that is discarded in forked children (pre-fork servers)."""
+
+    def __init__(self):
+        self.pid = None
+        self.connection = None
+
+
+class SQLiteCacheBackend:
+    """
+    Shared cache in a SQLite database file, for workers on one host.
+
+    Each thread of each process opens its own connection; the database runs in WAL mode so
+    readers never block the writer. Expired rows are purged every SHARED_CACHE_PURGE_INTERVAL
+    writes.
+    """
+
+    def __init__(self, path, timeout=SHARED_CACHE_TIMEOUT_SECONDS, clock=time.time):
+        self.path = path
+        self.timeout = timeout
+        self._clock = clock
+        self._local = _ProcessLocalConnections()
+        self._writes = 0
+
+    def _connection(self):
+        if self._local.connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, expires_at REAL NOT NULL, value BLOB NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS results_expires_at ON results (expires_at)')
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return self._local.connection
+
+    def get(self, key):
+        """Stored bytes for key, or None if absent, expired or the database is unavailable."""
+        try:
+            row = self._connection().execute(
+                'SELECT value FROM results WHERE key = ? AND expires_at > ?', (key, self._clock())).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Shared result cache read failed (%s): %s", self.path, e)
+            return None
+        return bytes(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        """Store value under key for ttl seconds; failures are logged and ignored."""
+        now = self._clock()
+        try:
+            connection = self._connection()
+            connection.execute('INSERT OR REPLACE INTO results (key, expires_at, value) VALUES (?, ?, ?)', (key, now + ttl, value))
+            self._writes += 1
+            if self._writes % SHARED_CACHE_PURGE_INTERVAL == 0:
+                connection.execute('DELETE FROM results WHERE expires_at <= ?', (now,))
+        except sqlite3.Error as e:
+            logger.warning("Shared result cache write failed (%s): %s", self.path, e)
+
+    def __repr__(self):
+        return 'SQLiteCacheBackend(%r)' % self.path
+
+
+class RedisProtocolError(Exception):
+    """Error reply or malformed response from a Redis-protocol server."""
+
+
+class RedisCacheBackend:
+    """
+    Shared cache on a server speaking the Redis protocol (RESP), for workers on any host.
+
+    Only GET and SET ... PX are used, so any compatible server works. Keys are prefixed with
+    key_prefix so the cache can share a database with other applications. Each thread of each
+    process keeps one connection, reopened after a failure.
+    """
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None, timeout=SHARED_CACHE_TIMEOUT_SECONDS,
+                 key_prefix=SHARED_CACHE_KEY_PREFIX):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self._local = _ProcessLocalConnections()
+
+    def _connection(self):
+        if self._local.connection is None or self._local.pid != os.getpid():
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self._local.connection, self._local.pid = (sock, sock.makefile('rb')), os.getpid()
+            if self.password is not None:
+                self._command(b'AUTH', self.password)
+            if self.db:
+                self._command(b'SELECT', str(self.db))
+        return self._local.connection
+
+    def _disconnect(self):
+        if self._local.connection is not None and self._local.pid == os.getpid():
+            sock, reader = self._local.connection
+            reader.close()
+            sock.close()
+        self._local.connection = None
+
+    def _command(self, *args):
+        sock, reader = self._connection()
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            arg = arg.encode() if isinstance(arg, str) else arg
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        sock.sendall(b''.join(parts))
+        return self._read_reply(reader)
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise RedisProtocolError("Connection closed by server.")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload
+        if kind == b'-':
+            raise RedisProtocolError(payload.decode(errors='replace'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            if len(data) != length + 2:
+                raise RedisProtocolError("Connection closed by server.")
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            return None if length < 0 else [self._read_reply(reader) for _ in range(length)]
+        raise RedisProtocolError("Unexpected reply type %r." % kind)
+
+    def _guarded(self, action, *args):
+        try:
+            return self._command(*args)
+        except (OSError, ValueError, RedisProtocolError) as e:
+            logger.warning("Shared result cache %s failed (%s:%s): %s", action, self.host, self.port, e)
+            self._disconnect()
+            return None
+
+    def get(self, key):
+        """Stored bytes for key, or None if absent, expired or the server is unavailable."""
+        return self._guarded('read', b'GET', self.key_prefix + key)
+
+    def set(self, key, value, ttl):
+        """Store value under key for ttl seconds; failures are logged and ignored."""
+        self._guarded('write', b'SET', self.key_prefix + key, value, b'PX', str(max(1, int(ttl * 1000))))
+
+    def __repr__(self):
+        return 'RedisCacheBackend(%r, %r, db=%r)' % (self.host, self.port, self.db)
+
+
+def open_shared_backend(url):
+    """
+    Create a shared cache backend from a URL (see the module docstring for the schemes).
+
+    Raises:
+        ValueError: For an unsupported scheme or a malformed URL.
+    """
+    parts = urlsplit(url)
+    if parts.scheme == 'sqlite':
+        path = unquote(parts.path)[1:] # sqlite:///relative.db, sqlite:////absolute.db
+        if parts.netloc or not path:
+            raise ValueError("sqlite result cache URL needs a database path, e.g. sqlite:////dev/shm/results.sqlite3")
+        return SQLiteCacheBackend(path)
+    if parts.scheme == 'redis':
+        db = parts.path.strip('/')
+        if db and not db.isdigit():
+            raise ValueError("Redis database in %s must be a number." % url)
+        return RedisCacheBackend(parts.hostname or 'localhost', parts.port or 6379, int(db or 0),
+                                 unquote(parts.password) if parts.password is not None else None)
+    raise ValueError("Unsupported result cache URL scheme '%s'." % parts.scheme)
@@ -1,11 +1,13 @@
 from flask import Blueprint, render_template, redirect, url_for, session, request, flash, current_app
 from project.forms import ExpensesForm, RatesForm, OneOffsForm
-from project.constants import TIME_START, TIME_END
-from project.financial_calcs import annual_simulation, find_required_portfolio
+from project.constants import TIME_START, TIME_END, MODE_WITHDRAWAL, MODE_PORTFOLIO
+from project.financial_calcs import compile_rate_schedule, compile_one_off_events
 import plotly.graph_objects as go
 import sys
 from flask_wtf.csrf import generate_csrf
-from project.financial_calcs import find_max_annual_expense
+from project.engine_adapter import solver_config, solver_notice
+from project.plot_specs import trace_spec, figure_spec
+from project.result_cache import cached_find_required_portfolio, cached_solve_required_portfolio, cached_solve_max_annual_expense, cached_annual_simulation
 from flask import jsonify, Response
 import csv
 import io
@@ -128,13 +130,15 @@ def wizard_calculate_step():
         error_message = None
 
         try:
+            rate_schedule = compile_rate_schedule(rates_periods) # Shared by the solver and the simulation below
+            one_off_cash_flows = compile_one_off_events(one_off_events, rate_schedule.total_T)
             current_app.logger.debug(f"Calling find_required_portfolio with W_initial={W_actual_for_P_calc}, withdrawal_time={withdrawal_time}, desired_final_value={desired_final_value}")
             current_app.logger.debug(f"rates_periods for find_required_portfolio: {rates_periods}")
             current_app.logger.debug(f"one_off_events for find_required_portfolio: {one_off_events}")
-            P_calculated = find_required_portfolio(
+            P_calculated = cached_find_required_portfolio(
                 W_initial=W_actual_for_P_calc, withdrawal_time=withdrawal_time,
-                rates_periods=rates_periods, desired_final_value=desired_final_value,
-                one_off_events=one_off_events
+                rates_periods=rate_schedule, desired_final_value=desired_final_value,
+                one_off_events=one_off_cash_flows, config=solver_config()
             )
             if P_calculated is None or P_calculated == float('inf') or P_calculated < 0:
                 error_message = gettext("Could not calculate a suitable portfolio (FIRE number) for the given expenses and market conditions. Inputs may be unrealistic (e.g., expenses too high, returns too low for the duration).") # Changed
@@ -144,9 +148,9 @@ def wizard_calculate_step():
                 current_app.logger.debug(f"Calling annual_simulation with PV={P_calculated}, W_initial={W_actual_for_P_calc}, withdrawal_time={withdrawal_time}, desired_final_value={desired_final_value}")
                 current_app.logger.debug(f"rates_periods for annual_simulation: {rates_periods}")
                 current_app.logger.debug(f"one_off_events for annual_simulation: {one_off_events}")
-                sim_years, sim_balances, sim_withdrawals = annual_simulation(
+                sim_years, sim_balances, sim_withdrawals = cached_annual_simulation(
                     PV=P_calculated, W_initial=W_actual_for_P_calc, withdrawal_time=withdrawal_time,
-                    rates_periods=rates_periods, one_off_events=one_off_events
+                    rates_periods=rate_schedule, one_off_events=one_off_cash_flows
                 )
                 current_app.logger.debug(f"annual_simulation returned: sim_years (type: {type(sim_years)}, len: {len(sim_years) if sim_years is not None else 'None'}): {str(sim_years)[:200]}")
                 current_app.logger.debug(f"annual_simulation returned: sim_balances (type: {type(sim_balances)}, len: {len(sim_balances) if sim_balances is not None else 'None'}): {str(sim_balances)[:200]}")
@@ -176,38 +180,36 @@ def wizard_calculate_step():
 
         if sim_years is not None and sim_balances is not None and len(sim_years) > 0:
             try:
-                fig_balance = go.Figure()
+                balance_traces = []
                 x_balance_years = list(sim_years)
                 y_balances = list(sim_balances)
-                fig_balance.add_trace(go.Scatter(x=x_balance_years, y=y_balances, mode='lines+markers', name=gettext("Portfolio Balance"), line=dict(color='blue'))) # Changed
+                balance_traces.append(trace_spec('Scatter', {'x': x_balance_years, 'y': y_balances}, mode='lines+markers', name=gettext("Portfolio Balance"), line=dict(color='blue'))) # Changed
                 sim_balances_list = list(sim_balances)
                 for event in one_off_events:
                     if 0 <= event['year'] < len(sim_balances_list):
                         event_y_approx = sim_balances_list[event['year']]
-                        fig_balance.add_trace(go.Scatter(
-                            x=[event['year']], y=[float(event_y_approx)], mode='markers',
+                        balance_traces.append(trace_spec(
+                            'Scatter', {'x': [event['year']], 'y': [float(event_y_approx)]}, mode='markers',
                             marker=dict(size=10, color='red' if event['amount'] < 0 else 'green', symbol='triangle-down' if event['amount'] < 0 else 'triangle-up'),
                             name=f"{gettext('One-off')}: {event['amount']:.0f}" # Changed
                         ))
-                fig_balance.update_layout(title=gettext("Portfolio Balance Over Time"), xaxis_title=gettext("Year"), yaxis_title=gettext("Portfolio Balance"), legend_title_text=gettext("Legend"), autosize=True, margin=dict(l=30, r=20, t=40, b=40, pad=2)) # Changed
-                plot1_spec = {'data': [trace.to_plotly_json() for trace in fig_balance.data], 'layout': fig_balance.layout.to_plotly_json()}
+                plot1_spec = figure_spec(balance_traces, title=gettext("Portfolio Balance Over Time"), xaxis_title=gettext("Year"), yaxis_title=gettext("Portfolio Balance"), legend_title_text=gettext("Legend"), autosize=True, margin=dict(l=30, r=20, t=40, b=40, pad=2)) # Changed
             except Exception as e_plot1:
                 current_app.logger.error(f"Error generating balance plot spec: {e_plot1}", exc_info=True)
 
         if sim_years is not None and sim_withdrawals is not None:
             try:
-                fig_withdrawals = go.Figure()
+                withdrawal_traces = []
                 total_T_sim = len(sim_withdrawals)
                 x_withdraw_years = list(sim_years[1 : total_T_sim + 1]) if total_T_sim > 0 and len(sim_years) >= (total_T_sim + 1) else []
                 y_withdrawals = list(sim_withdrawals)
                 if total_T_sim > 0 and len(x_withdraw_years) == total_T_sim :
-                    fig_withdrawals.add_trace(go.Scatter(x=x_withdraw_years, y=y_withdrawals, mode='lines+markers', name=gettext("Annual Withdrawal"), line=dict(color='blue'))) # Changed
+                    withdrawal_traces.append(trace_spec('Scatter', {'x': x_withdraw_years, 'y': y_withdrawals}, mode='lines+markers', name=gettext("Annual Withdrawal"), line=dict(color='blue'))) # Changed
                 else:
-                    fig_withdrawals.add_trace(go.Scatter(x=[], y=[], mode='lines+markers', name=gettext("Annual Withdrawal"), line=dict(color='blue'))) # Changed
+                    withdrawal_traces.append(trace_spec('Scatter', {'x': [], 'y': []}, mode='lines+markers', name=gettext("Annual Withdrawal"), line=dict(color='blue'))) # Changed
                     if total_T_sim > 0:
                          current_app.logger.warning(f"Original withdrawal plot data length mismatch: x_data (len {len(x_withdraw_years)}), y_data (len {total_T_sim})")
-                fig_withdrawals.update_layout(title=gettext("Annual Withdrawals Over Time"), xaxis_title=gettext("Year"), yaxis_title=gettext("Annual Withdrawal Amount"), legend_title_text=gettext("Legend"), autosize=True, margin=dict(l=30, r=20, t=40, b=40, pad=2)) # Changed
-                plot2_spec = {'data': [trace.to_plotly_json() for trace in fig_withdrawals.data], 'layout': fig_withdrawals.layout.to_plotly_json()}
+                plot2_spec = figure_spec(withdrawal_traces, title=gettext("Annual Withdrawals Over Time"), xaxis_title=gettext("Year"), yaxis_title=gettext("Annual Withdrawal Amount"), legend_title_text=gettext("Legend"), autosize=True, margin=dict(l=30, r=20, t=40, b=40, pad=2)) # Changed
             except Exception as e_plot2:
                 current_app.logger.error(f"Error generating withdrawal plot spec: {e_plot2}", exc_info=True)
 
@@ -304,6 +306,7 @@ def wizard_recalculate_interactive():
         fixed_desired_final_value_str = data.get('fixed_desired_final_value', '0.0')
         fixed_rates_periods_summary = data.get('rates_periods_summary', [])
         fixed_one_off_events_summary = data.get('one_off_events_summary', [])
+        solutions = {}
 
         r_overall_nominal = float(r_overall_nominal_str)
         i_overall = float(i_overall_str)
@@ -322,33 +325,35 @@ def wizard_recalculate_interactive():
 
         if changed_input == 'W':
             W_to_use = W_input_val
-            P_recalculated = find_required_portfolio(
+            solutions[MODE_WITHDRAWAL] = cached_solve_required_portfolio(
                 W_initial=W_to_use, withdrawal_time=withdrawal_time,
                 rates_periods=rates_periods_for_calc, desired_final_value=desired_final_value_for_calc,
-                one_off_events=one_off_events_for_calc
+                one_off_events=one_off_events_for_calc, config=solver_config()
             )
+            P_recalculated = solutions[MODE_WITHDRAWAL].value
             if P_recalculated is None or P_recalculated == float('inf') or P_recalculated < 0:
                 error_msg_recalc = gettext("Could not calculate a suitable portfolio for the new expenses.") # Changed
                 new_P_calculated = P_input_val; new_W_calculated = W_to_use
             else:
                 new_P_calculated = P_recalculated; new_W_calculated = W_to_use
-                sim_years, sim_balances, sim_withdrawals = annual_simulation(
+                sim_years, sim_balances, sim_withdrawals = cached_annual_simulation(
                     PV=new_P_calculated, W_initial=new_W_calculated, withdrawal_time=withdrawal_time,
                     rates_periods=rates_periods_for_calc, one_off_events=one_off_events_for_calc
                 )
         elif changed_input == 'P':
             P_to_use = P_input_val
-            W_recalculated = find_max_annual_expense(
+            solutions[MODE_PORTFOLIO] = cached_solve_max_annual_expense(
                 P=P_to_use, withdrawal_time=withdrawal_time,
                 rates_periods=rates_periods_for_calc, desired_final_value=desired_final_value_for_calc,
-                one_off_events=one_off_events_for_calc
+                one_off_events=one_off_events_for_calc, config=solver_config()
             )
+            W_recalculated = solutions[MODE_PORTFOLIO].value
             if W_recalculated is None or W_recalculated < 0:
                 error_msg_recalc = gettext("Could not calculate a sustainable withdrawal for the new portfolio.") # Changed
                 new_W_calculated = W_input_val; new_P_calculated = P_to_use
             else:
                 new_W_calculated = W_recalculated; new_P_calculated = P_to_use
-                sim_years, sim_balances, sim_withdrawals = annual_simulation(
+                sim_years, sim_balances, sim_withdrawals = cached_annual_simulation(
                     PV=new_P_calculated, W_initial=new_W_calculated, withdrawal_time=withdrawal_time,
                     rates_periods=rates_periods_for_calc, one_off_events=one_off_events_for_calc
                 )
@@ -356,51 +361,51 @@ def wizard_recalculate_interactive():
             return jsonify({'error': gettext('Invalid changed_input value.')}), 400 # Changed
 
         if error_msg_recalc: # error_msg_recalc is already translated
-            return jsonify({'error': error_msg_recalc, 'new_W': new_W_calculated, 'new_P': new_P_calculated, 'plot1_spec': None, 'plot2_spec': None }), 200
+            return jsonify({'error': error_msg_recalc, 'new_W': new_W_calculated, 'new_P': new_P_calculated, 'plot1_spec': None, 'plot2_spec': None,
+                            'solver_notice': solver_notice(solutions)}), 200
 
         plot1_spec_interactive = None
         plot2_spec_interactive = None
 
         if sim_years is not None and sim_balances is not None and len(sim_years) > 0:
             try:
-                fig_balance = go.Figure()
+                balance_traces = []
                 x_balance_years_ia = list(sim_years)
                 y_balances_ia = list(sim_balances)
-                fig_balance.add_trace(go.Scatter(x=x_balance_years_ia, y=y_balances_ia, mode='lines+markers', name=gettext("Portfolio Balance (What-If)"), line=dict(color='green'))) # Changed
+                balance_traces.append(trace_spec('Scatter', {'x': x_balance_years_ia, 'y': y_balances_ia}, mode='lines+markers', name=gettext("Portfolio Balance (What-If)"), line=dict(color='green'))) # Changed
                 sim_balances_list_ia = list(sim_balances)
                 for event in one_off_events_for_calc:
                     if 0 <= event['year'] < len(sim_balances_list_ia):
                         event_y_approx = sim_balances_list_ia[event['year']]
-                        fig_balance.add_trace(go.Scatter(
-                            x=[event['year']], y=[float(event_y_approx)], mode='markers',
+                        balance_traces.append(trace_spec(
+                            'Scatter', {'x': [event['year']], 'y': [float(event_y_approx)]}, mode='markers',
                             marker=dict(size=10, color='red' if event['amount'] < 0 else 'green', symbol='triangle-down' if event['amount'] < 0 else 'triangle-up'),
                             name=f"{gettext('One-off')}: {event['amount']:.0f}" # Changed
                         ))
-                fig_balance.update_layout(title=gettext("Portfolio Balance Over Time (What-If)"), xaxis_title=gettext("Year"), yaxis_title=gettext("Portfolio Balance"), autosize=True, margin=dict(l=30, r=20, t=40, b=40, pad=2)) # Changed
-                plot1_spec_interactive = {'data': [trace.to_plotly_json() for trace in fig_balance.data], 'layout': fig_balance.layout.to_plotly_json()}
+                plot1_spec_interactive = figure_spec(balance_traces, title=gettext("Portfolio Balance Over Time (What-If)"), xaxis_title=gettext("Year"), yaxis_title=gettext("Portfolio Balance"), autosize=True, margin=dict(l=30, r=20, t=40, b=40, pad=2)) # Changed
             except Exception as e_plot1_ia:
                 current_app.logger.error(f"Error generating interactive balance plot spec: {e_plot1_ia}", exc_info=True)
 
         if sim_years is not None and sim_withdrawals is not None:
             try:
-                fig_withdrawals = go.Figure()
+                withdrawal_traces = []
                 total_T_sim_ia = len(sim_withdrawals)
                 x_withdraw_years_ia = list(sim_years[1 : total_T_sim_ia + 1]) if total_T_sim_ia > 0 and len(sim_years) >= (total_T_sim_ia + 1) else []
                 y_withdrawals_ia = list(sim_withdrawals)
                 if total_T_sim_ia > 0 and len(x_withdraw_years_ia) == total_T_sim_ia:
-                    fig_withdrawals.add_trace(go.Scatter(x=x_withdraw_years_ia, y=y_withdrawals_ia, mode='lines+markers', name=gettext("Annual Withdrawal (What-If)"), line=dict(color='green'))) # Changed
+                    withdrawal_traces.append(trace_spec('Scatter', {'x': x_withdraw_years_ia, 'y': y_withdrawals_ia}, mode='lines+markers', name=gettext("Annual Withdrawal (What-If)"), line=dict(color='green'))) # Changed
                 else:
-                    fig_withdrawals.add_trace(go.Scatter(x=[], y=[], mode='lines+markers', name=gettext("Annual Withdrawal (What-If)"), line=dict(color='green'))) # Changed
+                    withdrawal_traces.append(trace_spec('Scatter', {'x': [], 'y': []}, mode='lines+markers', name=gettext("Annual Withdrawal (What-If)"), line=dict(color='green'))) # Changed
                     if total_T_sim_ia > 0:
                          current_app.logger.warning(f"Interactive withdrawal plot data length mismatch: x_data (len {len(x_withdraw_years_ia)}), y_data (len {total_T_sim_ia})")
-                fig_withdrawals.update_layout(title=gettext("Annual Withdrawals Over Time (What-If)"), xaxis_title=gettext("Year"), yaxis_title=gettext("Annual Withdrawal Amount"), autosize=True, margin=dict(l=30, r=20, t=40, b=40, pad=2)) # Changed
-                plot2_spec_interactive = {'data': [trace.to_plotly_json() for trace in fig_withdrawals.data], 'layout': fig_withdrawals.layout.to_plotly_json()} # Corrected: fig_withdrawals.data
+                plot2_spec_interactive = figure_spec(withdrawal_traces, title=gettext("Annual Withdrawals Over Time (What-If)"), xaxis_title=gettext("Year"), yaxis_title=gettext("Annual Withdrawal Amount"), autosize=True, margin=dict(l=30, r=20, t=40, b=40, pad=2)) # Changed
             except Exception as e_plot2_ia:
                 current_app.logger.error(f"Error generating interactive withdrawal plot spec: {e_plot2_ia}", exc_info=True)
 
         return jsonify({
             'new_W': new_W_calculated, 'new_P': new_P_calculated,
-            'plot1_spec': plot1_spec_interactive, 'plot2_spec': plot2_spec_interactive
+            'plot1_spec': plot1_spec_interactive, 'plot2_spec': plot2_spec_interactive,
+            'solver_notice': solver_notice(solutions)
         })
     except Exception as e:
         current_app.logger.error(f"Error in /recalculate_interactive: {e}", exc_info=True)
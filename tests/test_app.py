@@ -5,13 +5,22 @@ import sys
 import os
 import csv
 import io
+import json
+import plotly.graph_objects as go
+from plotly.utils import PlotlyJSONEncoder
 
 # Add the root directory to sys.path to allow importing 'app'
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app import app # Import the Flask app instance
 from flask_babel import Babel, gettext # Added import
-from project.constants import MODE_WITHDRAWAL, MODE_PORTFOLIO, TIME_END, TIME_START
+from babel.numbers import format_currency
+from project.constants import MODE_WITHDRAWAL, MODE_PORTFOLIO, TIME_END, TIME_START, SOLVER_PARTIAL, SOLVER_TIME_BUDGET_SECONDS
+from project.engine_adapter import solver_config
+from project.financial_calcs import annual_simulation, compile_rate_schedule
+from project.currency_format import currency_formatter, format_currencies
+from project.plot_specs import trace_spec, layout_spec, figure_spec, with_layout_template
+from project.routes import scenario_plot_specs
 
 class TestAppRoutes(unittest.TestCase):
     def setUp(self):
@@ -90,6 +99,12 @@ class TestAppRoutes(unittest.TestCase):
         pass # Commenting out for now
 
     # Tests for /compare route
+    @staticmethod
+    def _engine_calls(mock):
+        """A mock's calls with compiled cash-flow vectors as lists, so they compare with ==."""
+        return [(args, {key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in kwargs.items()})
+                for args, kwargs in mock.call_args_list]
+
     def test_compare_get(self):
         with app.app_context():
             response = self.client.get('/compare')
@@ -102,8 +117,8 @@ class TestAppRoutes(unittest.TestCase):
             # Check for the 'D' field label for scenario 1
             self.assertIn("Desired Final Portfolio Value ($):</label>", response_data)
 
-    @patch('project.routes.annual_simulation')
-    @patch('project.routes.find_required_portfolio')
+    @patch('project.routes.cached_annual_simulation')
+    @patch('project.routes.cached_find_required_portfolio')
     def test_compare_post_valid_scenarios(self, mock_frp, mock_annual_sim):
         with app.app_context():
             mock_frp.side_effect = [100000.0, 120000.0]
@@ -150,16 +165,18 @@ class TestAppRoutes(unittest.TestCase):
             self.assertTrue(json_response['combined_withdrawal'].startswith("<div"))
 
             self.assertEqual(mock_frp.call_count, 2)
-            expected_rates_s1 = [{'duration': 30, 'r': 0.05, 'i': 0.02}]
-            expected_rates_s2 = [{'duration': 25, 'r': 0.06, 'i': 0.025}]
-            mock_frp.assert_any_call(20000.0, TIME_END, expected_rates_s1, desired_final_value=0.0, one_off_events=[])
-            mock_frp.assert_any_call(25000.0, TIME_START, expected_rates_s2, desired_final_value=0.0, one_off_events=[])
+            expected_rates_s1 = compile_rate_schedule([{'duration': 30, 'r': 0.05, 'i': 0.02}])
+            expected_rates_s2 = compile_rate_schedule([{'duration': 25, 'r': 0.06, 'i': 0.025}])
+            frp_calls = self._engine_calls(mock_frp)
+            self.assertIn(((20000.0, TIME_END, expected_rates_s1, 0.0), {'one_off_events': [0.0] * 30, 'config': solver_config()}), frp_calls)
+            self.assertIn(((25000.0, TIME_START, expected_rates_s2, 0.0), {'one_off_events': [0.0] * 25, 'config': solver_config()}), frp_calls)
             self.assertEqual(mock_annual_sim.call_count, 2)
-            mock_annual_sim.assert_any_call(100000.0, 20000.0, TIME_END, expected_rates_s1, one_off_events=[])
-            mock_annual_sim.assert_any_call(120000.0, 25000.0, TIME_START, expected_rates_s2, one_off_events=[])
+            sim_calls = self._engine_calls(mock_annual_sim)
+            self.assertIn(((100000.0, 20000.0, TIME_END, expected_rates_s1), {'one_off_events': [0.0] * 30}), sim_calls)
+            self.assertIn(((120000.0, 25000.0, TIME_START, expected_rates_s2), {'one_off_events': [0.0] * 25}), sim_calls)
 
-    @patch('project.routes.annual_simulation')
-    @patch('project.routes.find_required_portfolio')
+    @patch('project.routes.cached_annual_simulation')
+    @patch('project.routes.cached_find_required_portfolio')
     def test_compare_post_invalid_and_disabled_scenarios(self, mock_frp, mock_annual_sim):
         with app.app_context():
             mock_frp.return_value = 150000.0
@@ -193,13 +210,15 @@ class TestAppRoutes(unittest.TestCase):
             self.assertEqual(scenarios[2].get('fire_number_display', 'N/A'), 'N/A')
 
             self.assertEqual(mock_frp.call_count, 1)
-            expected_rates_s1_invalid = [{'duration': 20, 'r': 0.04, 'i': 0.01}]
-            mock_frp.assert_called_once_with(30000.0, TIME_END, expected_rates_s1_invalid, desired_final_value=0.0, one_off_events=[])
+            expected_rates_s1_invalid = compile_rate_schedule([{'duration': 20, 'r': 0.04, 'i': 0.01}])
+            self.assertEqual(self._engine_calls(mock_frp),
+                             [((30000.0, TIME_END, expected_rates_s1_invalid, 0.0), {'one_off_events': [0.0] * 20, 'config': solver_config()})])
             self.assertEqual(mock_annual_sim.call_count, 1)
-            mock_annual_sim.assert_called_once_with(150000.0, 30000.0, TIME_END, expected_rates_s1_invalid, one_off_events=[])
+            self.assertEqual(self._engine_calls(mock_annual_sim),
+                             [((150000.0, 30000.0, TIME_END, expected_rates_s1_invalid), {'one_off_events': [0.0] * 20})])
 
-    @patch('project.routes.annual_simulation')
-    @patch('project.routes.find_required_portfolio')
+    @patch('project.routes.cached_annual_simulation')
+    @patch('project.routes.cached_find_required_portfolio')
     def test_compare_post_invalid_input_D_negative(self, mock_frp, mock_annual_sim):
         with app.app_context():
             form_data = {
@@ -243,8 +262,8 @@ class TestAppRoutes(unittest.TestCase):
         # See comment in test_update_valid_data
         pass # Commenting out for now
 
-    @patch('project.routes.annual_simulation')
-    @patch('project.routes.find_required_portfolio')
+    @patch('project.routes.cached_annual_simulation')
+    @patch('project.routes.cached_find_required_portfolio')
     def test_compare_post_invalid_input_r_too_high(self, mock_frp, mock_annual_sim):
         with app.app_context():
             form_data = {
@@ -291,7 +310,241 @@ class TestAppRoutes(unittest.TestCase):
     #     pass # Commenting out
 
     # def test_export_csv_invalid_parameter_value(self):
-    //     pass # Commenting out
+    #     pass # Commenting out
+
+class TestMonteCarloRoute(unittest.TestCase):
+    def setUp(self):
+        app.testing = True
+        self.csrf_enabled = app.config.get('WTF_CSRF_ENABLED', True)
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.config['WTF_CSRF_ENABLED'] = self.csrf_enabled
+
+    def test_monte_carlo_valid_data(self):
+        form_data = {'W': '40000', 'r': '7', 'i': '3', 'T': '30', 'vol': '15', 'D': '0.0',
+                     'withdrawal_time': TIME_END, 'P': '1000000', 'paths': '2000', 'seed': '7'}
+        response = self.client.post('/monte_carlo', data=form_data)
+        self.assertEqual(response.status_code, 200)
+        json_response = response.get_json()
+        self.assertNotIn('error', json_response)
+        self.assertTrue(0.0 <= json_response['success_probability'] <= 1.0)
+        self.assertEqual(json_response['num_paths'], 2000)
+        self.assertEqual(len(json_response['ruin_year_counts']), 30)
+        self.assertEqual(len(json_response['balance_bands']), len(json_response['percentiles']))
+        self.assertTrue(json_response['fan_chart'].startswith("<div"))
+        # Same seed gives the same result
+        self.assertEqual(self.client.post('/monte_carlo', data=form_data).get_json()['success_probability'], json_response['success_probability'])
+
+    def test_monte_carlo_invalid_paths(self):
+        form_data = {'W': '40000', 'r': '7', 'i': '3', 'T': '30', 'vol': '15', 'P': '1000000', 'paths': '0'}
+        response = self.client.post('/monte_carlo', data=form_data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('error', response.get_json())
+
+class TestBacktestRoute(unittest.TestCase):
+    def setUp(self):
+        app.testing = True
+        self.csrf_enabled = app.config.get('WTF_CSRF_ENABLED', True)
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.config['WTF_CSRF_ENABLED'] = self.csrf_enabled
+
+    def test_backtest_valid_data(self):
+        form_data = {'W': '40000', 'r': '7', 'i': '3', 'T': '30', 'D': '0.0',
+                     'withdrawal_time': TIME_START, 'P': '1000000'}
+        response = self.client.post('/backtest', data=form_data)
+        self.assertEqual(response.status_code, 200)
+        json_response = response.get_json()
+        self.assertNotIn('error', json_response)
+        self.assertEqual(json_response['num_windows'], len(json_response['final_balances']))
+        self.assertEqual(json_response['start_years'][0], 1928)
+        self.assertTrue(0.0 <= json_response['success_rate'] <= 1.0)
+        self.assertEqual(json_response['worst_window']['final_balance'], min(json_response['final_balances']))
+        self.assertTrue(json_response['backtest_chart'].startswith("<div"))
+
+    def test_backtest_horizon_longer_than_history(self):
+        form_data = {'W': '40000', 'r': '7', 'i': '3', 'T': '500', 'P': '1000000'}
+        response = self.client.post('/backtest', data=form_data)
+        self.assertIn('Duration of 500 years exceeds the', response.get_json()['error'])
+
+class TestUpdateSolverState(unittest.TestCase):
+    def setUp(self):
+        app.testing = True
+        self.csrf_enabled = app.config.get('WTF_CSRF_ENABLED', True)
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.config['WTF_CSRF_ENABLED'] = self.csrf_enabled
+
+    def test_partial_solve_is_reported(self):
+        app.config['SOLVER_TIME_BUDGET_SECONDS'] = 0.0
+        try:
+            response = self.client.post('/update', data={'W': '40123', 'r': '6', 'i': '3', 'T': '35', 'P': '987654'}).get_json()
+        finally:
+            app.config['SOLVER_TIME_BUDGET_SECONDS'] = SOLVER_TIME_BUDGET_SECONDS
+        self.assertEqual(response['solver_status'], {MODE_WITHDRAWAL: SOLVER_PARTIAL, MODE_PORTFOLIO: SOLVER_PARTIAL})
+        self.assertTrue(response['solver_notice'])
+        self.assertIsNone(response['raw_fire_number_W'])
+        self.assertIn('stopped before a suitable portfolio was found', response['plot_error_W'])
+        self.assertIsNone(response['portfolio_plot_W'])
+
+
+class TestUpdatePlotSpecs(unittest.TestCase):
+    def setUp(self):
+        app.testing = True
+        self.csrf_enabled = app.config.get('WTF_CSRF_ENABLED', True)
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.config['WTF_CSRF_ENABLED'] = self.csrf_enabled
+
+    def test_update_returns_plot_specs(self):
+        response = self.client.post('/update', data={'W': '40000', 'r': '7', 'i': '3', 'T': '30', 'P': '1000000', 'withdrawal_time': 'start'})
+        self.assertNotIn('<script', response.get_data(as_text=True))
+        data = response.get_json()
+        for mode in (MODE_WITHDRAWAL, MODE_PORTFOLIO):
+            self.assertIsNone(data['plot_error_' + mode])
+            balance_trace = data['portfolio_plot_' + mode]['data'][0]
+            withdrawal_trace = data['withdrawal_plot_' + mode]['data'][0]
+            self.assertEqual(balance_trace['x'], list(range(31)))
+            self.assertEqual(withdrawal_trace['x'], list(range(30)))
+            self.assertEqual(len(balance_trace['customdata']), 31)
+            self.assertEqual(withdrawal_trace['y'][0], 40000.0 if mode == MODE_WITHDRAWAL else round(data['raw_annual_expense_P'], 2))
+            self.assertEqual(withdrawal_trace['customdata'][0], ['$40,000.00'] if mode == MODE_WITHDRAWAL else [data['annual_expense_P']])
+        self.assertIn('Start', data['portfolio_plot_W']['layout']['title']['text'])
+        self.assertAlmostEqual(data['portfolio_plot_W']['data'][0]['y'][0], data['raw_fire_number_W'] - 40000, delta=0.01)
+
+
+    def test_update_computes_only_requested_modes_and_artifacts(self):
+        form_data = {'W': '40000', 'r': '7', 'i': '3', 'T': '30', 'P': '1000000', 'withdrawal_time': 'end'}
+        full = self.client.post('/update', data=form_data).get_json()
+        with patch('project.routes.cached_solve_required_portfolio') as mock_solver, \
+             patch('project.routes.cached_annual_simulation') as mock_simulation:
+            numbers = self.client.post('/update', data=dict(form_data, modes='P', artifacts='numbers')).get_json()
+        mock_solver.assert_not_called()
+        mock_simulation.assert_not_called()
+        self.assertEqual(numbers['raw_annual_expense_P'], full['raw_annual_expense_P'])
+        self.assertEqual(set(numbers['solver_status']), {MODE_PORTFOLIO})
+        self.assertFalse({'fire_number_W', 'portfolio_plot_P', 'table_data_P'} & set(numbers))
+
+        tables = self.client.post('/update', data=dict(form_data, artifacts='table')).get_json()
+        self.assertEqual(tables['table_data_W'], full['table_data_W'])
+        self.assertNotIn('portfolio_plot_W', tables)
+        self.assertIn('error', self.client.post('/update', data=dict(form_data, modes='W,X')).get_json())
+
+    def test_update_returns_raw_table_columns(self):
+        data = self.client.post('/update', data={'W': '40000', 'r': '7', 'i': '3', 'T': '30', 'P': '1000000', 'withdrawal_time': 'end',
+                                                 'artifacts': 'table'}).get_json()
+        table = data['table_data_W']
+        self.assertEqual(table['year'], list(range(1, 31)))
+        self.assertEqual(table['withdrawal'][:2], [40000.0, 41200.0]) # Grows with 3% inflation
+        self.assertEqual(len(table['balance']), 30)
+        self.assertAlmostEqual(table['balance'][-1], 0.0, delta=0.01)
+        self.assertNotIn('<table', json.dumps(data))
+
+    def test_table_rows_pages(self):
+        form_data = {'W': '40000', 'r': '7', 'i': '3', 'T': '30', 'P': '1000000', 'withdrawal_time': 'end'}
+        full = self.client.post('/update', data=dict(form_data, artifacts='table')).get_json()['table_data_P']
+        data = self.client.post('/table_rows', data=dict(form_data, mode='P', page='2', page_size='20')).get_json()
+        self.assertIsNone(data['table_error'])
+        self.assertEqual(data['table'], {'year': full['year'][20:], 'balance': full['balance'][20:], 'withdrawal': full['withdrawal'][20:],
+                                         'page': 2, 'page_size': 20, 'total_rows': 30})
+        past_end = self.client.post('/table_rows', data=dict(form_data, mode='P', page='3', page_size='20')).get_json()['table']
+        self.assertEqual((past_end['year'], past_end['total_rows']), ([], 30))
+        for invalid in ({'mode': 'X'}, {'page': '0'}, {'page_size': '0'}, {'page': 'two'}):
+            self.assertIn('error', self.client.post('/table_rows', data=dict(form_data, **invalid)).get_json())
+
+    def test_table_rows_reports_unsolvable_scenario(self):
+        data = self.client.post('/table_rows', data={'W': '1000000', 'r': '-50', 'i': '50', 'T': '60', 'mode': 'W'}).get_json()
+        self.assertIsNone(data['table'])
+        self.assertTrue(data['table_error'])
+
+
+class TestPlotSpecs(unittest.TestCase):
+    @staticmethod
+    def _json(figure):
+        return json.dumps(figure, cls=PlotlyJSONEncoder)
+
+    def test_figure_spec_matches_graph_objects(self):
+        years, balances = np.arange(5), np.linspace(1000.0, 0.0, 5)
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=list(years), y=list(balances), mode='lines+markers', name='Balance', line=dict(color='blue'),
+                                 customdata=[('$%d' % b,) for b in balances]))
+        fig.add_trace(go.Scatter(x=[2], y=[500.0], mode='markers', name='One-off', marker=dict(size=10, color='red', symbol='triangle-down')))
+        fig.update_layout(title='Balance', xaxis_title='Year', legend_title_text='Legend', margin=dict(l=30, r=20, t=40, b=40, pad=2))
+        spec = figure_spec([
+            trace_spec('Scatter', {'x': list(years), 'y': list(balances), 'customdata': [('$%d' % b,) for b in balances]},
+                       mode='lines+markers', name='Balance', line=dict(color='blue')),
+            trace_spec('Scatter', {'x': [2], 'y': [500.0]}, mode='markers', name='One-off', marker=dict(size=10, color='red', symbol='triangle-down')),
+        ], title='Balance', xaxis_title='Year', legend_title_text='Legend', margin=dict(l=30, r=20, t=40, b=40, pad=2))
+        self.assertEqual(self._json(spec), self._json(fig.to_plotly_json()))
+        self.assertEqual(spec['layout'], layout_spec(title='Balance', xaxis_title='Year', legend_title_text='Legend', margin=dict(l=30, r=20, t=40, b=40, pad=2)))
+        self.assertNotEqual(spec['layout'], layout_spec(title='Saldo', xaxis_title='Year', legend_title_text='Legend', margin=dict(l=30, r=20, t=40, b=40, pad=2)))
+
+    def test_specs_do_not_share_cached_templates(self):
+        trace = trace_spec('Scatter', {'x': [1], 'y': [2.0]}, mode='markers', line=dict(color='blue'), marker=dict(size=10))
+        trace['line']['color'] = 'red'
+        trace['marker']['size'] = 20
+        layout = layout_spec(title='Balance', margin=dict(l=30))
+        layout['margin']['l'] = 0
+        layout['template']['layout']['font'] = {'size': 99}
+        self.assertEqual(trace_spec('Scatter', {'x': [1], 'y': [2.0]}, mode='markers', line=dict(color='blue'), marker=dict(size=10)),
+                         json.loads(self._json(go.Scatter(x=[1], y=[2.0], mode='markers', line=dict(color='blue'), marker=dict(size=10)).to_plotly_json())))
+        self.assertEqual(layout_spec(title='Balance', margin=dict(l=30)),
+                         json.loads(self._json(go.Figure().update_layout(title='Balance', margin=dict(l=30)).layout.to_plotly_json())))
+
+    def test_result_page_figures_match_validated_figures(self):
+        with app.test_request_context():
+            years, balances, withdrawals = annual_simulation(800000, 40000, TIME_END, [{'duration': 10, 'r': 0.05, 'i': 0.02}])
+            for spec in scenario_plot_specs(years, balances, withdrawals, TIME_END):
+                self.assertEqual(json.loads(self._json(with_layout_template(spec))), json.loads(self._json(go.Figure(spec).to_plotly_json())))
+
+
+class TestCurrencyFormat(unittest.TestCase):
+    def test_matches_babel(self):
+        values = list(np.random.default_rng(0).normal(0, 1e6, 200)) + [0, -0.0, 0.005, 0.015, 1.005, -0.004, 1234567.125, 1e20, np.nan, np.inf, -np.inf]
+        for currency in ('USD', 'EUR', 'JPY'):
+            for locale in ('en', 'es', 'de_CH', 'hi', 'ar'):
+                self.assertEqual(format_currencies(values, currency, locale), [format_currency(v, currency, locale=locale) for v in values])
+
+    def test_formatter_is_shared(self):
+        self.assertIs(currency_formatter('USD', 'es'), currency_formatter('USD', 'es'))
+        self.assertIsNot(currency_formatter('USD', 'es'), currency_formatter('USD', 'en'))
+        self.assertEqual(currency_formatter('USD', 'es')(-1234.5), '-1.234,50\xa0US$')
+
+
+class TestSensitivityRoute(unittest.TestCase):
+    def setUp(self):
+        app.testing = True
+        self.csrf_enabled = app.config.get('WTF_CSRF_ENABLED', True)
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.config['WTF_CSRF_ENABLED'] = self.csrf_enabled
+
+    def test_sensitivity_grid(self):
+        form_data = {'mode': MODE_WITHDRAWAL, 'W': '40000', 'r': '7', 'i': '3', 'T': '30', 'P': '1000000',
+                     'r_min': '2', 'r_max': '8', 'r_steps': '4', 'i_min': '1', 'i_max': '4', 'i_steps': '3'}
+        response = self.client.post('/sensitivity', data=form_data)
+        json_response = response.get_json()
+        self.assertNotIn('error', json_response)
+        self.assertEqual(json_response['T_values'], [30])
+        self.assertEqual(len(json_response['values']), 1)
+        self.assertEqual(len(json_response['values'][0]), 3)
+        self.assertEqual(len(json_response['values'][0][0]), 4)
+        row = json_response['values'][0][0]
+        self.assertTrue(all(a > b for a, b in zip(row, row[1:]))) # Higher returns need a smaller portfolio
+
+    def test_sensitivity_grid_too_many_steps(self):
+        form_data = {'W': '40000', 'r': '7', 'i': '3', 'T': '30', 'P': '1000000', 'r_min': '2', 'r_max': '8', 'r_steps': '1000'}
+        self.assertIn('error', self.client.post('/sensitivity', data=form_data).get_json())
 
 class TestInternationalization(unittest.TestCase):
     def setUp(self):
@@ -324,4 +577,4 @@ class TestInternationalization(unittest.TestCase):
 if __name__ == '__main__':
     unittest.main()
 
-[end of tests/test_app.py]
+# [end of tests/test_app.py]
@@ -10,6 +10,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from app import app # Import the Flask app instance
 from project.forms import ExpensesForm, RatesForm, OneOffsForm, PeriodRateForm, OneOffEntryForm
 from unittest.mock import patch # Added for new tests
+from project.financial_calcs import SolverResult
 
 class TestWizardForms(unittest.TestCase):
     def setUp(self):
@@ -372,8 +373,8 @@ class TestWizardRoutes(unittest.TestCase):
         self.assertIn(b"5", response.data)
 
 
-    @patch('project.wizard_routes.find_required_portfolio')
-    @patch('project.wizard_routes.annual_simulation')
+    @patch('project.wizard_routes.cached_find_required_portfolio')
+    @patch('project.wizard_routes.cached_annual_simulation')
     @patch('project.wizard_routes.to_html')
     def test_wizard_calculate_step_success(self, mock_to_html, mock_annual_simulation, mock_find_portfolio):
         mock_find_portfolio.return_value = 500000.0
@@ -410,7 +411,7 @@ class TestWizardRoutes(unittest.TestCase):
             self.assertNotIn('wizard_rates', sess)
             self.assertNotIn('wizard_one_offs', sess)
 
-    @patch('project.wizard_routes.find_required_portfolio')
+    @patch('project.wizard_routes.cached_find_required_portfolio')
     def test_wizard_calculate_step_portfolio_not_feasible(self, mock_find_portfolio):
         mock_find_portfolio.return_value = float('inf')
 
@@ -441,8 +442,8 @@ class TestWizardRoutes(unittest.TestCase):
         self.assertIn(b"Step 1: Your Expenses", response.data)
         self.assertIn(b"Session data is incomplete. Please restart the wizard.", response.data)
 
-    @patch('project.wizard_routes.find_required_portfolio')
-    @patch('project.wizard_routes.annual_simulation')
+    @patch('project.wizard_routes.cached_find_required_portfolio')
+    @patch('project.wizard_routes.cached_annual_simulation')
     @patch('project.wizard_routes.to_html')
     def test_wizard_calculate_uses_period_rates_over_fallback_duration(self, mock_to_html, mock_annual_simulation, mock_find_portfolio):
         mock_find_portfolio.return_value = 600000.0
@@ -475,11 +476,11 @@ class TestWizardRoutes(unittest.TestCase):
         self.assertIn(b"Total Duration (from periods): 20 years", response.data)
 
 
-    @patch('project.wizard_routes.find_required_portfolio')
-    @patch('project.wizard_routes.annual_simulation')
+    @patch('project.wizard_routes.cached_solve_required_portfolio')
+    @patch('project.wizard_routes.cached_annual_simulation')
     @patch('project.wizard_routes.to_html')
     def test_recalculate_interactive_changed_w_success(self, mock_to_html, mock_annual_simulation, mock_find_portfolio):
-        mock_find_portfolio.return_value = 600000.0  # New P
+        mock_find_portfolio.return_value = SolverResult(600000.0, 600000.0, 600000.0, None, 1)  # New P
         mock_annual_simulation.return_value = ([1,2], [600000, 580000], [25000, 25000]) # Dummy sim data
         mock_to_html.return_value = "<div>Mocked Plot HTML</div>"
 
@@ -510,11 +511,11 @@ class TestWizardRoutes(unittest.TestCase):
         mock_annual_simulation.assert_called_once()
         self.assertEqual(mock_to_html.call_count, 2)
 
-    @patch('project.wizard_routes.find_max_annual_expense')
-    @patch('project.wizard_routes.annual_simulation')
+    @patch('project.wizard_routes.cached_solve_max_annual_expense')
+    @patch('project.wizard_routes.cached_annual_simulation')
     @patch('project.wizard_routes.to_html')
     def test_recalculate_interactive_changed_p_success(self, mock_to_html, mock_annual_simulation, mock_find_max_expense):
-        mock_find_max_expense.return_value = 28000.0  # New W
+        mock_find_max_expense.return_value = SolverResult(28000.0, 28000.0, 28000.0, None, 1)  # New W
         mock_annual_simulation.return_value = ([1,2], [700000, 680000], [28000, 28000])
         mock_to_html.return_value = "<div>Mocked Plot P Change</div>"
 
@@ -573,9 +574,9 @@ class TestWizardRoutes(unittest.TestCase):
         self.assertEqual(json_data['error'], 'An unexpected server error occurred.')
 
 
-    @patch('project.wizard_routes.find_required_portfolio')
+    @patch('project.wizard_routes.cached_solve_required_portfolio')
     def test_recalculate_interactive_changed_w_calculation_fails(self, mock_find_portfolio):
-        mock_find_portfolio.return_value = float('inf')
+        mock_find_portfolio.return_value = SolverResult(float('inf'), float('inf'), float('inf'), None, 1)
 
         payload = {
             'changed_input': 'W',
@@ -596,9 +597,9 @@ class TestWizardRoutes(unittest.TestCase):
         self.assertAlmostEqual(json_data['new_W'], 100000.0)
         self.assertAlmostEqual(json_data['new_P'], 100000.0)
 
-    @patch('project.wizard_routes.find_max_annual_expense')
+    @patch('project.wizard_routes.cached_solve_max_annual_expense')
     def test_recalculate_interactive_changed_p_calculation_fails(self, mock_find_max_expense):
-        mock_find_max_expense.return_value = -1
+        mock_find_max_expense.return_value = SolverResult(-1.0, -1.0, -1.0, None, 1)
 
         payload = {
             'changed_input': 'P',